@@ -0,0 +1,260 @@
+"""Benchmarks for TaskNow task manager operations at scale.
+
+Generates synthetic task stores, times the core TaskManager operations and
+the end-to-end CLI against each storage backend, measures the size and parse
+time of each on-disk format and the memory used per task, and writes the
+results as JSON so runs from different releases can be compared:
+
+    python benchmark.py --sizes 1000 100000 --output results.json
+    python benchmark.py --sizes 1000 100000 --compare results.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from typing import Callable, Dict, List, Optional
+from unittest.mock import patch
+
+import main
+from main import TaskManager
+
+DEFAULT_SIZES = [1_000, 100_000, 1_000_000]
+DEFAULT_BACKENDS = ['json', 'journal', 'sqlite', 'mmap']
+COMPLETED_RATIO = 0.8
+
+def generate_data(size: int) -> Dict:
+    """Return the state of a synthetic store with ``size`` tasks, most of them completed."""
+    completed = int(size * COMPLETED_RATIO)
+    tasks = [
+        {'id': i, 'description': f"Task {i}: synthetic benchmark task", 'completed': i <= completed}
+        for i in range(1, size + 1)
+    ]
+    return {'tasks': tasks, 'current_task_id': completed + 1 if completed < size else None,
+            'next_id': size + 1}
+
+def generate_store(path: str, size: int, backend: str = 'json') -> None:
+    """Write a synthetic store with ``size`` tasks, most of them completed."""
+    with open(path, 'w') as f:
+        json.dump(generate_data(size), f)
+    if backend == 'sqlite':
+        storage = main.open_storage(path, 'sqlite')
+        storage.load()
+        storage.conn.close()
+    elif backend == 'mmap':
+        storage = main.open_storage(path, 'mmap')
+        storage.load()
+        storage.store.close()
+
+def time_operation(func: Callable[[], object], repeat: int,
+                   setup: Optional[Callable[[], object]] = None) -> List[float]:
+    """Return the wall-clock duration of each run in milliseconds."""
+    durations = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+def run_cli(argv: List[str]) -> None:
+    """Run the CLI in-process with its output discarded."""
+    with patch('sys.argv', ['tasknow', *argv]), redirect_stdout(io.StringIO()):
+        main.main()
+
+def benchmark_store(backend: str, size: int, repeat: int) -> List[Dict]:
+    """Benchmark every operation against one generated store."""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'tasks.json')
+        generate_store(path, size, backend)
+        # Without archiving, so every operation runs against a store of the full size
+        with patch('main.TASKS_FILE', path), patch('main.STORAGE_BACKEND', backend), \
+             patch('main.ARCHIVE_THRESHOLD', 0):
+            manager = TaskManager()
+            operations = {
+                'load_tasks': (lambda: manager._load_tasks(), None),
+                'save_tasks': (lambda: manager._save_tasks(compact=True), None),
+                'add_task': (lambda: manager.add_task("Benchmark task"), None),
+                'get_current_task': (manager.get_current_task, None),
+                'complete_current_task': (
+                    lambda: manager.complete_current_task(),
+                    lambda: manager.add_task("Benchmark task")
+                ),
+                'list_tasks': (manager.list_tasks, None),
+                'search_tasks': (lambda: manager.search_tasks("synthetic task 42"), None),
+                'export_tasks': (
+                    lambda: sum(1 for _ in main.format_tasks(manager.iter_all_tasks(), 'ndjson')),
+                    None
+                ),
+                'main_show': (lambda: run_cli([]), None),
+                'main_add': (lambda: run_cli(['add', 'Benchmark', 'task']), None),
+            }
+            with redirect_stdout(io.StringIO()):
+                for name, (func, setup) in operations.items():
+                    durations = time_operation(func, repeat, setup)
+                    results.append({
+                        'backend': backend,
+                        'size': size,
+                        'operation': name,
+                        'repeat': repeat,
+                        'min_ms': round(min(durations), 4),
+                        'median_ms': round(statistics.median(durations), 4),
+                    })
+    return results
+
+def benchmark_formats(size: int, repeat: int) -> List[Dict]:
+    """Measure the file size, encode and parse time of each on-disk format."""
+    data = generate_data(size)
+    results = []
+    for name, serializer in main.SERIALIZERS.items():
+        content = serializer.dumps(data)
+        timings = {
+            'encode': time_operation(lambda: serializer.dumps(data), repeat),
+            'decode': time_operation(lambda: main.decode_snapshot(content), repeat),
+        }
+        for operation, durations in timings.items():
+            results.append({
+                'backend': f"format:{name}",
+                'size': size,
+                'operation': operation,
+                'repeat': repeat,
+                'bytes': len(content),
+                'min_ms': round(min(durations), 4),
+                'median_ms': round(statistics.median(durations), 4),
+            })
+    return results
+
+def benchmark_parse_cache(size: int, repeat: int) -> List[Dict]:
+    """Time opening a JSON store with and without the parse cache."""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'tasks.json')
+        generate_store(path, size)
+        for setting in ('off', 'on'):
+            with patch('main.TASKS_FILE', path), patch('main.PARSE_CACHE', setting), \
+                 patch('main.ARCHIVE_THRESHOLD', 0):
+                TaskManager()  # Let the cache fill before timing
+                durations = time_operation(TaskManager, repeat)
+            results.append({
+                'backend': f"cache:{setting}",
+                'size': size,
+                'operation': 'load_tasks',
+                'repeat': repeat,
+                'min_ms': round(min(durations), 4),
+                'median_ms': round(statistics.median(durations), 4),
+            })
+    return results
+
+def measure_memory(build: Callable[[], object]) -> int:
+    """Return the bytes still allocated by whatever ``build`` returns."""
+    tracemalloc.start()
+    try:
+        result = build()
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return current
+
+def benchmark_memory(size: int) -> List[Dict]:
+    """Compare the per-task memory of plain dicts with the slotted Task records."""
+    content = json.dumps(generate_data(size)).encode()
+    representations = {
+        'dict': lambda: main.decode_snapshot(content)['tasks'],
+        'task': lambda: main.TaskStore(main.decode_snapshot(content)['tasks']),
+    }
+    results = []
+    for name, build in representations.items():
+        total = measure_memory(build)
+        results.append({
+            'backend': f"memory:{name}",
+            'size': size,
+            'operation': 'store_memory',
+            'bytes': total,
+            'bytes_per_task': round(total / size, 1),
+        })
+    return results
+
+def run_benchmarks(sizes: List[int], backends: List[str], repeat: int,
+                   formats: bool = True, memory: bool = True, cache: bool = True) -> Dict:
+    """Run the full suite and return machine-readable results."""
+    results = []
+    for backend in backends:
+        for size in sizes:
+            results.extend(benchmark_store(backend, size, repeat))
+    if formats:
+        for size in sizes:
+            results.extend(benchmark_formats(size, repeat))
+    if memory:
+        for size in sizes:
+            results.extend(benchmark_memory(size))
+    if cache:
+        for size in sizes:
+            results.extend(benchmark_parse_cache(size, repeat))
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+def compare(baseline: Dict, current: Dict) -> List[str]:
+    """Describe how each median changed relative to a baseline run."""
+    key = lambda r: (r['backend'], r['size'], r['operation'])
+    previous = {key(r): r for r in baseline['results']}
+    lines = []
+    for result in current['results']:
+        old = previous.get(key(result))
+        if old is None or not old.get('median_ms') or 'median_ms' not in result:
+            continue
+        ratio = result['median_ms'] / old['median_ms']
+        lines.append(
+            f"{result['backend']:>8} {result['size']:>9} {result['operation']:<22}"
+            f" {old['median_ms']:>10.3f} -> {result['median_ms']:>10.3f} ms ({ratio:.2f}x)"
+        )
+    return lines
+
+def main_cli(argv: Optional[List[str]] = None) -> None:
+    """Parse arguments, run the benchmarks and report the results."""
+    parser = argparse.ArgumentParser(description='Benchmark TaskNow operations')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='Number of tasks in each generated store')
+    parser.add_argument('--backends', nargs='+', default=DEFAULT_BACKENDS,
+                        help='Storage backends to benchmark')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per operation')
+    parser.add_argument('--no-formats', dest='formats', action='store_false',
+                        help='Skip the on-disk format size and parse benchmarks')
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        help='Skip the per-task memory benchmark')
+    parser.add_argument('--no-cache', dest='cache', action='store_false',
+                        help='Skip the parse cache load benchmark')
+    parser.add_argument('--output', help='Write JSON results to this file (default: stdout)')
+    parser.add_argument('--compare', help='Baseline JSON results to compare against')
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.sizes, args.backends, args.repeat, args.formats, args.memory,
+                            args.cache)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print('\n'.join(compare(baseline, report)), file=sys.stderr)
+
+if __name__ == '__main__':
+    main_cli()
@@ -1,249 +1,3244 @@
 """TaskNow - A minimalist terminal task manager."""
-import argparse
+import time
+_import_started = time.perf_counter()  # --timings reports how long the import took
+
+import heapq
+import itertools
 import json
 import os
-from typing import List, Dict, Optional
+import re
+import struct
+import sys
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import (TYPE_CHECKING, BinaryIO, Callable, ContextManager, Dict, Iterable,
+                    Iterator, List, Optional, Set, TextIO, Tuple)
+
+# argparse, shlex and shutil are imported where needed: `tasknow show` runs
+# from shell prompt hooks, so module import time is part of every prompt.
+if TYPE_CHECKING:  # pragma: no cover
+    import argparse
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
 
 TASKS_FILE = "tasks.json"
+STORAGE_BACKEND = os.environ.get('TASKNOW_STORAGE', 'json')
+FSYNC_POLICY = os.environ.get('TASKNOW_FSYNC', 'batch')
+FSYNC_POLICIES = ('always', 'batch', 'never')
+JOURNAL_COMPACT_THRESHOLD = 1000
+MMAP_COMPACT_MIN_GARBAGE = 1 << 20
+OUTPUT_CHUNK_SIZE = 1000
+IMPORT_CHUNK_SIZE = 10000
+FILE_FORMAT = os.environ.get('TASKNOW_FORMAT', 'json')
+ARCHIVE_THRESHOLD = int(os.environ.get('TASKNOW_ARCHIVE_THRESHOLD', 1000))
+PARSE_CACHE = os.environ.get('TASKNOW_PARSE_CACHE', 'off')
+COMMIT_WINDOW = float(os.environ.get('TASKNOW_COMMIT_WINDOW', 0))
+COMMIT_COUNT = int(os.environ.get('TASKNOW_COMMIT_COUNT', 0))
+REGISTRY_FILE = os.environ.get(
+    'TASKNOW_REGISTRY', os.path.join(os.path.expanduser('~'), '.tasknow', 'lists.json'))
+DAEMON_MODE = os.environ.get('TASKNOW_DAEMON', 'auto')
+DAEMON_FLUSH_DELAY = 0.1
+WATCH_POLL_INTERVAL = 1.0
+
+_metrics_hooks: List[Callable[[Dict], None]] = []
+
+def add_metrics_hook(hook: Callable[[Dict], None]) -> None:
+    """Call ``hook`` with a dict describing each timed operation.
+
+    Events have an ``operation`` (``load``, ``save`` or ``command``), a
+    ``duration_ms`` and operation-specific fields such as ``bytes_read``,
+    ``bytes_written``, ``records`` or ``command``.
+    """
+    _metrics_hooks.append(hook)
+
+def remove_metrics_hook(hook: Callable[[Dict], None]) -> None:
+    """Stop calling a hook added with ``add_metrics_hook``."""
+    _metrics_hooks.remove(hook)
+
+@contextmanager
+def measure(operation: str, **fields) -> Iterator[Dict]:
+    """Time the enclosed block and report it to the metrics hooks.
+
+    The block may add fields to the yielded event. Nothing is timed while
+    no hooks are registered.
+    """
+    event = {'operation': operation, **fields}
+    if not _metrics_hooks:
+        yield event
+        return
+    start = time.perf_counter()
+    try:
+        yield event
+    finally:
+        event['duration_ms'] = (time.perf_counter() - start) * 1000
+        for hook in list(_metrics_hooks):
+            hook(event)
+
+class Task:
+    """A single task record.
+
+    Uses ``__slots__``: a record takes 56 bytes where a three-key dict
+    takes 184, which adds up in large stores. Fields can still be read by key
+    (``task['id']``), and ``to_dict`` returns the plain dict form used for
+    storage and output.
+    """
+
+    __slots__ = ('id', 'description', 'completed')
+
+    def __init__(self, task_id: int, description: str, completed: bool = False) -> None:
+        self.id = task_id
+        self.description = description
+        self.completed = completed
+
+    @classmethod
+    def from_dict(cls, task: Dict) -> 'Task':
+        """Build a record from a task dict (or another record)."""
+        return cls(task['id'], task['description'], task['completed'])
+
+    def __getitem__(self, key: str):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __repr__(self) -> str:
+        return f"Task({self.id!r}, {self.description!r}, {self.completed!r})"
+
+    def to_dict(self) -> Dict:
+        """Return the task as a plain dict."""
+        return {'id': self.id, 'description': self.description, 'completed': self.completed}
+
+class TaskStore:
+    """In-memory task collection indexed by ID.
+
+    Task records live in a dict keyed by ID and kept in ID order; a task
+    inserted below the highest ID, such as one restored from the archive,
+    only marks it unsorted, and it is sorted again the next time it is
+    iterated. Incomplete IDs are tracked in a set plus a lazily invalidated
+    min-heap: completing or removing a task only drops it from the set, and
+    stale heap entries are popped the next time the earliest incomplete
+    task is requested, so picking and advancing the current task is
+    O(log n).
+    """
+
+    def __init__(self, tasks: Iterable[Dict] = (), next_id: Optional[int] = None) -> None:
+        """Build the indexes from an iterable of task dicts."""
+        self._lock = threading.RLock()
+        self._tasks: Dict[int, Task] = {}
+        self._unsorted = False
+        self._incomplete: Set[int] = set()
+        for task in tasks:
+            task = Task.from_dict(task)
+            self._tasks[task.id] = task
+            if not task.completed:
+                self._incomplete.add(task.id)
+        self._heap: List[int] = list(self._incomplete)
+        heapq.heapify(self._heap)
+        highest = max(self._tasks, default=0)
+        self.next_id: int = max(next_id or 0, highest + 1)
+
+    @classmethod
+    def from_columns(cls, ids: List[int], descriptions: List[str], completed: bytes,
+                     next_id: Optional[int] = None) -> 'TaskStore':
+        """Build a store from parallel ID, description and completed-flag columns.
+
+        Creates each Task once, skipping the per-task dict of ``__init__``.
+        """
+        store = cls(next_id=next_id)
+        store._tasks = dict(zip(ids, map(Task, ids, descriptions, map(bool, completed))))
+        store._incomplete = set(itertools.compress(ids, [not flag for flag in completed]))
+        store._heap = list(store._incomplete)
+        heapq.heapify(store._heap)
+        store.next_id = max(store.next_id, max(ids, default=0) + 1)
+        return store
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def __iter__(self) -> Iterator[Task]:
+        self._sort()
+        return iter(list(self._tasks.values()))
+
+    def get(self, task_id: int) -> Optional[Task]:
+        """Return the task with the given ID, or None."""
+        return self._tasks.get(task_id)
+
+    def add(self, description: str) -> Task:
+        """Create a new incomplete task with the next free ID."""
+        with self._lock:
+            task = Task(self.next_id, description)
+            self._insert(task)
+            return task
+
+    def insert(self, task: Dict) -> None:
+        """Insert or replace a task under its own ID."""
+        self._insert(Task.from_dict(task))
+
+    def _insert(self, task: Task) -> None:
+        with self._lock:
+            if self._tasks and task.id not in self._tasks and task.id < next(reversed(self._tasks)):
+                self._unsorted = True
+            self._tasks[task.id] = task
+            if task.completed:
+                self._incomplete.discard(task.id)
+            else:
+                self._push_incomplete(task.id)
+            self.next_id = max(self.next_id, task.id + 1)
+
+    def remove(self, task_id: int) -> Optional[Task]:
+        """Remove a task and return it, or None if it doesn't exist."""
+        with self._lock:
+            task = self._tasks.pop(task_id, None)
+            self._incomplete.discard(task_id)
+            return task
+
+    def set_completed(self, task_id: int, completed: bool) -> None:
+        """Mark a task as completed or incomplete."""
+        with self._lock:
+            task = self._tasks[task_id]
+            if task.completed == completed:
+                return
+            task.completed = completed
+            if completed:
+                self._incomplete.discard(task_id)
+            else:
+                self._push_incomplete(task_id)
+
+    def set_description(self, task_id: int, description: str) -> None:
+        """Change a task's description."""
+        self._tasks[task_id].description = description
+
+    def first_incomplete(self) -> Optional[int]:
+        """Return the ID of the earliest incomplete task, or None."""
+        with self._lock:
+            # Pop entries invalidated by completions and removals
+            while self._heap and self._heap[0] not in self._incomplete:
+                heapq.heappop(self._heap)
+            return self._heap[0] if self._heap else None
+
+    def completed_count(self) -> int:
+        """Return the number of completed tasks."""
+        return len(self._tasks) - len(self._incomplete)
+
+    def iter_incomplete(self, since_id: Optional[int] = None) -> Iterator[Task]:
+        """Yield incomplete tasks in ID order, after ``since_id`` if given."""
+        ids = self._incomplete if since_id is None else [i for i in self._incomplete if i > since_id]
+        for task_id in sorted(ids):
+            task = self._tasks.get(task_id)
+            if task is not None:
+                yield task
+
+    def iter_completed(self, since_id: Optional[int] = None) -> Iterator[Task]:
+        """Yield completed tasks in ID order, after ``since_id`` if given."""
+        since_id = 0 if since_id is None else since_id
+        return (task for task in self if task.completed and task.id > since_id)
+
+    def _sort(self) -> None:
+        """Put the tasks back in ID order after an out-of-order insert."""
+        with self._lock:
+            if self._unsorted:
+                self._tasks = dict(sorted(self._tasks.items()))
+                self._unsorted = False
+
+    def _push_incomplete(self, task_id: int) -> None:
+        """Track an ID as incomplete, rebuilding the heap if mostly stale."""
+        self._incomplete.add(task_id)
+        heapq.heappush(self._heap, task_id)
+        if len(self._heap) > 2 * len(self._incomplete) + 16:
+            self._heap = list(self._incomplete)
+            heapq.heapify(self._heap)
+
+class LazyTaskStore(TaskStore):
+    """TaskStore that parses completed tasks only when they are needed.
+
+    Built from an ``indexed`` snapshot: incomplete tasks are loaded up
+    front while the completed section is kept as raw NDJSON bytes. Picking,
+    adding and completing tasks never touch it, and a save writes it back
+    unchanged; anything that looks up, lists or counts completed tasks
+    parses it first.
+    """
+
+    def __init__(self, tasks: Iterable[Dict] = (), next_id: Optional[int] = None,
+                 completed_section: bytes = b'') -> None:
+        super().__init__(tasks, next_id)
+        self.completed_section = completed_section
+        self._section_count = completed_section.count(b'\n')
+        self.loaded = not completed_section
+
+    def __len__(self) -> int:
+        self.load()
+        return super().__len__()
+
+    def __iter__(self) -> Iterator[Task]:
+        self.load()
+        return super().__iter__()
+
+    def load(self) -> None:
+        """Parse the completed section into the store."""
+        with self._lock:
+            if self.loaded:
+                return
+            completed = map(Task.from_dict, parse_lines(self.completed_section))
+            # Keep tasks in ID order, as they were before being split up
+            tasks = sorted(itertools.chain(completed, self._tasks.values()), key=lambda t: t.id)
+            self._tasks = {task.id: task for task in tasks}
+            self._unsorted = False
+            self.completed_section = b''
+            self._section_count = 0
+            self.loaded = True
+
+    def parsed_tasks(self) -> Iterator[Task]:
+        """Yield the tasks held in memory without parsing the rest."""
+        self._sort()
+        return iter(list(self._tasks.values()))
+
+    def get(self, task_id: int) -> Optional[Task]:
+        """Return the task with the given ID, or None."""
+        if task_id not in self._tasks:
+            self.load()
+        return super().get(task_id)
+
+    def _insert(self, task: Task) -> None:
+        if task.id < self.next_id and task.id not in self._tasks:
+            # It may replace a task in the completed section
+            self.load()
+        super()._insert(task)
+
+    def remove(self, task_id: int) -> Optional[Task]:
+        """Remove a task and return it, or None if it doesn't exist."""
+        if task_id not in self._tasks:
+            self.load()
+        return super().remove(task_id)
+
+    def completed_count(self) -> int:
+        """Return the number of completed tasks, without parsing them."""
+        return super().completed_count() + self._section_count
+
+    def iter_completed(self, since_id: Optional[int] = None) -> Iterator[Task]:
+        """Yield completed tasks in ID order, after ``since_id`` if given."""
+        self.load()
+        return super().iter_completed(since_id)
+
+class SqliteTaskStore:
+    """Task collection backed by an SQLite database.
+
+    Implements the TaskStore interface as indexed queries, so commands
+    only read the rows they need instead of loading the whole history.
+    """
+
+    def __init__(self, conn) -> None:
+        self._conn = conn
+
+    def __len__(self) -> int:
+        return self._conn.execute('SELECT COUNT(*) FROM tasks').fetchone()[0]
+
+    def __iter__(self) -> Iterator[Task]:
+        return self._query('SELECT id, description, completed FROM tasks ORDER BY id')
+
+    @property
+    def next_id(self) -> int:
+        """The ID the next added task will receive."""
+        row = self._conn.execute(
+            "SELECT seq FROM sqlite_sequence WHERE name = 'tasks'"
+        ).fetchone()
+        return (row[0] if row else 0) + 1
+
+    def get(self, task_id: int) -> Optional[Task]:
+        """Return the task with the given ID, or None."""
+        return next(self._query(
+            'SELECT id, description, completed FROM tasks WHERE id = ?', (task_id,)
+        ), None)
+
+    def add(self, description: str) -> Task:
+        """Create a new incomplete task with the next free ID."""
+        cursor = self._conn.execute(
+            'INSERT INTO tasks (description, completed) VALUES (?, 0)', (description,)
+        )
+        return Task(cursor.lastrowid, description)
+
+    def insert(self, task: Dict) -> None:
+        """Insert or replace a task under its own ID."""
+        self._conn.execute(
+            'INSERT OR REPLACE INTO tasks (id, description, completed) VALUES (?, ?, ?)',
+            (task['id'], task['description'], int(task['completed']))
+        )
+
+    def remove(self, task_id: int) -> Optional[Task]:
+        """Remove a task and return it, or None if it doesn't exist."""
+        task = self.get(task_id)
+        if task is not None:
+            self._conn.execute('DELETE FROM tasks WHERE id = ?', (task_id,))
+        return task
+
+    def set_completed(self, task_id: int, completed: bool) -> None:
+        """Mark a task as completed or incomplete."""
+        self._conn.execute(
+            'UPDATE tasks SET completed = ? WHERE id = ?', (int(completed), task_id)
+        )
+
+    def set_description(self, task_id: int, description: str) -> None:
+        """Change a task's description."""
+        self._conn.execute(
+            'UPDATE tasks SET description = ? WHERE id = ?', (description, task_id)
+        )
+
+    def first_incomplete(self) -> Optional[int]:
+        """Return the ID of the earliest incomplete task, or None."""
+        return self._conn.execute(
+            'SELECT MIN(id) FROM tasks WHERE completed = 0'
+        ).fetchone()[0]
+
+    def iter_incomplete(self, since_id: Optional[int] = None) -> Iterator[Task]:
+        """Yield incomplete tasks in ID order, after ``since_id`` if given."""
+        return self._query(
+            'SELECT id, description, completed FROM tasks'
+            ' WHERE completed = 0 AND id > ? ORDER BY id', (since_id or 0,)
+        )
+
+    def iter_completed(self, since_id: Optional[int] = None) -> Iterator[Task]:
+        """Yield completed tasks in ID order, after ``since_id`` if given."""
+        return self._query(
+            'SELECT id, description, completed FROM tasks'
+            ' WHERE completed = 1 AND id > ? ORDER BY id', (since_id or 0,)
+        )
+
+    def _query(self, sql: str, params: Tuple = ()) -> Iterator[Task]:
+        # Rows are streamed from the cursor so paging can stop early
+        for task_id, description, completed in self._conn.execute(sql, params):
+            yield Task(task_id, description, bool(completed))
+
+class MmapTaskStore:
+    """Task collection in a memory-mapped file of fixed-size records.
+
+    Slot ``n`` of the record file holds task ``n + 1``: its ID, flags and
+    the offset and length of its description in an append-only heap file.
+    Reading or changing a task touches a single record, and IDs that were
+    removed or never used are tombstones. The header keeps the current
+    task, the slot count, a hint below which every task is completed and a
+    count of commits that changed anything.
+
+    Writes go straight to the shared mapping; the bytes they replace are
+    kept until the next ``commit`` so ``rollback`` can restore them. The
+    first write after a commit calls ``hold`` to take the cross-process
+    lock, and ``commit`` or ``rollback`` calls ``release``, so no other
+    writer can commit on top of bytes a rollback would restore. ``compact`` drops descriptions no task
+    refers to any more, bumping a generation counter so readers in other
+    processes reopen the heap.
+    """
+
+    MAGIC = b'TNMM'
+    HEADER_SIZE = 64
+    FIELDS = {'current': 8, 'slots': 16, 'hint': 24, 'garbage': 32, 'generation': 40,
+              'commits': 48}
+    RECORD = struct.Struct('<QQIB3x')  # id, description offset, length, flags
+    U64 = struct.Struct('<Q')
+    COMPLETED, REMOVED = 1, 2
+
+    def __init__(self, path: str, heap_path: str,
+                 lock: Callable[[], ContextManager] = nullcontext,
+                 hold: Callable[[], None] = lambda: None,
+                 release: Callable[[], None] = lambda: None) -> None:
+        import mmap
+
+        self._mmap = mmap.mmap
+        self.path = path
+        self.heap_path = heap_path
+        self.lock = lock
+        self.hold = hold
+        self.release = release
+        self._lock = threading.RLock()
+        self._undo: List[Tuple[int, bytes]] = []
+        self._holding = False
+        self.bytes_written = 0
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+        with self.lock():
+            if os.fstat(self._fd).st_size == 0:
+                os.ftruncate(self._fd, self.HEADER_SIZE + 64 * self.RECORD.size)
+                self._mm = self._mmap(self._fd, 0)
+                self._mm[:8] = self.MAGIC + bytes(4)
+                self._set_field('hint', 1)
+                self._finish()
+            else:
+                self._mm = self._mmap(self._fd, 0)
+        if self._mm[:4] != self.MAGIC:
+            raise ValueError(f"Not a task record file: {path}")
+        self._open_heap()
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self._scan(1))
+
+    def __iter__(self) -> Iterator[Task]:
+        return (self._task(task_id, slot) for task_id, slot in self._scan(1))
+
+    @property
+    def next_id(self) -> int:
+        """The ID the next added task will receive."""
+        return self._field('slots') + 1
+
+    @property
+    def current(self) -> Optional[int]:
+        """The current task ID stored in the header."""
+        return self._field('current') or None
+
+    @property
+    def commits(self) -> int:
+        """How many commits have changed the file, by any process."""
+        return self._field('commits')
+
+    def get(self, task_id: int) -> Optional[Task]:
+        """Return the task with the given ID, or None."""
+        with self._lock:
+            if not 1 <= task_id <= self._field('slots'):
+                return None
+            slot = self._slot(task_id)
+            return self._task(task_id, slot) if self._live(slot) else None
+
+    def add(self, description: str) -> Task:
+        """Create a new incomplete task with the next free ID."""
+        with self.lock(), self._lock:
+            task = Task(self.next_id, description)
+            self._put(task)
+            return task
+
+    def insert(self, task: Dict) -> None:
+        """Insert or replace a task under its own ID."""
+        with self.lock(), self._lock:
+            self._put(Task.from_dict(task))
+
+    def remove(self, task_id: int) -> Optional[Task]:
+        """Remove a task and return it, or None if it doesn't exist."""
+        with self.lock(), self._lock:
+            task = self.get(task_id)
+            if task is not None:
+                _, offset, length, flags = self._slot(task_id)
+                self._set_slot(task_id, task_id, offset, length, flags | self.REMOVED)
+                self._set_field('garbage', self._field('garbage') + length)
+            return task
+
+    def set_completed(self, task_id: int, completed: bool) -> None:
+        """Mark a task as completed or incomplete."""
+        with self.lock(), self._lock:
+            _, offset, length, flags = self._slot(task_id)
+            flags = flags | self.COMPLETED if completed else flags & ~self.COMPLETED
+            self._set_slot(task_id, task_id, offset, length, flags)
+            if not completed and task_id < self._field('hint'):
+                self._set_field('hint', task_id)
+
+    def set_description(self, task_id: int, description: str) -> None:
+        """Change a task's description."""
+        with self.lock(), self._lock:
+            _, _, old_length, flags = self._slot(task_id)
+            offset, length = self._append_description(description)
+            self._set_slot(task_id, task_id, offset, length, flags)
+            self._set_field('garbage', self._field('garbage') + old_length)
+
+    def first_incomplete(self) -> Optional[int]:
+        """Return the ID of the earliest incomplete task, or None."""
+        return next((task_id for task_id, slot in self._scan(self._field('hint'))
+                     if not slot[3] & self.COMPLETED), None)
+
+    def iter_incomplete(self, since_id: Optional[int] = None) -> Iterator[Task]:
+        """Yield incomplete tasks in ID order, after ``since_id`` if given."""
+        start = max(self._field('hint'), (since_id or 0) + 1)
+        return (self._task(task_id, slot) for task_id, slot in self._scan(start)
+                if not slot[3] & self.COMPLETED)
+
+    def iter_completed(self, since_id: Optional[int] = None) -> Iterator[Task]:
+        """Yield completed tasks in ID order, after ``since_id`` if given."""
+        return (self._task(task_id, slot) for task_id, slot in self._scan((since_id or 0) + 1)
+                if slot[3] & self.COMPLETED)
+
+    def completed_count(self) -> int:
+        """Return the number of completed tasks."""
+        return sum(1 for _, slot in self._scan(1) if slot[3] & self.COMPLETED)
+
+    def set_current(self, task_id: Optional[int]) -> None:
+        """Store the current task ID in the header."""
+        with self._lock:
+            self._set_field('current', task_id or 0)
+
+    def commit(self, fsync: bool) -> None:
+        """Make the writes so far permanent, advancing the completed hint."""
+        with self._lock:
+            hint = self.first_incomplete() or self.next_id
+            if hint != self._field('hint'):
+                self._set_field('hint', hint)
+            if self._undo:
+                self._set_field('commits', self._field('commits') + 1)
+            if fsync:
+                os.fsync(self._heap_fd)
+                self._mm.flush()
+            self._finish()
+
+    def rollback(self) -> None:
+        """Restore the bytes overwritten since the last commit."""
+        with self._lock:
+            for position, data in reversed(self._undo):
+                self._mm[position:position + len(data)] = data
+            self._finish()
+
+    def needs_compaction(self) -> bool:
+        """Return True once most of the description heap is unreferenced."""
+        garbage = self._field('garbage')
+        return garbage >= MMAP_COMPACT_MIN_GARBAGE and 2 * garbage >= os.fstat(self._heap_fd).st_size
+
+    def compact(self) -> None:
+        """Rewrite the description heap without unreferenced descriptions."""
+        with self.lock(), self._lock:
+            if self._undo:
+                # Uncommitted writes still point into the old heap
+                return
+            tmp_path = f"{self.heap_path}.{os.getpid()}.tmp"
+            slots = []
+            with open(tmp_path, 'wb') as f:
+                for task_id, (_, offset, length, flags) in self._scan(1):
+                    slots.append((task_id, f.tell(), length, flags))
+                    f.write(os.pread(self._heap_fd, length, offset))
+                f.flush()
+                os.fsync(f.fileno())
+            # An odd generation tells readers elsewhere a swap is in progress
+            self._set_field('generation', self._field('generation') + 1)
+            os.replace(tmp_path, self.heap_path)
+            for task_id, offset, length, flags in slots:
+                self._set_slot(task_id, task_id, offset, length, flags)
+            self._set_field('garbage', 0)
+            self._set_field('generation', self._field('generation') + 1)
+            self._mm.flush()
+            self._finish()
+            os.close(self._heap_fd)
+            self._open_heap()
+
+    def close(self) -> None:
+        """Unmap the record file and close both files."""
+        self._mm.close()
+        os.close(self._fd)
+        os.close(self._heap_fd)
+
+    def _open_heap(self) -> None:
+        self._heap_fd = os.open(self.heap_path, os.O_RDWR | os.O_CREAT, 0o666)
+        self._generation = self._field('generation')
+
+    def _field(self, name: str) -> int:
+        return self.U64.unpack_from(self._mm, self.FIELDS[name])[0]
+
+    def _set_field(self, name: str, value: int) -> None:
+        self._write(self.FIELDS[name], self.U64.pack(value))
+
+    def _write(self, position: int, data: bytes) -> None:
+        if not self._holding:
+            self.hold()
+            self._holding = True
+        self._undo.append((position, self._mm[position:position + len(data)]))
+        self._mm[position:position + len(data)] = data
+        self.bytes_written += len(data)
+
+    def _finish(self) -> None:
+        """Forget the undo log and give up the lock taken by the first write."""
+        self._undo = []
+        if self._holding:
+            self._holding = False
+            self.release()
+
+    def _position(self, task_id: int) -> int:
+        return self.HEADER_SIZE + (task_id - 1) * self.RECORD.size
+
+    def _ensure_mapped(self, task_id: int, grow: bool = False) -> None:
+        """Remap if another process (or ``grow``) extended the record file."""
+        end = self._position(task_id + 1)
+        if end <= len(self._mm):
+            return
+        size = os.fstat(self._fd).st_size
+        if grow and end > size:
+            os.ftruncate(self._fd, max(end, 2 * size))
+        self._mm.close()
+        self._mm = self._mmap(self._fd, 0)
+
+    def _slot(self, task_id: int) -> Tuple[int, int, int, int]:
+        self._ensure_mapped(task_id)
+        return self.RECORD.unpack_from(self._mm, self._position(task_id))
+
+    def _set_slot(self, task_id: int, *fields) -> None:
+        self._write(self._position(task_id), self.RECORD.pack(*fields))
+
+    def _live(self, slot: Tuple[int, int, int, int]) -> bool:
+        return bool(slot[0]) and not slot[3] & self.REMOVED
+
+    def _scan(self, start: int) -> Iterator[Tuple[int, Tuple[int, int, int, int]]]:
+        """Yield (ID, record) for live tasks from ``start`` onwards."""
+        task_id = max(start, 1)
+        while task_id <= self._field('slots'):
+            slot = self._slot(task_id)
+            if self._live(slot):
+                yield task_id, slot
+            task_id += 1
+
+    def _task(self, task_id: int, slot: Tuple[int, int, int, int]) -> Task:
+        """Build a Task from a record, reading its description from the heap."""
+        while True:
+            generation = self._field('generation')
+            if generation % 2:
+                time.sleep(0.001)
+                continue
+            if generation != self._generation:
+                os.close(self._heap_fd)
+                self._open_heap()
+                slot = self._slot(task_id)
+            description = os.pread(self._heap_fd, slot[2], slot[1]).decode()
+            if self._field('generation') == generation:
+                return Task(task_id, description, bool(slot[3] & self.COMPLETED))
+
+    def _append_description(self, description: str) -> Tuple[int, int]:
+        data = description.encode()
+        offset = os.lseek(self._heap_fd, 0, os.SEEK_END)
+        os.write(self._heap_fd, data)
+        self.bytes_written += len(data)
+        return offset, len(data)
+
+    def _put(self, task: Task) -> None:
+        """Write a task's record, extending the file for new IDs."""
+        slots = self._field('slots')
+        old = self.get(task.id)
+        if old is not None:
+            self._set_field('garbage', self._field('garbage') + self._slot(task.id)[2])
+        offset, length = self._append_description(task.description)
+        self._ensure_mapped(task.id, grow=True)
+        flags = self.COMPLETED if task.completed else 0
+        self._set_slot(task.id, task.id, offset, length, flags)
+        if task.id > slots:
+            self._set_field('slots', task.id)
+        if not task.completed and task.id < self._field('hint'):
+            self._set_field('hint', task.id)
+
+def atomic_write(path: str, data: bytes, fsync: bool = True) -> None:
+    """Replace a file with new content without ever exposing a partial write.
+
+    The data goes to a temporary file in the same directory which is then
+    renamed over ``path``. With ``fsync`` the file and directory are flushed
+    to disk so the new content survives a crash or power loss.
+    """
+    replace_file(write_temp(path, data, fsync), path, fsync)
+
+def write_temp(path: str, data: bytes, fsync: bool = True) -> str:
+    """Write data to a new temporary file beside ``path`` and return its name."""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return tmp_path
+
+def replace_file(tmp_path: str, path: str, fsync: bool = True) -> None:
+    """Rename a file written by ``write_temp`` over ``path``."""
+    try:
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    if fsync:
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+def file_signature(path: str) -> Optional[Tuple[int, int, int]]:
+    """Return (inode, size, mtime_ns) for a file, or None if it's missing."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """Hold an exclusive advisory ``fcntl`` lock on ``path``."""
+    if fcntl is None:  # pragma: no cover
+        yield
+        return
+    with open(path, 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+class ReentrantFileLock:
+    """A ``file_lock`` that nested holds within one process share.
+
+    Calling the lock returns a context manager that also keeps other
+    threads out until it exits. ``hold`` and ``release`` pair up without
+    that, so a hold taken on one thread may be released on another.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._file_lock: Optional[ContextManager] = None
+
+    @contextmanager
+    def __call__(self) -> Iterator[None]:
+        with self._thread_lock:
+            self.hold()
+            try:
+                yield
+            finally:
+                self.release()
+
+    def hold(self) -> None:
+        """Take the file lock, or nest inside a hold already taken."""
+        with self._thread_lock:
+            if not self._depth:
+                self._file_lock = file_lock(self.path)
+                self._file_lock.__enter__()
+            self._depth += 1
+
+    def release(self) -> None:
+        """Undo one ``hold``, unlocking the file after the outermost one."""
+        with self._thread_lock:
+            self._depth -= 1
+            if not self._depth:
+                self._file_lock.__exit__(None, None, None)
+                self._file_lock = None
+
+class JsonSerializer:
+    """Pretty-printed JSON, one object per task: easy to read and diff."""
+
+    magic = b''
+
+    def dumps(self, data: Dict) -> bytes:
+        """Encode the full state as bytes."""
+        return json.dumps(data, indent=2).encode()
+
+    def loads(self, content: bytes) -> Dict:
+        """Decode bytes written by ``dumps``."""
+        return json.loads(content)
+
+class CompactSerializer(JsonSerializer):
+    """Columnar JSON without whitespace, optionally zlib-compressed.
+
+    Task fields are stored as parallel columns: a list of IDs, a string of
+    ``0``/``1`` completion flags and indexes into a table of distinct
+    descriptions. This avoids repeating three keys per task, roughly
+    halving the file size, and skips the slow indenting encoder.
+    """
+
+    def __init__(self, compress: bool = False) -> None:
+        self.compress = compress
+        self.magic = b'TASKNOW-Z\n' if compress else b'TASKNOW-C\n'
+
+    def dumps(self, data: Dict) -> bytes:
+        """Encode the full state as bytes."""
+        data = dict(data)
+        tasks = data.pop('tasks', [])
+        strings: Dict[str, int] = {}
+        data['columns'] = {
+            'ids': [task['id'] for task in tasks],
+            'completed': ''.join('1' if task['completed'] else '0' for task in tasks),
+            'descriptions': [strings.setdefault(task['description'], len(strings))
+                             for task in tasks],
+            'strings': list(strings),
+        }
+        content = json.dumps(data, separators=(',', ':')).encode()
+        if self.compress:
+            import zlib
+            content = zlib.compress(content)
+        return self.magic + content
+
+    def loads(self, content: bytes) -> Dict:
+        """Decode bytes written by ``dumps``."""
+        content = content[len(self.magic):]
+        if self.compress:
+            import zlib
+            try:
+                content = zlib.decompress(content)
+            except zlib.error as e:
+                # Report it like any other corrupted tasks file
+                raise json.JSONDecodeError(f"Corrupted compressed data: {e}", '', 0)
+        data = json.loads(content)
+        columns = data.pop('columns')
+        strings = columns['strings']
+        data['tasks'] = [
+            {'id': task_id, 'description': strings[index], 'completed': flag == '1'}
+            for task_id, flag, index in zip(columns['ids'], columns['completed'],
+                                            columns['descriptions'])
+        ]
+        return data
+
+def parse_lines(content: bytes) -> List[Dict]:
+    """Parse NDJSON lines in one pass of the C decoder."""
+    # JSON strings can't contain raw newlines, so the lines form an array
+    return json.loads(b'[' + content.rstrip(b'\n').replace(b'\n', b',') + b']')
+
+class IndexedSerializer(JsonSerializer):
+    """A header line, then incomplete tasks, then completed tasks, as NDJSON.
+
+    The header holds the state and the byte length of the incomplete
+    section that follows it, so ``loads_lazy`` can stop there and keep the completed history as raw
+    bytes for a ``LazyTaskStore``.
+    """
+
+    magic = b'TASKNOW-I\n'
+
+    def dumps(self, data: Dict) -> bytes:
+        """Encode the full state as bytes.
+
+        A ``completed_section`` of raw lines from an earlier snapshot is
+        written back as is, ahead of any newly completed tasks.
+        """
+        data = dict(data)
+        tasks = data.pop('tasks', [])
+        section = data.pop('completed_section', b'')
+        incomplete = sorted((task for task in tasks if not task['completed']),
+                            key=lambda t: t['id'])
+        completed = [task for task in tasks if task['completed']]
+        encode = lambda tasks: ''.join(
+            json.dumps(task, separators=(',', ':')) + '\n' for task in tasks
+        ).encode()
+        incomplete_section = encode(incomplete)
+        data['incomplete'] = len(incomplete)
+        data['incomplete_bytes'] = len(incomplete_section)
+        data['completed'] = len(completed) + section.count(b'\n')
+        header = json.dumps(data, separators=(',', ':')).encode() + b'\n'
+        return self.magic + header + incomplete_section + section + encode(completed)
+
+    def loads(self, content: bytes) -> Dict:
+        """Decode bytes written by ``dumps``."""
+        data = self.loads_lazy(content)
+        section = data.pop('completed_section')
+        data['tasks'].extend(parse_lines(section))
+        data['tasks'].sort(key=lambda t: t['id'])
+        return data
+
+    def loads_lazy(self, content: bytes) -> Dict:
+        """Decode the header and incomplete tasks, leaving the rest as raw bytes."""
+        try:
+            start = content.index(b'\n', len(self.magic)) + 1
+            data = json.loads(content[len(self.magic):start])
+            end = start + data.pop('incomplete_bytes')
+            tasks = parse_lines(content[start:end])
+        except ValueError as e:
+            raise json.JSONDecodeError(f"Corrupted indexed file: {e}", '', 0)
+        del data['incomplete'], data['completed']
+        data['tasks'] = tasks
+        data['completed_section'] = content[end:]
+        return data
+
+SERIALIZERS = {
+    'json': JsonSerializer(),
+    'compact': CompactSerializer(),
+    'zlib': CompactSerializer(compress=True),
+    'indexed': IndexedSerializer(),
+}
+
+def decode_snapshot(content: bytes) -> Dict:
+    """Decode a tasks file written in any format, detected by its header."""
+    for serializer in SERIALIZERS.values():
+        if serializer.magic and content.startswith(serializer.magic):
+            return serializer.loads(content)
+    return SERIALIZERS['json'].loads(content)
+
+class TaskArchive:
+    """Completed tasks moved out of the hot store into compressed segments.
+
+    Each segment in the archive directory is a gzip-compressed NDJSON file
+    of tasks sorted by ID. ``index.json`` lists the segments with the ID
+    range they cover, so a lookup only decompresses segments that may
+    contain the task.
+    """
+
+    def __init__(self, directory: str, fsync: bool = True) -> None:
+        self.directory = directory
+        self.index_path = os.path.join(directory, 'index.json')
+        self.fsync = fsync
+
+    def __len__(self) -> int:
+        return sum(segment['count'] for segment in self._read_index()['segments'])
+
+    def add_segment(self, tasks: List[Dict]) -> None:
+        """Write tasks to a new segment and list it in the index."""
+        os.makedirs(self.directory, exist_ok=True)
+        index = self._read_index()
+        name = f"{index['next_segment']:08d}.ndjson.gz"
+        index['segments'].append(self._write_segment(name, sorted(tasks, key=lambda t: t['id'])))
+        index['next_segment'] += 1
+        self._write_index(index)
+
+    def get(self, task_id: int) -> Optional[Dict]:
+        """Return an archived task, or None."""
+        for segment in self._read_index()['segments']:
+            if segment['min_id'] <= task_id <= segment['max_id']:
+                for task in self._read_segment(segment):
+                    if task['id'] == task_id:
+                        return task
+        return None
+
+    def remove(self, task_id: int) -> None:
+        """Drop a task from its segment, deleting the segment once empty."""
+        self.remove_many({task_id})
+
+    def remove_many(self, task_ids: Set[int]) -> None:
+        """Drop tasks, rewriting each affected segment and the index once."""
+        import bisect
+
+        ordered = sorted(task_ids)
+        index = self._read_index()
+        segments, emptied = [], []
+        for segment in index['segments']:
+            position = bisect.bisect_left(ordered, segment['min_id'])
+            if position == len(ordered) or ordered[position] > segment['max_id']:
+                segments.append(segment)
+                continue
+            tasks = list(self._read_segment(segment))
+            kept = [task for task in tasks if task['id'] not in task_ids]
+            if len(kept) == len(tasks):
+                segments.append(segment)
+            elif kept:
+                segments.append(self._write_segment(segment['file'], kept))
+            else:
+                emptied.append(segment['file'])
+        if segments == index['segments']:
+            return
+        index['segments'] = segments
+        self._write_index(index)
+        for name in emptied:
+            os.unlink(os.path.join(self.directory, name))
+
+    def iter_tasks(self, since_id: Optional[int] = None) -> Iterator[Dict]:
+        """Yield archived tasks segment by segment, after ``since_id`` if given."""
+        since_id = since_id or 0
+        for segment in self._read_index()['segments']:
+            if segment['max_id'] <= since_id:
+                continue
+            for task in self._read_segment(segment):
+                if task['id'] > since_id:
+                    yield task
+
+    def _read_index(self) -> Dict:
+        try:
+            with open(self.index_path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'next_segment': 1, 'segments': []}
+
+    def _write_index(self, index: Dict) -> None:
+        atomic_write(self.index_path, json.dumps(index).encode(), self.fsync)
+
+    def _read_segment(self, segment: Dict) -> Iterator[Dict]:
+        import gzip
+
+        with gzip.open(os.path.join(self.directory, segment['file']), 'rb') as f:
+            for line in f:
+                yield json.loads(line)
+
+    def _write_segment(self, name: str, tasks: List[Dict]) -> Dict:
+        """Write a segment file and return its index entry."""
+        import gzip
+
+        content = ''.join(json.dumps(t, separators=(',', ':')) + '\n' for t in tasks).encode()
+        atomic_write(os.path.join(self.directory, name), gzip.compress(content), self.fsync)
+        return {'file': name, 'min_id': tasks[0]['id'], 'max_id': tasks[-1]['id'],
+                'count': len(tasks)}
+
+class ParseCache:
+    """A marshalled copy of a parsed snapshot, kept next to the snapshot file.
+
+    Tasks are stored as columns (IDs, descriptions and a completed flag per
+    task), which load several times faster than parsing the JSON again. An
+    entry is only used while the snapshot still has the inode, size and
+    mtime it was cached for, and only by the same cache layout, Python
+    version and decoding mode; anything else, including an unreadable
+    cache file, counts as a miss.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: str, lazy: bool = False) -> None:
+        self.path = path
+        self.lazy = lazy
+        self.bytes_read = 0
+
+    def _key(self, signature: Tuple[int, int, int]) -> Tuple:
+        return (self.VERSION, tuple(sys.version_info[:2]), self.lazy, tuple(signature))
+
+    def get(self, signature: Optional[Tuple[int, int, int]]) -> Optional[Dict]:
+        """Return the cached state for a snapshot signature, or None."""
+        import marshal
+
+        if signature is None:
+            return None
+        try:
+            with open(self.path, 'rb') as f:
+                content = f.read()
+            self.bytes_read += len(content)
+            cached = marshal.loads(content)
+            if cached['key'] != self._key(signature):
+                return None
+            return cached['data']
+        except (OSError, EOFError, ValueError, TypeError, KeyError):
+            return None
+
+    def put(self, signature: Optional[Tuple[int, int, int]], data: Dict) -> None:
+        """Cache parsed state for a snapshot signature; failures are ignored."""
+        import marshal
+
+        if signature is None:
+            return
+        data = dict(data)
+        tasks = data.pop('tasks', [])
+        data['columns'] = ([task['id'] for task in tasks], [task['description'] for task in tasks],
+                           bytes(bool(task['completed']) for task in tasks))
+        try:
+            content = marshal.dumps({'key': self._key(signature), 'data': data})
+            atomic_write(self.path, content, fsync=False)
+        except (OSError, ValueError):
+            pass
+
+class Storage:
+    """Base class for task storage backends."""
+
+    # Where completed tasks are archived, if the backend supports it
+    archive: Optional[TaskArchive] = None
+    # File bytes read and written so far, for backends that track them
+    bytes_read = 0
+    bytes_written = 0
+    # False for stores that write changes through themselves, whose saves
+    # only read the current task from the queued records
+    replays_records = True
+
+    def load(self) -> Tuple[Optional[Dict], List[Dict]]:
+        """Return the stored state (None if missing) and records to replay."""
+        raise NotImplementedError
+
+    def prepare(self, records: List[Dict], snapshot: Callable[[], Dict],
+                compact: bool = False) -> Optional[Tuple]:
+        """Do the slow part of a save before the lock is taken, if there is one.
+
+        The result is passed to ``save`` if nothing changed in the meantime,
+        and to ``discard`` otherwise.
+        """
+        return None
+
+    def discard(self, prepared: Optional[Tuple]) -> None:
+        """Throw away the result of a ``prepare`` that won't be saved."""
+
+    def save(self, records: List[Dict], snapshot: Callable[[], Dict],
+             compact: bool = False, prepared: Optional[Tuple] = None) -> None:
+        """Persist the records queued since the last save."""
+        raise NotImplementedError
+
+    def build_store(self, data: Dict):
+        """Create the task store for state returned by ``load``."""
+        if 'columns' in data:
+            # Loaded from a ParseCache
+            if 'completed_section' not in data:
+                return TaskStore.from_columns(*data['columns'], data.get('next_id'))
+            ids, descriptions, completed = data['columns']
+            data['tasks'] = list(map(Task, ids, descriptions, map(bool, completed)))
+        if 'completed_section' in data:
+            return LazyTaskStore(data['tasks'], data.get('next_id'), data['completed_section'])
+        return TaskStore(data.get('tasks', []), data.get('next_id'))
+
+    def rollback(self) -> None:
+        """Discard changes applied but not yet saved."""
+
+    def recover(self) -> bool:
+        """Set corrupted data aside; return True if a backup was restored."""
+        return False
+
+    def lock(self) -> ContextManager:
+        """Return a context manager holding the cross-process write lock."""
+        return nullcontext()
+
+    def is_stale(self) -> bool:
+        """Return True if another process saved since our last load or save."""
+        raise NotImplementedError
+
+    def state_signature(self) -> List:
+        """Return a cheap fingerprint that changes whenever the stored state does."""
+        raise NotImplementedError
+
+class JsonStorage(Storage):
+    """Stores all tasks as a single snapshot file.
+
+    Snapshots use the ``TASKNOW_FORMAT`` layout (pretty JSON by default),
+    though any layout is read back. They are written atomically and the
+    previous one is kept as ``<path>.bak`` so a corrupted file can be
+    recovered. Each snapshot carries a version counter; writers hold an
+    ``fcntl`` lock on ``<path>.lock`` only while checking that version and
+    writing. Completed tasks are archived under ``<path>.archive/``.
+    """
+
+    def __init__(self, path: str, fsync_policy: Optional[str] = None,
+                 file_format: Optional[str] = None) -> None:
+        self.path = path
+        self.backup_path = path + '.bak'
+        self.lock_path = path + '.lock'
+        self._lock = ReentrantFileLock(self.lock_path)
+        self.fsync_policy = fsync_policy or FSYNC_POLICY
+        self.file_format = file_format or FILE_FORMAT
+        self.version = 0
+        self.signature: Optional[Tuple[int, int, int]] = None
+        self.archive = TaskArchive(path + '.archive', self.fsync_policy != 'never')
+        self.cache: Optional[ParseCache] = None
+        if PARSE_CACHE == 'on':
+            self.cache = ParseCache(path + '.cache', self.file_format == 'indexed')
+
+    def load(self) -> Tuple[Optional[Dict], List[Dict]]:
+        """Return the snapshot (None if missing) and records to replay."""
+        data = self._read_snapshot()
+        self.version = data.get('version', 0) if data else 0
+        return data, []
+
+    def _read_snapshot(self) -> Optional[Dict]:
+        """Parse the snapshot file, recording its signature."""
+        try:
+            with open(self.path, 'rb') as f:
+                self.signature = file_signature(self.path)
+                if self.cache is not None:
+                    cached_bytes = self.cache.bytes_read
+                    data = self.cache.get(self.signature)
+                    self.bytes_read += self.cache.bytes_read - cached_bytes
+                    if data is not None:
+                        return data
+                content = f.read()
+            self.bytes_read += len(content)
+            data = self._decode(content)
+            if self.cache is not None:
+                self.cache.put(self.signature, data)
+            return data
+        except FileNotFoundError:
+            self.signature = None
+            return None
+
+    def _decode(self, content: bytes) -> Dict:
+        """Decode a snapshot, leaving completed tasks unparsed in indexed mode."""
+        serializer = SERIALIZERS['indexed']
+        if self.file_format == 'indexed' and content.startswith(serializer.magic):
+            return serializer.loads_lazy(content)
+        return decode_snapshot(content)
+
+    def lock(self) -> ContextManager:
+        """Hold an exclusive advisory lock on ``<path>.lock``.
+
+        Re-entrant, so recovering from a corrupted file while rebasing a
+        save can save again without waiting on itself.
+        """
+        return self._lock()
+
+    def is_stale(self) -> bool:
+        """Compare the stored version with ours if the file was touched."""
+        signature = file_signature(self.path)
+        if signature == self.signature:
+            return False
+        if signature is None:
+            return True
+        try:
+            with open(self.path, 'rb') as f:
+                content = f.read()
+            self.bytes_read += len(content)
+            version = self._decode(content).get('version', 0)
+        except json.JSONDecodeError:
+            return True
+        if version != self.version:
+            return True
+        self.signature = signature
+        return False
+
+    def state_signature(self) -> List:
+        """Identify the state by the snapshot file's inode, size and mtime."""
+        return [file_signature(self.path)]
+
+    def prepare(self, records: List[Dict], snapshot: Callable[[], Dict],
+                compact: bool = False) -> Optional[Tuple]:
+        """Serialize the next snapshot and write it to a temporary file."""
+        return self._prepare_snapshot(snapshot())
+
+    def discard(self, prepared: Optional[Tuple]) -> None:
+        """Delete a prepared snapshot's temporary file."""
+        if prepared is not None:
+            try:
+                os.unlink(prepared[1])
+            except FileNotFoundError:
+                pass
+
+    def save(self, records: List[Dict], snapshot: Callable[[], Dict],
+             compact: bool = False, prepared: Optional[Tuple] = None) -> None:
+        """Persist changes by rewriting the whole snapshot."""
+        self._install_snapshot(prepared or self._prepare_snapshot(snapshot()))
+
+    def recover(self) -> bool:
+        """Move the corrupted snapshot to ``<path>.corrupt`` and restore the backup."""
+        os.replace(self.path, self.path + '.corrupt')
+        self.signature = None
+        if os.path.exists(self.backup_path):
+            os.replace(self.backup_path, self.path)
+            return True
+        return False
+
+    def _prepare_snapshot(self, data: Dict) -> Tuple[Dict, str, int]:
+        """Write the next version of the snapshot beside the file; see ``_install_snapshot``."""
+        data['version'] = self.version + 1
+        content = SERIALIZERS[self.file_format].dumps(data)
+        tmp_path = write_temp(self.path, content, self.fsync_policy != 'never')
+        return data, tmp_path, len(content)
+
+    def _install_snapshot(self, prepared: Tuple[Dict, str, int]) -> None:
+        """Back up the current snapshot and rename a prepared one over it."""
+        data, tmp_path, size = prepared
+        if os.path.exists(self.path):
+            self._backup()
+        replace_file(tmp_path, self.path, self.fsync_policy != 'never')
+        self.bytes_written += size
+        self.version = data['version']
+        self.signature = file_signature(self.path)
+        if self.cache is not None and not self.cache.lazy:
+            # The next run reads what we just wrote; indexed files are cached when read
+            self.cache.put(self.signature, data)
+
+    def _backup(self) -> None:
+        """Keep the current snapshot as the backup, hard-linking when possible."""
+        try:
+            os.unlink(self.backup_path)
+        except FileNotFoundError:
+            pass
+        try:
+            os.link(self.path, self.backup_path)
+        except OSError:
+            import shutil
+            shutil.copy2(self.path, self.backup_path)
+
+class JournalStorage(JsonStorage):
+    """Stores tasks as a JSON snapshot plus an append-only journal.
+
+    Each mutation is appended to ``<path>.journal`` as one compact JSON
+    line. Once the journal holds ``JOURNAL_COMPACT_THRESHOLD`` records it
+    is folded back into the snapshot and truncated. Under the ``batch``
+    fsync policy only multi-record appends are synced to disk.
+    """
+
+    def __init__(self, path: str, fsync_policy: Optional[str] = None,
+                 file_format: Optional[str] = None) -> None:
+        super().__init__(path, fsync_policy, file_format)
+        self.journal_path = path + '.journal'
+        self.journal_size = 0
+        self.journal_end = 0
+
+    def load(self) -> Tuple[Optional[Dict], List[Dict]]:
+        """Return the snapshot and the journal records written since."""
+        data, _ = super().load()
+        content = b''
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'rb') as f:
+                content = f.read()
+            self.bytes_read += len(content)
+        # Ignore a torn final line; the next append under the lock drops it
+        self.journal_end = content.rfind(b'\n') + 1
+        records = [json.loads(line) for line in content[:self.journal_end].splitlines()]
+        self.journal_size = len(records)
+        return data, records
+
+    def is_stale(self) -> bool:
+        """Also treat records appended by other processes as a change."""
+        try:
+            journal_bytes = os.path.getsize(self.journal_path)
+        except FileNotFoundError:
+            journal_bytes = 0
+        return super().is_stale() or journal_bytes != self.journal_end
+
+    def state_signature(self) -> List:
+        """Include the journal, which changes on every save."""
+        return super().state_signature() + [file_signature(self.journal_path)]
+
+    def prepare(self, records: List[Dict], snapshot: Callable[[], Dict],
+                compact: bool = False) -> Optional[Tuple]:
+        """Prepare a snapshot only if this save will compact the journal."""
+        if self._compacts(records, compact):
+            return super().prepare(records, snapshot, compact)
+        return None
+
+    def save(self, records: List[Dict], snapshot: Callable[[], Dict],
+             compact: bool = False, prepared: Optional[Tuple] = None) -> None:
+        """Append records to the journal, compacting when it grows large."""
+        if prepared is not None or self._compacts(records, compact):
+            self._install_snapshot(prepared or self._prepare_snapshot(snapshot()))
+            # Snapshot first: replaying a stale journal over it is harmless
+            atomic_write(self.journal_path, b'', self.fsync_policy != 'never')
+            self.journal_size = self.journal_end = 0
+            return
+        content = ''.join(json.dumps(r, separators=(',', ':')) + '\n' for r in records).encode()
+        with open(self.journal_path, 'ab') as f:
+            if f.tell() != self.journal_end:
+                # Drop a torn final line left by an interrupted append
+                f.truncate(self.journal_end)
+            f.write(content)
+            if self.fsync_policy == 'always' or (self.fsync_policy == 'batch' and len(records) > 1):
+                f.flush()
+                os.fsync(f.fileno())
+        self.journal_size += len(records)
+        self.journal_end += len(content)
+        self.bytes_written += len(content)
+
+    def _compacts(self, records: List[Dict], compact: bool) -> bool:
+        return compact or self.journal_size + len(records) >= JOURNAL_COMPACT_THRESHOLD
+
+    def recover(self) -> bool:
+        """Recover from a corrupted snapshot or journal.
+
+        A damaged journal is copied to ``<journal>.corrupt`` and cut back to
+        the records before the first unreadable line.
+        """
+        try:
+            super().load()
+        except json.JSONDecodeError:
+            restored = super().recover()
+            if not restored and os.path.exists(self.journal_path):
+                # Without a snapshot to replay onto, set the journal aside too
+                os.replace(self.journal_path, self.journal_path + '.corrupt')
+            return restored
+        import shutil
+        shutil.copy2(self.journal_path, self.journal_path + '.corrupt')
+        valid = []
+        with open(self.journal_path, 'rb') as f:
+            for line in f:
+                try:
+                    json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                valid.append(line)
+        atomic_write(self.journal_path, b''.join(valid), self.fsync_policy != 'never')
+        return True
+
+class SqliteStorage(Storage):
+    """Stores tasks in an SQLite database next to the JSON tasks file.
+
+    The database lives at ``<path stem>.db`` and uses WAL mode. When it is
+    first created, any existing JSON tasks file is migrated into it.
+    """
+
+    replays_records = False
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            description TEXT NOT NULL,
+            completed INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS tasks_completed ON tasks (completed, id);
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value);
+    """
+
+    SYNCHRONOUS = {'always': 'FULL', 'batch': 'NORMAL', 'never': 'OFF'}
+
+    def __init__(self, path: str, fsync_policy: Optional[str] = None) -> None:
+        self.path = path
+        self.db_path = os.path.splitext(path)[0] + '.db'
+        self.fsync_policy = fsync_policy or FSYNC_POLICY
+        self.conn = None
+        self.data_version = 0
+
+    def load(self) -> Tuple[Optional[Dict], List[Dict]]:
+        """Open the database, migrating the JSON file on first use."""
+        import sqlite3
+
+        if self.conn is None:
+            is_new = not os.path.exists(self.db_path)
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute(f'PRAGMA synchronous={self.SYNCHRONOUS[self.fsync_policy]}')
+            self.conn.executescript(self.SCHEMA)
+            if is_new and os.path.exists(self.path):
+                with open(self.path, 'rb') as f:
+                    self.migrate(decode_snapshot(f.read()))
+        row = self.conn.execute(
+            "SELECT value FROM meta WHERE key = 'current_task_id'"
+        ).fetchone()
+        self.data_version = self._data_version()
+        return {'current_task_id': row[0] if row else None}, []
+
+    def is_stale(self) -> bool:
+        """Return True if another connection committed since our last load.
+
+        SQLite's data version only moves for other connections' commits, so
+        our own saves don't count.
+        """
+        return self.conn is not None and self._data_version() != self.data_version
+
+    def _data_version(self) -> int:
+        return self.conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def migrate(self, data: Dict) -> None:
+        """Import the state of a JSON tasks file into the database."""
+        self.conn.executemany(
+            'INSERT OR REPLACE INTO tasks (id, description, completed) VALUES (?, ?, ?)',
+            ((t['id'], t['description'], int(t['completed'])) for t in data.get('tasks', []))
+        )
+        if data.get('next_id'):
+            # Keep IDs of tasks removed before the migration from being reused
+            seq = data['next_id'] - 1
+            updated = self.conn.execute(
+                "UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'tasks'", (seq,)
+            )
+            if not updated.rowcount:
+                self.conn.execute(
+                    "INSERT INTO sqlite_sequence (name, seq) VALUES ('tasks', ?)", (seq,)
+                )
+        self._set_current(data.get('current_task_id'))
+        self.conn.commit()
+
+    def build_store(self, data: Dict) -> SqliteTaskStore:
+        """Return a store that queries the database directly."""
+        return SqliteTaskStore(self.conn)
+
+    def rollback(self) -> None:
+        """Roll back the open database transaction."""
+        self.conn.rollback()
+
+    def save(self, records: List[Dict], snapshot: Callable[[], Dict],
+             compact: bool = False, prepared: Optional[Tuple] = None) -> None:
+        """Commit the changes the store already applied to the database."""
+        for record in records:
+            if 'current' in record:
+                self._set_current(record['current'])
+        self.conn.commit()
+
+    def state_signature(self) -> List:
+        """Identify the state by the database file and its write-ahead log."""
+        return [file_signature(self.db_path), file_signature(self.db_path + '-wal')]
+
+    def _set_current(self, task_id: Optional[int]) -> None:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('current_task_id', ?)",
+            (task_id,)
+        )
+
+class MmapStorage(Storage):
+    """Stores tasks as fixed-size records in a memory-mapped file.
+
+    Records live in ``<path stem>.mmap`` and descriptions in
+    ``<path stem>.heap`` (see ``MmapTaskStore``), so completing, editing
+    or removing a task is an in-place write of a few bytes. When the heap
+    is mostly unreferenced it is compacted in a background thread. An
+    existing JSON tasks file is imported on first use.
+    """
+
+    replays_records = False
+
+    def __init__(self, path: str, fsync_policy: Optional[str] = None) -> None:
+        self.path = path
+        stem = os.path.splitext(path)[0]
+        self.records_path = stem + '.mmap'
+        self.heap_path = stem + '.heap'
+        self.lock_path = path + '.lock'
+        self.fsync_policy = fsync_policy or FSYNC_POLICY
+        self.store: Optional[MmapTaskStore] = None
+        self.compaction: Optional[threading.Thread] = None
+        self.seen_commits = 0
+        self._lock = ReentrantFileLock(self.lock_path)
+
+    @property
+    def bytes_written(self) -> int:
+        """Bytes written to the record and heap files so far."""
+        return self.store.bytes_written if self.store is not None else 0
+
+    def load(self) -> Tuple[Optional[Dict], List[Dict]]:
+        """Map the record file, importing the JSON file on first use."""
+        if self.store is None:
+            is_new = not os.path.exists(self.records_path)
+            self.store = MmapTaskStore(self.records_path, self.heap_path, self.lock,
+                                       self._lock.hold, self._lock.release)
+            if is_new and os.path.exists(self.path):
+                with open(self.path, 'rb') as f:
+                    self.migrate(decode_snapshot(f.read()))
+        self.seen_commits = self.store.commits
+        return {'current_task_id': self.store.current}, []
+
+    def migrate(self, data: Dict) -> None:
+        """Import the state of a JSON tasks file into the record file."""
+        with self.lock():
+            for task in data.get('tasks', []):
+                self.store.insert(task)
+            if data.get('next_id', 0) > self.store.next_id:
+                # Reserve IDs of tasks removed before the migration
+                self.store.insert({'id': data['next_id'] - 1, 'description': '',
+                                   'completed': True})
+                self.store.remove(data['next_id'] - 1)
+            self.store.set_current(data.get('current_task_id'))
+            self.store.commit(self.fsync_policy != 'never')
+
+    def build_store(self, data: Dict) -> MmapTaskStore:
+        """Return the store that reads the mapping directly."""
+        return self.store
+
+    def lock(self) -> ContextManager:
+        """Hold ``<path>.lock``; re-entrant, as store writes lock it too."""
+        return self._lock()
+
+    def rollback(self) -> None:
+        """Undo the in-place writes made since the last save."""
+        self.store.rollback()
+
+    def is_stale(self) -> bool:
+        """Return True if another process committed since our last load."""
+        return self.store is not None and self.store.commits != self.seen_commits
+
+    def state_signature(self) -> List:
+        """Identify the state by both files plus the record file's header.
+
+        Writes through a shared mapping don't reliably update the mtime,
+        but every commit that changed anything bumps the header's count.
+        """
+        signature = [file_signature(self.records_path), file_signature(self.heap_path)]
+        try:
+            with open(self.records_path, 'rb') as f:
+                signature.append(f.read(MmapTaskStore.HEADER_SIZE).hex())
+        except FileNotFoundError:
+            signature.append(None)
+        return signature
+
+    def save(self, records: List[Dict], snapshot: Callable[[], Dict],
+             compact: bool = False, prepared: Optional[Tuple] = None) -> None:
+        """Commit the writes the store already made to the mapping."""
+        for record in records:
+            if 'current' in record:
+                self.store.set_current(record['current'])
+        fresh = not self.is_stale()
+        self.store.commit(self.fsync_policy == 'always'
+                          or (self.fsync_policy == 'batch' and len(records) > 1))
+        if fresh:
+            # Our own commit; another process's still calls for a reload
+            self.seen_commits = self.store.commits
+        if compact:
+            self.store.compact()
+        elif self.store.needs_compaction() and not (self.compaction and self.compaction.is_alive()):
+            # Non-daemon, so the process finishes compacting before it exits
+            self.compaction = threading.Thread(target=self.store.compact, name='tasknow-compact')
+            self.compaction.start()
+
+def open_storage(path: Optional[str] = None, backend: Optional[str] = None) -> Storage:
+    """Create the storage backend selected by ``TASKNOW_STORAGE``."""
+    path = path or TASKS_FILE
+    backend = backend or STORAGE_BACKEND
+    if FSYNC_POLICY not in FSYNC_POLICIES:
+        raise ValueError(f"Unknown fsync policy: {FSYNC_POLICY}")
+    if FILE_FORMAT not in SERIALIZERS:
+        raise ValueError(f"Unknown file format: {FILE_FORMAT}")
+    if backend == 'json':
+        return JsonStorage(path)
+    if backend == 'journal':
+        return JournalStorage(path)
+    if backend == 'sqlite':
+        return SqliteStorage(path)
+    if backend == 'mmap':
+        return MmapStorage(path)
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+class SearchIndex:
+    """Inverted index from lowercase words to the IDs of tasks containing them.
+
+    Built from the store on the first search and then kept up to date as
+    tasks are added, edited and removed, so a query only intersects the
+    ID sets of its words instead of scanning every description.
+    """
+
+    def __init__(self, tasks: Iterable[Dict] = ()) -> None:
+        self._postings: Dict[str, Set[int]] = {}
+        for task in tasks:
+            self.add(task['id'], task['description'])
+
+    @staticmethod
+    def tokenize(text: str) -> Set[str]:
+        """Split text into the set of lowercase words it contains."""
+        return set(re.findall(r'\w+', text.lower()))
+
+    def add(self, task_id: int, description: str) -> None:
+        """Index a task's description."""
+        for word in self.tokenize(description):
+            self._postings.setdefault(word, set()).add(task_id)
+
+    def remove(self, task_id: int, description: str) -> None:
+        """Drop a task's description from the index."""
+        for word in self.tokenize(description):
+            ids = self._postings.get(word)
+            if ids is not None:
+                ids.discard(task_id)
+                if not ids:
+                    del self._postings[word]
+
+    def search(self, query: str) -> List[int]:
+        """Return the IDs of tasks containing every word of the query, in order."""
+        words = self.tokenize(query)
+        if not words:
+            return []
+        postings = sorted((self._postings.get(word, set()) for word in words), key=len)
+        return sorted(postings[0].intersection(*postings[1:]))
+
+def _paginate(tasks: Iterator[Dict], limit: Optional[int], offset: int) -> Iterator[Dict]:
+    """Skip ``offset`` tasks and stop after ``limit`` without reading further."""
+    return itertools.islice(tasks, offset, None if limit is None else offset + limit)
+
+def _describe_ids(start: int, end: int) -> str:
+    return f"Task {start}" if start == end else f"Tasks {start}-{end}"
+
+def _report_ids(ids: Iterable[int], problem: str, plural_problem: Optional[str] = None) -> None:
+    """Print an error for the IDs, collapsing consecutive ones into ranges."""
+    ids = sorted(ids)
+    for _, run in itertools.groupby(enumerate(ids), lambda pair: pair[1] - pair[0]):
+        run = [task_id for _, task_id in run]
+        single = run[0] == run[-1]
+        print(f"Error: {_describe_ids(run[0], run[-1])} "
+              f"{problem if single or plural_problem is None else plural_problem}")
+
+def _count_tasks(count: int) -> str:
+    return f"{count} task" if count == 1 else f"{count} tasks"
+
+def _start_timer(delay: float, callback: Callable[[], None]) -> threading.Timer:
+    """Call ``callback`` after ``delay`` seconds on a daemon thread."""
+    timer = threading.Timer(delay, callback)
+    timer.daemon = True
+    timer.start()
+    return timer
+
+_unflushed_managers = None
+
+def _flush_at_exit(manager: 'TaskManager') -> None:
+    """Make sure changes a manager is holding back are written at exit."""
+    global _unflushed_managers
+    if _unflushed_managers is None:
+        import atexit
+        import weakref
+        _unflushed_managers = weakref.WeakSet()
+        atexit.register(lambda: [m.flush() for m in list(_unflushed_managers)])
+    _unflushed_managers.add(manager)
 
 class TaskManager:
-    """Manages tasks storage and operations."""
+    """Manages tasks storage and operations.
+
+    By default every mutation is saved straight away. Setting
+    ``commit_window`` (seconds) or ``commit_count`` (saves) enables group
+    commit: saves are held back and written together once the window has
+    passed or the count is reached, on ``flush()``, or at exit.
+    """
     
-    def __init__(self) -> None:
+    def __init__(self, storage: Optional[Storage] = None, commit_window: Optional[float] = None,
+                 commit_count: Optional[int] = None) -> None:
         """Initialize task manager and load tasks."""
-        self.tasks: List[Dict] = []
+        self.storage = storage or open_storage()
+        self.store = TaskStore()
         self.current_task_id: Optional[int] = None
+        self._records: List[Dict] = []
+        self._archive_removals: List[int] = []
+        self._saved_current_id: Optional[int] = None
+        self.write_count = 0
+        self.commit_window = COMMIT_WINDOW if commit_window is None else commit_window
+        self.commit_count = COMMIT_COUNT if commit_count is None else commit_count
+        # Called as scheduler(delay, callback); a resident mode can use its event loop
+        self.flush_scheduler: Callable[[float, Callable[[], None]], object] = _start_timer
+        self.save_requests = 0
+        self.coalesced_saves = 0
+        self._held_saves = 0
+        self._flush_timer = None
+        self._transaction_depth = 0
+        self._save_lock = threading.RLock()
+        # Long-lived processes keep a search index; a single query just scans
+        self.keep_index = False
+        self._index: Optional[SearchIndex] = None
+        self._index_signature: Optional[List] = None
         self._load_tasks()
 
+    @property
+    def tasks(self) -> List[Dict]:
+        """All tasks in the hot store, in ID order."""
+        return [task.to_dict() for task in self.store]
+
+    @tasks.setter
+    def tasks(self, tasks: List[Dict]) -> None:
+        self.store = TaskStore(tasks)
+
     def _load_tasks(self) -> None:
-        """Load tasks from JSON file or create new file if doesn't exist."""
-        try:
-            if os.path.exists(TASKS_FILE):
-                with open(TASKS_FILE, 'r') as f:
-                    data = json.load(f)
-                    self.tasks = data.get('tasks', [])
-                    self.current_task_id = data.get('current_task_id')
-                    # If no current task but incomplete tasks exist, set first one
-                    if self.current_task_id is None and self.tasks:
-                        first_incomplete = next(
-                            (t for t in self.tasks if not t['completed']),
-                            None
-                        )
-                        if first_incomplete:
-                            self.current_task_id = first_incomplete['id']
-            else:
-                self._save_tasks()
+        """Load tasks from storage, reporting the load to the metrics hooks."""
+        bytes_read = self.storage.bytes_read
+        with measure('load') as event:
+            self._read_tasks()
+            event['bytes_read'] = self.storage.bytes_read - bytes_read
+
+    def _read_tasks(self) -> None:
+        """Load tasks from storage, starting empty if nothing is stored yet."""
+        self._index = None
+        try:
+            data, records = self.storage.load()
+            data = data or {}
+            self.store = self.storage.build_store(data)
+            self.current_task_id = data.get('current_task_id')
+            for record in records:
+                self._replay(record)
+            self._saved_current_id = self.current_task_id
+            # If no current task but incomplete tasks exist, set first one
+            if self.current_task_id is None:
+                self.current_task_id = self.store.first_incomplete()
         except json.JSONDecodeError:
+            if self.storage.recover():
+                print("Error: Corrupted tasks file. Restored tasks from backup.")
+                self._load_tasks()
+                return
             print("Error: Corrupted tasks file. Starting with empty task list.")
-            self.tasks = []
+            self.store = TaskStore()
             self.current_task_id = None
+            self._records = []
+            self._save_tasks(compact=True)
+
+    def _snapshot(self) -> Dict:
+        """Return the full state as a JSON-serializable dict."""
+        if isinstance(self.store, LazyTaskStore) and not self.store.loaded:
+            # Pass the unparsed completed history through to the new snapshot
+            return {
+                'tasks': [task.to_dict() for task in self.store.parsed_tasks()],
+                'completed_section': self.store.completed_section,
+                'current_task_id': self.current_task_id,
+                'next_id': self.store.next_id
+            }
+        return {
+            'tasks': self.tasks,
+            'current_task_id': self.current_task_id,
+            'next_id': self.store.next_id
+        }
+
+    @contextmanager
+    def transaction(self) -> Iterator['TaskManager']:
+        """Group operations so they are persisted with a single save.
+
+        Saves requested inside the block are deferred until the outermost
+        transaction exits. If the block raises, pending changes are
+        discarded and the state is reloaded from storage.
+        """
+        self._transaction_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._transaction_depth -= 1
+            if not self._transaction_depth:
+                self.rollback()
+            raise
+        self._transaction_depth -= 1
+        if not self._transaction_depth:
             self._save_tasks()
 
-    def _save_tasks(self) -> None:
-        """Save tasks to JSON file."""
-        with open(TASKS_FILE, 'w') as f:
-            json.dump({
-                'tasks': self.tasks,
-                'current_task_id': self.current_task_id
-            }, f, indent=2)
+    def rollback(self) -> None:
+        """Discard unsaved changes and reload the stored state."""
+        self._records = []
+        self._archive_removals = []
+        self._held_saves = 0
+        self._cancel_flush_timer()
+        self.storage.rollback()
+        self._load_tasks()
+
+    def _save_tasks(self, compact: bool = False) -> None:
+        """Persist pending changes, skipping the write if nothing changed.
+
+        Under group commit the write may be held back and folded into a
+        later one.
+        """
+        if self._transaction_depth:
+            return
+        with self._save_lock:
+            if not (compact or self._has_changes()):
+                return
+            self.save_requests += 1
+            if not compact and self._hold_back():
+                return
+            self._write(compact)
+
+    def flush(self) -> None:
+        """Write any changes held back by group commit."""
+        with self._save_lock:
+            self._cancel_flush_timer()
+            if not self._transaction_depth and self._has_changes():
+                self._write()
+
+    def commit_stats(self) -> Dict[str, int]:
+        """Return how many saves were requested, written and coalesced."""
+        return {
+            'save_requests': self.save_requests,
+            'writes': self.write_count,
+            'coalesced': self.coalesced_saves,
+        }
+
+    def _has_changes(self) -> bool:
+        return bool(self._records) or self.current_task_id != self._saved_current_id
+
+    def _hold_back(self) -> bool:
+        """Return True if group commit defers this save to a later write."""
+        if self.commit_window <= 0 and self.commit_count <= 0:
+            return False
+        self._held_saves += 1
+        if 0 < self.commit_count <= self._held_saves:
+            return False
+        self.coalesced_saves += 1
+        if self.commit_window > 0 and self._flush_timer is None:
+            self._flush_timer = self.flush_scheduler(self.commit_window, self.flush)
+        _flush_at_exit(self)
+        return True
+
+    def _cancel_flush_timer(self) -> None:
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+
+    def _write(self, compact: bool = False) -> None:
+        """Write the queued records, merging in other processes' changes."""
+        bytes_written = self.storage.bytes_written
+        with measure('save') as event:
+            self._cancel_flush_timer()
+            self._held_saves = 0
+            records, self._records = self._records, []
+            if self.current_task_id != self._saved_current_id:
+                # Piggyback the new current task on the last record if possible
+                if records:
+                    records[-1]['current'] = self.current_task_id
+                else:
+                    records.append({'op': 'current', 'current': self.current_task_id})
+            # Serialize and flush a full snapshot before taking the file lock, so
+            # the lock only covers the version check and the rename
+            prepared = None
+            if not self._should_archive():
+                prepared = self.storage.prepare(records, self._snapshot, compact)
+            try:
+                with self.storage.lock():
+                    # Write-through stores already hold everyone's changes; only snapshots merge
+                    if self.storage.replays_records and self.storage.is_stale():
+                        # Another process saved first: merge and save again, under the lock
+                        self.storage.discard(prepared)
+                        prepared = None
+                        records = self._rebase(records)
+                    if prepared is None and self._should_archive():
+                        self._archive_completed()
+                        compact = True
+                    self.storage.save(records, self._snapshot, compact, prepared)
+                    prepared = None
+                    # Restored tasks leave the archive only once the hot store has them
+                    removals, self._archive_removals = self._archive_removals, []
+                    if removals:
+                        self.storage.archive.remove_many(set(removals))
+                    if self._index is not None:
+                        # The index already has our changes; only others' should rebuild it
+                        self._index_signature = self.storage.state_signature()
+            finally:
+                self.storage.discard(prepared)
+            self._saved_current_id = self.current_task_id
+            self.write_count += 1
+            event['records'] = len(records)
+            event['bytes_written'] = self.storage.bytes_written - bytes_written
+
+    def _rebase(self, records: List[Dict]) -> List[Dict]:
+        """Reload the latest stored state and re-apply unsaved records.
+
+        Tasks we added get fresh IDs if another process took theirs in the
+        meantime; later records referring to them are renumbered to match.
+        The current task is re-derived from the merged state.
+        """
+        self._load_tasks()
+        new_ids: Dict[int, int] = {}
+        rebased = []
+        for record in records:
+            record = dict(record)
+            record.pop('current', None)
+            if record['op'] == 'add':
+                new_ids[record['id']] = self.store.next_id
+            if 'id' in record:
+                record['id'] = new_ids.get(record['id'], record['id'])
+            self._replay(record)
+            if record['op'] == 'undone':
+                self.current_task_id = record['id']
+            rebased.append(record)
+        current = self.store.get(self.current_task_id) if self.current_task_id is not None else None
+        if current is None or current['completed']:
+            self.current_task_id = self.store.first_incomplete()
+        if rebased:
+            rebased[-1]['current'] = self.current_task_id
+        return rebased
+
+    def _should_archive(self) -> bool:
+        """Return True once the hot store holds too many completed tasks."""
+        return (self.storage.archive is not None and ARCHIVE_THRESHOLD > 0
+                and self.store.completed_count() > ARCHIVE_THRESHOLD)
+
+    def _archive_completed(self) -> None:
+        """Move every completed task from the hot store into a new archive segment.
+
+        The segment is written before the snapshot that drops the tasks, so
+        a crash in between leaves them in both places rather than neither.
+        """
+        tasks = [task.to_dict() for task in self.store.iter_completed()]
+        self.storage.archive.add_segment(tasks)
+        for task in tasks:
+            self.store.remove(task['id'])
+
+    def _get_task(self, task_id: int) -> Optional[Dict]:
+        """Return a task, moving it back into the hot store if it was archived."""
+        task = self.store.get(task_id)
+        if task is None and self.storage.archive is not None:
+            task = self.storage.archive.get(task_id)
+            if task is not None:
+                self._restore(task)
+        return task
+
+    def _restore(self, task: Dict) -> None:
+        """Move an archived task back into the hot store."""
+        self.store.insert(task)
+        self._record('restore', task['id'], description=task['description'],
+                     completed=task['completed'])
+        if self._index is not None:
+            self._index.add(task['id'], task['description'])
+        self._archive_removals.append(task['id'])
+
+    def _select_tasks(self, task_ids: Optional[Iterable[int]] = None,
+                      completed: bool = False) -> List[Task]:
+        """Return the tasks with the given IDs, or every completed task, in ID order.
+
+        With both, only completed tasks among the IDs are returned. Matching
+        archived tasks are restored to the hot store, in one pass over the
+        archive.
+        """
+        wanted = None if task_ids is None else set(task_ids)
+        missing: Set[int] = set()
+        if wanted is None:
+            tasks = list(self.store.iter_completed()) if completed else []
+        else:
+            found = [task for task in map(self.store.get, sorted(wanted)) if task is not None]
+            missing = wanted.difference(task.id for task in found)
+            tasks = [task for task in found if task.completed or not completed]
+        searching = completed if wanted is None else bool(missing)
+        if searching and self.storage.archive is not None:
+            restored = [task for task in self.storage.archive.iter_tasks()
+                        if (wanted is None or task['id'] in missing)
+                        and self.store.get(task['id']) is None]
+            for task in restored:
+                self._restore(task)
+                missing.discard(task['id'])
+            tasks.extend(self.store.get(task['id']) for task in restored)
+            tasks.sort(key=lambda task: task.id)
+        _report_ids(missing, "not found")
+        return tasks
+
+    def _record(self, op: str, task_id: int, **fields) -> None:
+        """Queue a journal record describing a mutation."""
+        self._records.append({'op': op, 'id': task_id, **fields})
+
+    def _replay(self, record: Dict) -> None:
+        """Apply a journal record to the in-memory state."""
+        op = record['op']
+        task = self.store.get(record['id']) if 'id' in record else None
+        if op == 'add':
+            self.store.insert({
+                'id': record['id'],
+                'description': record['description'],
+                'completed': record.get('completed', False)
+            })
+        elif op == 'edit' and task is not None:
+            self.store.set_description(task['id'], record['description'])
+        elif op in ('done', 'undone') and task is not None:
+            self.store.set_completed(task['id'], op == 'done')
+        elif op == 'remove':
+            self.store.remove(record['id'])
+        elif op == 'restore':
+            self.store.insert({
+                'id': record['id'],
+                'description': record['description'],
+                'completed': record['completed']
+            })
+        if 'current' in record:
+            self.current_task_id = record['current']
 
     def add_task(self, description: str) -> None:
         """Add a new task with auto-incrementing ID."""
-        new_id = max((task['id'] for task in self.tasks), default=0) + 1
-        self.tasks.append({
-            'id': new_id,
-            'description': description,
-            'completed': False
-        })
+        task = self.store.add(description)
+        self._record('add', task['id'], description=description)
+        if self._index is not None:
+            self._index.add(task['id'], description)
         if self.current_task_id is None:
-            self.current_task_id = new_id
+            self.current_task_id = task['id']
         self._save_tasks()
 
     def complete_current_task(self) -> None:
         """Mark current task as completed."""
+        # The current task is always the earliest incomplete one, as shown by
+        # ``get_current_task``, whatever was last stored
+        self.current_task_id = self.store.first_incomplete()
         if self.current_task_id is None:
             print("No current task to complete")
             return
-            
-        for task in self.tasks:
-            if task['id'] == self.current_task_id:
-                task_description = task['description']
-                task['completed'] = True
-                # Find next incomplete task if available
-                next_task = next(
-                    (t for t in self.tasks if not t['completed'] and t['id'] != self.current_task_id),
-                    None
-                )
-                self.current_task_id = next_task['id'] if next_task else None
-                self._save_tasks()
-                print(f"Completed task: {task_description}")
-                return
-        print("Error: Current task not found")
+
+        task = self.store.get(self.current_task_id)
+        self.store.set_completed(task['id'], True)
+        self._record('done', task['id'])
+        # Next incomplete task is the earliest one left, if any
+        self.current_task_id = self.store.first_incomplete()
+        self._save_tasks()
+        print(f"Completed task: {task['description']}")
 
     def edit_task(self, task_id: int, new_description: str) -> None:
         """Edit a task's description."""
-        for task in self.tasks:
-            if task['id'] == task_id:
-                task['description'] = new_description
-                self._save_tasks()
-                return
-        print(f"Error: Task {task_id} not found")
+        task = self._get_task(task_id)
+        if task is None:
+            print(f"Error: Task {task_id} not found")
+            return
+        if self._index is not None:
+            self._index.remove(task_id, task['description'])
+            self._index.add(task_id, new_description)
+        self.store.set_description(task_id, new_description)
+        self._record('edit', task_id, description=new_description)
+        self._save_tasks()
 
     def get_current_task(self) -> Optional[Dict]:
         """Get current active task (always earliest incomplete)."""
-        incomplete = sorted(
-            [t for t in self.tasks if not t['completed']],
-            key=lambda x: x['id']
-        )
-        
-        if not incomplete:
-            self.current_task_id = None
-            self._save_tasks()
+        # Always use earliest incomplete task. The current task is derived
+        # state, so a change here is persisted with the next mutation
+        # rather than costing a write on a read-only command.
+        self.current_task_id = self.store.first_incomplete()
+        if self.current_task_id is None:
             return None
-            
-        # Always use earliest incomplete task
-        if self.current_task_id != incomplete[0]['id']:
-            self.current_task_id = incomplete[0]['id']
-            self._save_tasks()
-            
-        return next(
-            (t for t in self.tasks if t['id'] == self.current_task_id),
-            None
-        )
+        return self.store.get(self.current_task_id).to_dict()
 
     def list_tasks(self) -> List[Dict]:
         """Get all incomplete tasks."""
-        return [task for task in self.tasks if not task['completed']]
+        return list(self.iter_tasks())
+
+    def iter_tasks(self, limit: Optional[int] = None, offset: int = 0,
+                   since_id: Optional[int] = None) -> Iterator[Dict]:
+        """Yield incomplete tasks lazily, optionally paged."""
+        return _paginate(map(Task.to_dict, self.store.iter_incomplete(since_id)), limit, offset)
 
     def remove_task(self, task_id: int) -> None:
         """Remove a task by ID."""
-        for i, task in enumerate(self.tasks):
-            if task['id'] == task_id:
-                if self.current_task_id == task_id:
-                    # Find next incomplete task if available
-                    next_task = next(
-                        (t for t in self.tasks
-                         if not t['completed'] and t['id'] != task_id),
-                        None
-                    )
-                    self.current_task_id = next_task['id'] if next_task else None
-                del self.tasks[i]
-                self._save_tasks()
-                return
-        print(f"Error: Task {task_id} not found")
+        task = self._get_task(task_id)
+        if task is None:
+            print(f"Error: Task {task_id} not found")
+            return
+        if self._index is not None:
+            self._index.remove(task_id, task['description'])
+        self.store.remove(task_id)
+        self._record('remove', task_id)
+        if self.current_task_id == task_id:
+            # Find next incomplete task if available
+            self.current_task_id = self.store.first_incomplete()
+        self._save_tasks()
 
     def list_completed_tasks(self) -> List[Dict]:
         """Get all completed tasks."""
-        return [task for task in self.tasks if task['completed']]
+        return list(self.iter_completed_tasks())
+
+    def iter_completed_tasks(self, limit: Optional[int] = None, offset: int = 0,
+                             since_id: Optional[int] = None) -> Iterator[Dict]:
+        """Yield completed tasks lazily, optionally paged.
+
+        Archived tasks are merged in by ID, read from the archive only as
+        far as the page needs.
+        """
+        tasks = map(Task.to_dict, self.store.iter_completed(since_id))
+        if self.storage.archive is not None:
+            # A task restored to the hot store shadows its archived copy
+            archived = (task for task in self.storage.archive.iter_tasks(since_id)
+                        if self.store.get(task['id']) is None)
+            tasks = heapq.merge(archived, tasks, key=lambda t: t['id'])
+        return _paginate(tasks, limit, offset)
+
+    def search_tasks(self, query: str, include_completed: bool = False) -> List[Dict]:
+        """Find tasks whose description contains every word of the query.
+
+        Completed tasks, including archived ones, are searched only if
+        ``include_completed`` is set. Only a manager with ``keep_index`` set
+        builds a ``SearchIndex``; others scan the tasks.
+        """
+        words = SearchIndex.tokenize(query)
+        if not self.keep_index:
+            # A one-off query reads each task once anyway; indexing would read
+            # them all, completed history included, just to answer it
+            candidates = self.store if include_completed else self.store.iter_incomplete()
+            tasks = [task.to_dict() for task in candidates
+                     if words and words <= SearchIndex.tokenize(task.description)]
+            tasks.sort(key=lambda t: t['id'])
+        else:
+            signature = self.storage.state_signature()
+            if self._index is None or signature != self._index_signature:
+                # Built anew if another process changed the stored state since
+                self._index = SearchIndex(self.store)
+                self._index_signature = signature
+            tasks = []
+            for task_id in self._index.search(query):
+                task = self.store.get(task_id)
+                if task is not None and (include_completed or not task['completed']):
+                    tasks.append(task.to_dict())
+        if include_completed and self.storage.archive is not None:
+            tasks.extend(task for task in self.storage.archive.iter_tasks()
+                         if words and words <= SearchIndex.tokenize(task['description'])
+                         and self.store.get(task['id']) is None)
+            tasks.sort(key=lambda t: t['id'])
+        return tasks
 
     def reopen_task(self, task_id: int) -> None:
         """Reopen a completed task and make it current."""
-        for task in self.tasks:
-            if task['id'] == task_id:
-                if not task['completed']:
-                    print(f"Error: Task {task_id} is not completed")
-                    return
-                task['completed'] = False
-                self.current_task_id = task_id
-                self._save_tasks()
-                return
-        print(f"Error: Task {task_id} not found")
+        task = self._get_task(task_id)
+        if task is None:
+            print(f"Error: Task {task_id} not found")
+            return
+        if not task['completed']:
+            print(f"Error: Task {task_id} is not completed")
+            return
+        self.store.set_completed(task_id, False)
+        self._record('undone', task_id)
+        self.current_task_id = task_id
+        self._save_tasks()
+
+    def complete_tasks(self, task_ids: Iterable[int]) -> int:
+        """Mark the given tasks completed with a single save; return how many changed."""
+        with self.transaction():
+            selected = self._select_tasks(task_ids)
+            _report_ids((task.id for task in selected if task.completed),
+                        "is already completed", "are already completed")
+            tasks = [task for task in selected if not task.completed]
+            for task in tasks:
+                self.store.set_completed(task.id, True)
+                self._record('done', task.id)
+            self.current_task_id = self.store.first_incomplete()
+        return len(tasks)
+
+    def reopen_tasks(self, task_ids: Optional[Iterable[int]] = None,
+                     completed: bool = False) -> int:
+        """Reopen the given (or all completed) tasks with a single save.
+
+        The earliest reopened task becomes current. Returns how many were
+        reopened.
+        """
+        with self.transaction():
+            selected = self._select_tasks(task_ids, completed)
+            _report_ids((task.id for task in selected if not task.completed),
+                        "is not completed", "are not completed")
+            tasks = [task for task in selected if task.completed]
+            for task in tasks:
+                self.store.set_completed(task.id, False)
+                self._record('undone', task.id)
+            if tasks:
+                self.current_task_id = tasks[0].id
+        return len(tasks)
+
+    def edit_tasks(self, task_ids: Iterable[int], new_description: str) -> int:
+        """Give the given tasks a new description with a single save; return how many."""
+        with self.transaction():
+            tasks = self._select_tasks(task_ids)
+            for task in tasks:
+                if self._index is not None:
+                    self._index.remove(task.id, task.description)
+                    self._index.add(task.id, new_description)
+                self.store.set_description(task.id, new_description)
+                self._record('edit', task.id, description=new_description)
+        return len(tasks)
+
+    def remove_tasks(self, task_ids: Optional[Iterable[int]] = None,
+                     completed: bool = False) -> int:
+        """Remove the given (or all completed) tasks with a single save; return how many."""
+        with self.transaction():
+            tasks = self._select_tasks(task_ids, completed)
+            for task in tasks:
+                if self._index is not None:
+                    self._index.remove(task.id, task.description)
+                self.store.remove(task.id)
+                self._record('remove', task.id)
+            if any(task.id == self.current_task_id for task in tasks):
+                self.current_task_id = self.store.first_incomplete()
+        return len(tasks)
+
+    def import_tasks(self, tasks: Iterable[Dict]) -> int:
+        """Add tasks in bulk under new IDs with a single save.
+
+        Each task needs a ``description`` and may be ``completed``; any
+        ``id`` it carries is ignored. Returns the number of tasks added.
+        If ``tasks`` raises, nothing is imported.
+        """
+        count = 0
+        replays = self.storage.replays_records
+        with self.transaction():
+            for task in tasks:
+                added = self.store.add(task['description'])
+                fields = {'description': added.description}
+                if task.get('completed'):
+                    self.store.set_completed(added.id, True)
+                    fields['completed'] = True
+                if replays:
+                    self._record('add', added.id, **fields)
+                count += 1
+            if count and not replays:
+                # The store holds the rows already; one record is enough to save them
+                self._record('add', added.id, **fields)
+            # Cheaper to rebuild on the next search than to update per task
+            self._index = None
+            if self.current_task_id is None:
+                self.current_task_id = self.store.first_incomplete()
+        return count
+
+    def iter_all_tasks(self) -> Iterator[Dict]:
+        """Yield every task in ID order, archived ones included, without building a list."""
+        tasks = map(Task.to_dict, self.store)
+        if self.storage.archive is not None:
+            archived = (task for task in self.storage.archive.iter_tasks()
+                        if self.store.get(task['id']) is None)
+            tasks = heapq.merge(archived, tasks, key=lambda t: t['id'])
+        return tasks
+
+class ListRegistry:
+    """Named task lists, each kept in its own tasks file.
+
+    The registry is a JSON file (``TASKNOW_REGISTRY``) mapping list names to
+    tasks files. It also caches a small summary of every list, its current
+    task and number of open tasks, together with the storage's state
+    signature, so cross-list queries only load the lists that changed
+    since they were last summarized.
+    """
+
+    NAME = re.compile(r'[\w.-]+')
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = path or REGISTRY_FILE
+        self.lock_path = self.path + '.lock'
+
+    def _read(self) -> Dict:
+        try:
+            with open(self.path, 'rb') as f:
+                return json.loads(f.read())
+        except FileNotFoundError:
+            return {'lists': {}}
+
+    @contextmanager
+    def _update(self) -> Iterator[Dict]:
+        """Read, modify and atomically rewrite the registry under its lock."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with file_lock(self.lock_path):
+            data = self._read()
+            yield data
+            atomic_write(self.path, json.dumps(data, indent=2).encode(), FSYNC_POLICY != 'never')
+
+    def names(self) -> List[str]:
+        """Return the registered list names in sorted order."""
+        return sorted(self._read()['lists'])
+
+    def tasks_file(self, name: str) -> str:
+        """Return the tasks file of a registered list."""
+        entry = self._read()['lists'].get(name)
+        if entry is None:
+            raise ValueError(f"No such list: {name}")
+        return entry['path']
+
+    def add(self, name: str, path: Optional[str] = None) -> str:
+        """Register a list and return its tasks file.
+
+        Without a path the list gets a new file next to the registry.
+        """
+        if not self.NAME.fullmatch(name):
+            raise ValueError(f"Invalid list name: {name}")
+        directory = os.path.dirname(os.path.abspath(self.path))
+        path = os.path.abspath(path or os.path.join(directory, name + '.json'))
+        with self._update() as data:
+            if name in data['lists']:
+                raise ValueError(f"List already exists: {name}")
+            data['lists'][name] = {'path': path}
+        return path
+
+    def remove(self, name: str) -> None:
+        """Unregister a list, leaving its tasks file in place."""
+        with self._update() as data:
+            if data['lists'].pop(name, None) is None:
+                raise ValueError(f"No such list: {name}")
+
+    def summaries(self) -> Dict[str, Dict]:
+        """Return each list's current task and open task count by name."""
+        summaries, refreshed = {}, {}
+        for name, entry in sorted(self._read()['lists'].items()):
+            storage = open_storage(entry['path'])
+            # Round-trip through JSON so tuples compare equal to the cached lists
+            signature = json.loads(json.dumps(storage.state_signature()))
+            summary = entry.get('summary')
+            if summary is None or summary['signature'] != signature:
+                summary = self._summarize(storage)
+                summary['signature'] = signature
+                refreshed[name] = summary
+            summaries[name] = summary
+        if refreshed:
+            with self._update() as data:
+                for name, summary in refreshed.items():
+                    if name in data['lists']:
+                        data['lists'][name]['summary'] = summary
+        return summaries
+
+    @staticmethod
+    def _summarize(storage: Storage) -> Dict:
+        manager = TaskManager(storage)
+        current = manager.store.get(manager.current_task_id) if manager.current_task_id else None
+        return {
+            'current': current.description if current else None,
+            'open': sum(1 for _ in manager.store.iter_incomplete()),
+        }
+
+def build_parser(command: Optional[str] = None) -> 'argparse.ArgumentParser':
+    """Build the command line parser.
+
+    Given the ``command`` about to run, only that subcommand is registered,
+    as creating a parser for every other one costs more than parsing.
+    ``help`` and ``batch``, which need the others, and unknown commands get
+    the full parser.
+    """
+    import argparse
+
+    full = command not in COMMANDS or command in ('help', 'batch')
+
+    def wanted(name: str) -> bool:
+        return full or name == command
 
-def main() -> None:
-    """Handle CLI commands and execute appropriate actions."""
     parser = argparse.ArgumentParser(
         description='TaskNow - Minimalist Task Manager',
         epilog='If no command is provided, defaults to showing the current task.'
     )
+    parser.add_argument('--timings', action='store_true',
+                        help='Print how long each phase took to stderr')
+    parser.add_argument('--profile', metavar='FILE', help='Write cProfile stats to FILE')
+    parser.add_argument('--list', metavar='NAME',
+                        help='Use a named task list instead of tasks.json in this directory')
     subparsers = parser.add_subparsers(dest='command')
-    
+
     # Help command
-    subparsers.add_parser('help', help='Show help message')
+    if wanted('help'):
+        subparsers.add_parser('help', help='Show help message')
 
     # Show current task
-    subparsers.add_parser('show', help='Show current task')
+    if wanted('show'):
+        subparsers.add_parser('show', help='Show current task')
 
     # Add new task
-    add_parser = subparsers.add_parser('add', help='Add a new task (requires description)')
-    add_parser.add_argument('description', nargs='*', help='Task description (no quotes needed)')
+    if wanted('add'):
+        add_parser = subparsers.add_parser('add', help='Add a new task (requires description)')
+        add_parser.add_argument('description', nargs='*', help='Task description (no quotes needed)')
 
     # Complete current task
-    subparsers.add_parser('done', help='Mark current task as done (no arguments)')
+    if wanted('done'):
+        done_parser = subparsers.add_parser('done', help='Mark current task (or the given tasks) as done')
+        done_parser.add_argument('ids', nargs='*', type=task_id_spec,
+                                 help='Task IDs or ranges, e.g. 3 7 10-20')
+
+    # Paging options shared by the listing commands
+    paging_parser = argparse.ArgumentParser(add_help=False)
+    paging_parser.add_argument('--limit', type=count_arg, help='Show at most this many tasks')
+    paging_parser.add_argument('--offset', type=count_arg, default=0, help='Skip this many tasks first')
+    paging_parser.add_argument('--since-id', type=count_arg, help='Only show tasks with a higher ID')
 
     # List all tasks
-    subparsers.add_parser('list', help='List all tasks (no arguments)')
+    if wanted('list'):
+        subparsers.add_parser('list', help='List all tasks', parents=[paging_parser])
 
     # List completed tasks
-    subparsers.add_parser('completed', help='List completed tasks (no arguments)')
+    if wanted('completed'):
+        subparsers.add_parser('completed', help='List completed tasks', parents=[paging_parser])
+
+    # Search tasks
+    if wanted('search'):
+        search_parser = subparsers.add_parser('search', help='Find tasks containing all the given words')
+        search_parser.add_argument('terms', nargs='+', help='Words to search for')
+        search_parser.add_argument('-a', '--all', action='store_true', help='Include completed tasks')
+
+    # Select tasks by IDs and ranges, or all completed ones
+    selection_parser = argparse.ArgumentParser(add_help=False)
+    selection_parser.add_argument('ids', nargs='*', type=task_id_spec,
+                                  help='Task IDs or ranges, e.g. 3 7 10-20')
+    selection_parser.add_argument('--completed', action='store_true',
+                                  help='Select every completed task (with IDs: only the completed ones)')
 
     # Remove task
-    remove_parser = subparsers.add_parser('remove', help='Remove a task (requires ID)')
-    remove_parser.add_argument('id', type=int, help='Task ID to remove')
+    if wanted('remove'):
+        subparsers.add_parser('remove', help='Remove tasks (requires IDs or --completed)',
+                              parents=[selection_parser])
 
     # Mark task as undone
-    undone_parser = subparsers.add_parser('undone', help='Mark a completed task as undone (requires ID)')
-    undone_parser.add_argument('id', type=int, help='Task ID to mark as undone')
+    if wanted('undone'):
+        subparsers.add_parser('undone', help='Mark completed tasks as undone (requires IDs or --completed)',
+                              parents=[selection_parser])
 
     # Edit task
-    edit_parser = subparsers.add_parser('edit', help='Edit a task description (requires ID and new description)')
-    edit_parser.add_argument('id', type=int, help='Task ID to edit')
-    edit_parser.add_argument('new_description', nargs='*', help='New task description')
+    if wanted('edit'):
+        edit_parser = subparsers.add_parser('edit', help='Edit a task description (requires ID and new description)')
+        edit_parser.add_argument('ids', type=task_id_spec,
+                                 help='Task ID, or IDs and ranges separated by commas')
+        edit_parser.add_argument('new_description', nargs='*', help='New task description')
 
-    args = parser.parse_args()
-    if args.command is None:
-        args.command = 'show'
-    manager = TaskManager()
+    # Move tasks in and out in bulk
+    if wanted('import'):
+        import_parser = subparsers.add_parser('import', help='Add tasks from an NDJSON or CSV file')
+        import_parser.add_argument('file', nargs='?', default='-', help='File to read (default: stdin)')
+        import_parser.add_argument('--format', choices=EXCHANGE_FORMATS,
+                                   help='Input format (default: from the file name, else ndjson)')
+    if wanted('export'):
+        export_parser = subparsers.add_parser('export', help='Write every task as NDJSON or CSV')
+        export_parser.add_argument('file', nargs='?', default='-', help='File to write (default: stdout)')
+        export_parser.add_argument('--format', choices=EXCHANGE_FORMATS,
+                                   help='Output format (default: from the file name, else ndjson)')
+
+    # Manage named task lists
+    if wanted('lists'):
+        lists_parser = subparsers.add_parser('lists', help='Show the current task in every named list')
+        lists_subparsers = lists_parser.add_subparsers(dest='lists_command')
+        lists_add_parser = lists_subparsers.add_parser('add', help='Register a named list')
+        lists_add_parser.add_argument('name', help='List name')
+        lists_add_parser.add_argument('path', nargs='?',
+                                      help='Existing tasks file (default: a new file next to the registry)')
+        lists_remove_parser = lists_subparsers.add_parser('remove', help='Unregister a named list')
+        lists_remove_parser.add_argument('name', help='List name')
+
+    # Keep tasks in memory and serve other invocations
+    if wanted('daemon'):
+        subparsers.add_parser('daemon', help='Serve commands from memory over a local socket')
+
+    # Print the current task again whenever it changes
+    if wanted('watch'):
+        watch_parser = subparsers.add_parser('watch', help='Print the current task whenever it changes')
+        watch_parser.add_argument('--json', action='store_true',
+                                  help='Print a JSON event for every change instead')
+        watch_parser.add_argument('--count', type=count_arg, help='Exit after printing this many lines')
+        watch_parser.add_argument('--timeout', type=float, help='Exit after this many seconds')
+
+    # Run many commands with a single save
+    if wanted('batch'):
+        batch_parser = subparsers.add_parser('batch', help='Run commands from a file or stdin, one per line')
+        batch_parser.add_argument('file', nargs='?', default='-', help='File of commands (default: stdin)')
+
+    return parser
+
+COMMANDS = ('help', 'show', 'add', 'done', 'list', 'completed', 'search', 'remove', 'undone',
+            'edit', 'import', 'export', 'lists', 'daemon', 'watch', 'batch')
+
+# Top-level options that take a value, which is not the command name
+_VALUE_OPTIONS = ('--profile', '--list')
 
+def command_name(argv: List[str]) -> Optional[str]:
+    """Return the command an argument list names, or None if it names none."""
+    args = iter(argv)
+    for arg in args:
+        if arg in _VALUE_OPTIONS:
+            next(args, None)
+        elif not arg.startswith('-'):
+            return arg
+    return None
+
+EXCHANGE_FORMATS = ('ndjson', 'csv')
+
+def exchange_format(path: str, name: Optional[str] = None) -> str:
+    """Return the import/export format given, or the one implied by the file name."""
+    return name or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+
+def _task_row(row, number: int) -> Dict:
+    if not isinstance(row, dict) or not isinstance(row.get('description'), str):
+        raise ValueError(f"Invalid task on line {number}")
+    return {'description': row['description'], 'completed': bool(row.get('completed', False))}
+
+def read_ndjson_tasks(f: BinaryIO) -> Iterator[Dict]:
+    """Parse tasks from NDJSON, a chunk of lines at a time."""
+    number = 0
+    for chunk in iter(lambda: list(itertools.islice(f, IMPORT_CHUNK_SIZE)), []):
+        lines = [(n, line.rstrip(b'\r\n')) for n, line in enumerate(chunk, number + 1)
+                 if line.strip()]
+        number += len(chunk)
+        try:
+            rows = parse_lines(b'\n'.join(line for _, line in lines))
+        except json.JSONDecodeError:
+            rows = None
+        if rows is None or len(rows) != len(lines):
+            # Parse line by line to find the bad one
+            rows = []
+            for n, line in lines:
+                try:
+                    rows.append(_task_row(json.loads(line), n))
+                except json.JSONDecodeError:
+                    raise ValueError(f"Invalid task on line {n}")
+        for (n, _), row in zip(lines, rows):
+            yield _task_row(row, n)
+
+def read_csv_tasks(f: TextIO) -> Iterator[Dict]:
+    """Parse tasks from CSV with a ``description`` and optional ``completed`` column."""
+    import csv
+
+    reader = csv.DictReader(f)
+    if 'description' not in (reader.fieldnames or []):
+        raise ValueError("CSV input needs a description column")
+    for row in reader:
+        completed = (row.get('completed') or '').strip().lower()
+        yield {'description': row['description'] or '',
+               'completed': completed in ('1', 'true', 'yes', 'x', '✓')}
+
+def format_tasks(tasks: Iterable[Dict], fmt: str) -> Iterator[str]:
+    """Yield tasks as NDJSON lines, or as CSV rows after a header."""
+    if fmt == 'ndjson':
+        for task in tasks:
+            yield json.dumps(task, ensure_ascii=False, separators=(',', ':'))
+        return
+    import csv
+    import io
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='')
+    yield 'id,description,completed'
+    for task in tasks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow((task['id'], task['description'], 'true' if task['completed'] else 'false'))
+        yield buffer.getvalue()
+
+def write_lines(lines: Iterable[str], chunk_size: int = OUTPUT_CHUNK_SIZE,
+                stream: Optional[TextIO] = None) -> int:
+    """Write lines in large chunks and return how many were written.
+
+    Writes to stdout unless another stream is given. If the reader goes
+    away (e.g. ``tasknow completed | head``) output stops quietly instead
+    of formatting the remaining lines.
+    """
+    stream = stream or sys.stdout
+    count = 0
+    lines = iter(lines)
     try:
-        if args.command == 'show':
-            current = manager.get_current_task()
-            if current:
-                print(f"Current task: {current['description']}")
-            else:
-                print("No current task")
+        for chunk in iter(lambda: list(itertools.islice(lines, chunk_size)), []):
+            stream.write('\n'.join(chunk) + '\n')
+            count += len(chunk)
+        stream.flush()
+    except BrokenPipeError:
+        # Point the stream at devnull so the interpreter's final flush can't fail
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, stream.fileno())
+        os.close(devnull)
+    return count
+
+def count_arg(value: str) -> int:
+    """Argparse type accepting a whole number of zero or more."""
+    import argparse
+
+    if not value.isdigit():
+        raise argparse.ArgumentTypeError(f"Expected a number of 0 or more: {value}")
+    return int(value)
+
+TASK_ID_SPEC = re.compile(r'\d+(-\d+)?(,\d+(-\d+)?)*')
 
-        elif args.command == 'add':
-            description = ' '.join(args.description)
-            manager.add_task(description)
-            print(f"Added task: {description}")
+def _task_id_ranges(spec: str) -> List[Tuple[int, int]]:
+    """Split an ID spec into inclusive (start, end) pairs, rejecting reversed ranges."""
+    if not TASK_ID_SPEC.fullmatch(spec):
+        raise ValueError(f"Invalid task IDs: {spec}")
+    ranges = []
+    for part in spec.split(','):
+        start, _, end = part.partition('-')
+        start, end = int(start), int(end or start)
+        if start > end:
+            raise ValueError(f"Invalid task IDs: {spec}")
+        ranges.append((start, end))
+    return ranges
 
-        elif args.command == 'edit':
-            new_desc = ' '.join(args.new_description)
-            manager.edit_task(args.id, new_desc)
-            print(f"Updated task {args.id}")
+def task_id_spec(spec: str) -> str:
+    """Argparse type accepting an ID, a range or a comma-separated mix."""
+    import argparse
 
-        elif args.command == 'done':
+    try:
+        _task_id_ranges(spec)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return spec
+
+def parse_task_ids(specs: Iterable[str], limit: int) -> Iterator[int]:
+    """Expand IDs and ranges such as ``3 7 10-200`` (or ``3,7,10-200``).
+
+    Every spec is checked before any ID is produced. Ranges stop below
+    ``limit``, the next ID to be assigned; IDs at or past it can't name
+    any task and are reported as not found straight away.
+    """
+    ranges = [pair for spec in specs for pair in _task_id_ranges(spec)]
+    beyond: List[List[int]] = []
+    for start, end in sorted((max(start, limit), end) for start, end in ranges if end >= limit):
+        if beyond and start <= beyond[-1][1] + 1:
+            beyond[-1][1] = max(beyond[-1][1], end)
+        else:
+            beyond.append([start, end])
+    for start, end in beyond:
+        print(f"Error: {_describe_ids(start, end)} not found")
+    return itertools.chain.from_iterable(range(start, min(end + 1, limit))
+                                         for start, end in ranges)
+
+def _single_id(args: 'argparse.Namespace') -> bool:
+    return len(args.ids) == 1 and args.ids[0].isdigit() and not args.completed
+
+def _selected_ids(manager: TaskManager, args: 'argparse.Namespace') -> Optional[Iterator[int]]:
+    """Return the IDs a selection names, or None if it only uses ``--completed``."""
+    if args.ids:
+        return parse_task_ids(args.ids, manager.store.next_id)
+    if not args.completed:
+        raise ValueError(f"The {args.command} command needs task IDs or --completed")
+    return None
+
+def show_current_task(manager: TaskManager) -> None:
+    """Print the current task."""
+    current = manager.get_current_task()
+    if current:
+        print(f"Current task: {current['description']}")
+    else:
+        print("No current task")
+
+def run_command(manager: TaskManager, args: 'argparse.Namespace',
+                parser: 'argparse.ArgumentParser') -> None:
+    """Execute a parsed command against the task manager."""
+    with measure('command', command=args.command):
+        _run_command(manager, args, parser)
+
+def _run_command(manager: TaskManager, args: 'argparse.Namespace',
+                 parser: 'argparse.ArgumentParser') -> None:
+    if args.command == 'show':
+        show_current_task(manager)
+
+    elif args.command == 'add':
+        description = ' '.join(args.description)
+        manager.add_task(description)
+        print(f"Added task: {description}")
+
+    elif args.command == 'edit':
+        new_desc = ' '.join(args.new_description)
+        if args.ids.isdigit():
+            manager.edit_task(int(args.ids), new_desc)
+            print(f"Updated task {args.ids}")
+        else:
+            count = manager.edit_tasks(parse_task_ids([args.ids], manager.store.next_id), new_desc)
+            print(f"Updated {_count_tasks(count)}")
+
+    elif args.command == 'done':
+        if args.ids:
+            count = manager.complete_tasks(parse_task_ids(args.ids, manager.store.next_id))
+            print(f"Completed {_count_tasks(count)}")
+        else:
             manager.complete_current_task()
 
-        elif args.command == 'list':
-            tasks = manager.list_tasks()
-            if not tasks:
-                print("No tasks")
-            else:
-                for task in tasks:
-                    status = "✓" if task['completed'] else " "
-                    print(f"{task['id']}. [{status}] {task['description']}")
-
-        elif args.command == 'completed':
-            tasks = manager.list_completed_tasks()
-            if not tasks:
-                print("No completed tasks")
-            else:
-                for task in tasks:
-                    print(f"{task['id']}. {task['description']}")
+    elif args.command == 'list':
+        tasks = manager.iter_tasks(args.limit, args.offset, args.since_id)
+        if not write_lines(
+            f"{task['id']}. [{'✓' if task['completed'] else ' '}] {task['description']}"
+            for task in tasks
+        ):
+            print("No tasks")
+
+    elif args.command == 'completed':
+        tasks = manager.iter_completed_tasks(args.limit, args.offset, args.since_id)
+        if not write_lines(f"{task['id']}. {task['description']}" for task in tasks):
+            print("No completed tasks")
+
+    elif args.command == 'search':
+        tasks = manager.search_tasks(' '.join(args.terms), args.all)
+        if not write_lines(
+            f"{task['id']}. [{'✓' if task['completed'] else ' '}] {task['description']}"
+            for task in tasks
+        ):
+            print("No matching tasks")
+
+    elif args.command == 'remove':
+        if _single_id(args):
+            manager.remove_task(int(args.ids[0]))
+            print(f"Removed task {args.ids[0]}")
+        else:
+            count = manager.remove_tasks(_selected_ids(manager, args), args.completed)
+            print(f"Removed {_count_tasks(count)}")
+
+    elif args.command == 'help':
+        parser.print_help()
+    elif args.command == 'undone':
+        if _single_id(args):
+            manager.reopen_task(int(args.ids[0]))
+            print(f"Marked task {args.ids[0]} as undone")
+        else:
+            count = manager.reopen_tasks(_selected_ids(manager, args), args.completed)
+            print(f"Marked {_count_tasks(count)} as undone")
+
+    elif args.command == 'import':
+        fmt = exchange_format(args.file, args.format)
+        if args.file == '-':
+            f = sys.stdin if fmt == 'csv' else sys.stdin.buffer
+            count = manager.import_tasks(read_csv_tasks(f) if fmt == 'csv' else read_ndjson_tasks(f))
+        elif fmt == 'csv':
+            with open(args.file, 'r', newline='', encoding='utf-8') as f:
+                count = manager.import_tasks(read_csv_tasks(f))
+        else:
+            with open(args.file, 'rb') as f:
+                count = manager.import_tasks(read_ndjson_tasks(f))
+        print(f"Imported {_count_tasks(count)}")
+
+    elif args.command == 'export':
+        fmt = exchange_format(args.file, args.format)
+        lines = format_tasks(manager.iter_all_tasks(), fmt)
+        if args.file == '-':
+            write_lines(lines)
+        else:
+            with open(args.file, 'w', newline='', encoding='utf-8') as f:
+                count = write_lines(lines, stream=f) - (fmt == 'csv')
+            print(f"Exported {_count_tasks(count)}")
+
+    elif args.command == 'lists':
+        registry = ListRegistry()
+        if args.lists_command == 'add':
+            path = registry.add(args.name, args.path)
+            print(f"Added list {args.name}: {path}")
+        elif args.lists_command == 'remove':
+            registry.remove(args.name)
+            print(f"Removed list {args.name}")
+        elif not write_lines(
+            f"{name}: {summary['current'] or 'No current task'} ({summary['open']} open)"
+            for name, summary in registry.summaries().items()
+        ):
+            print("No lists")
+
+    elif args.command == 'daemon':
+        TaskDaemon(manager).run()
+
+    elif args.command == 'watch':
+        TaskWatcher(manager, args.json).run(args.count, args.timeout)
+
+    elif args.command == 'batch':
+        if args.file == '-':
+            run_batch(manager, sys.stdin, parser)
+        else:
+            with open(args.file, 'r') as f:
+                run_batch(manager, f, parser)
+
+def run_batch(manager: TaskManager, lines: Iterable[str],
+              parser: 'argparse.ArgumentParser') -> None:
+    """Run one command per line inside a single transaction.
+
+    Blank lines and ``#`` comments are skipped. An invalid line aborts the
+    whole batch without saving anything.
+    """
+    import shlex
+
+    with manager.transaction():
+        for number, line in enumerate(lines, 1):
+            tokens = shlex.split(line, comments=True)
+            if not tokens:
+                continue
+            try:
+                args = parser.parse_args(tokens)
+            except SystemExit:
+                raise ValueError(f"Invalid command on line {number}: {line.strip()}")
+            if args.command == 'batch':
+                raise ValueError(f"Nested batch on line {number}")
+            if args.command in ('daemon', 'watch'):
+                # Both run until stopped, the daemon holding the batch's saves until then
+                raise ValueError(f"The {args.command} command can't run in a batch (line {number})")
+            if args.list and not serves_list(manager, args.list):
+                raise ValueError(f"The {args.list} list can't be used on line {number}; "
+                                 f"pass --list to batch instead")
+            run_command(manager, args, parser)
+
+def serves_list(manager: TaskManager, name: str) -> bool:
+    """Return True if the manager's storage is the named list's tasks file."""
+    return (os.path.abspath(ListRegistry().tasks_file(name))
+            == os.path.abspath(manager.storage.path))
+
+# Commands that need the client's own stdin, working directory or stdout
+# stream, or that would tie up the daemon, always run in the client
+LOCAL_COMMANDS = {'batch', 'daemon', 'watch', 'import', 'export'}
+
+def daemon_socket_path(tasks_file: Optional[str] = None) -> str:
+    """Return the socket a daemon for the tasks file listens on."""
+    return (tasks_file or TASKS_FILE) + '.sock'
+
+class TaskDaemon:
+    """Serves commands from one resident TaskManager over a Unix socket.
+
+    Each client sends its argument list as a JSON line and gets back the
+    command's output and exit status. Commands run one at a time on the
+    asyncio event loop against the in-memory state. The manager uses group
+    commit, so changes are saved together ``flush_delay`` seconds after the
+    first one, or when the daemon stops.
+    """
 
-        elif args.command == 'remove':
-            manager.remove_task(args.id)
-            print(f"Removed task {args.id}")
+    def __init__(self, manager: Optional[TaskManager] = None, socket_path: Optional[str] = None,
+                 flush_delay: Optional[float] = None) -> None:
+        self.manager = manager or TaskManager()
+        self.socket_path = socket_path or daemon_socket_path(self.manager.storage.path)
+        self.manager.commit_window = DAEMON_FLUSH_DELAY if flush_delay is None else flush_delay
+        self.manager.keep_index = True
+        self.parser = build_parser()
+        self._loop = None
+        self._stopping = None
 
-        elif args.command == 'help':
-            parser.print_help()
-        elif args.command == 'undone':
-            manager.reopen_task(args.id)
-            print(f"Marked task {args.id} as undone")
+    def execute(self, argv: List[str]) -> Dict:
+        """Run one command and return its output and exit status."""
+        import io
+        from contextlib import redirect_stderr, redirect_stdout
 
+        if self.manager.storage.is_stale():
+            # Another process saved: merge our held-back changes in, or just reload
+            self.manager.flush()
+            if self.manager.storage.is_stale():
+                self.manager._load_tasks()
+        stdout, stderr = io.StringIO(), io.StringIO()
+        status = 0
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            try:
+                args = self.parser.parse_args(argv)
+                if args.command is None:
+                    args.command = 'show'
+                if args.command in LOCAL_COMMANDS:
+                    raise ValueError(f"The {args.command} command can't run through the daemon")
+                if args.list and not serves_list(self.manager, args.list):
+                    raise ValueError(f"This daemon doesn't serve the {args.list} list")
+                run_command(self.manager, args, self.parser)
+            except SystemExit as e:
+                status = e.code if isinstance(e.code, int) else 1
+            except Exception as e:
+                print(f"Error: {str(e)}")
+        return {'stdout': stdout.getvalue(), 'stderr': stderr.getvalue(), 'status': status}
+
+    def flush(self) -> None:
+        """Save the changes collected since the last flush."""
+        try:
+            self.manager.flush()
+        except Exception as e:
+            print(f"Error: {str(e)}", file=sys.stderr)
+
+    def _schedule_flush(self, delay: float, callback: Callable[[], None]):
+        # Flush on the event loop, between commands, reporting any errors
+        return self._loop.call_later(delay, self.flush)
+
+    async def handle(self, reader, writer) -> None:
+        """Answer a single client request."""
+        try:
+            request = json.loads(await reader.readline())
+            response = self.execute(request['argv'])
+        except (ValueError, KeyError, TypeError) as e:
+            response = {'stdout': '', 'stderr': f"Error: Bad request: {e}\n", 'status': 1}
+        writer.write(json.dumps(response).encode() + b'\n')
+        try:
+            await writer.drain()
+            writer.close()
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+    async def serve(self) -> None:
+        """Listen on the socket until stopped, then save and clean up."""
+        import asyncio
+
+        if os.path.exists(self.socket_path):
+            if send_to_daemon(['show'], self.socket_path) is not None:
+                raise ValueError(f"Daemon already running on {self.socket_path}")
+            # Left behind by a daemon that didn't shut down cleanly
+            os.unlink(self.socket_path)
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        self.manager.flush_scheduler = self._schedule_flush
+        if threading.current_thread() is threading.main_thread():
+            import signal
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                self._loop.add_signal_handler(signum, self._stopping.set)
+        server = await asyncio.start_unix_server(self.handle, path=self.socket_path)
+        try:
+            await self._stopping.wait()
+        finally:
+            server.close()
+            await server.wait_closed()
+            self.flush()
+            os.unlink(self.socket_path)
+
+    def run(self) -> None:
+        """Serve in the foreground until interrupted."""
+        import asyncio
+
+        print(f"Serving {self.manager.storage.path} on {self.socket_path}", flush=True)
+        asyncio.run(self.serve())
+
+    def stop(self) -> None:
+        """Ask a running daemon to shut down; safe to call from any thread."""
+        self._loop.call_soon_threadsafe(self._stopping.set)
+
+def send_to_daemon(argv: List[str], socket_path: Optional[str] = None) -> Optional[Dict]:
+    """Run a command through a running daemon.
+
+    Returns the daemon's response, or None if no daemon is listening.
+    """
+    socket_path = socket_path or daemon_socket_path()
+    if not os.path.exists(socket_path):
+        return None
+    import socket
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            return None
+        sock.sendall(json.dumps({'argv': argv}).encode() + b'\n')
+        chunks = []
+        for chunk in iter(lambda: sock.recv(65536), b''):
+            chunks.append(chunk)
+    if not chunks:
+        raise ConnectionError("Daemon closed the connection")
+    return json.loads(b''.join(chunks))
+
+class FileWatcher:
+    """Waits for files in a directory to change.
+
+    Uses inotify (through ctypes) where the C library provides it, and
+    otherwise sleeps ``poll_interval`` seconds between checks. Callers still
+    compare the files themselves: a wakeup only means something may have
+    changed.
+    """
+
+    # IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    INOTIFY_MASK = 0x002 | 0x008 | 0x080 | 0x100 | 0x200
+
+    def __init__(self, directory: str, poll_interval: Optional[float] = None,
+                 use_inotify: bool = True) -> None:
+        self.poll_interval = WATCH_POLL_INTERVAL if poll_interval is None else poll_interval
+        self.fd = self._inotify(directory) if use_inotify else None
+
+    @classmethod
+    def _inotify(cls, directory: str) -> Optional[int]:
+        """Return an inotify descriptor watching ``directory``, or None if unsupported."""
+        import ctypes
+
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            init, add_watch = libc.inotify_init1, libc.inotify_add_watch
+        except (OSError, AttributeError):
+            return None
+        fd = init(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            return None
+        if add_watch(fd, os.fsencode(directory), cls.INOTIFY_MASK) < 0:
+            os.close(fd)
+            return None
+        return fd
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        """Return after a change notification, or once ``timeout`` seconds pass."""
+        if self.fd is None:
+            time.sleep(self.poll_interval if timeout is None else min(timeout, self.poll_interval))
+            return
+        import select
+
+        if select.select([self.fd], [], [], timeout)[0]:
+            # Drain the queued events; only the wakeup matters
+            while True:
+                try:
+                    os.read(self.fd, 65536)
+                except BlockingIOError:
+                    break
+
+    def close(self) -> None:
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+class TaskWatcher:
+    """Prints the current task, or JSON change events, as the stored tasks change.
+
+    The storage's state signature is checked after every wakeup, so tasks
+    are only loaded again when the stored state really changed. The mmap
+    backend writes through a shared mapping, which inotify doesn't report,
+    so it is always polled.
+    """
+
+    def __init__(self, manager: TaskManager, as_json: bool = False,
+                 poll_interval: Optional[float] = None) -> None:
+        self.manager = manager
+        self.as_json = as_json
+        directory = os.path.dirname(os.path.abspath(manager.storage.path))
+        self.watcher = FileWatcher(directory, poll_interval,
+                                   not isinstance(manager.storage, MmapStorage))
+
+    def state(self) -> Dict:
+        """Return the current task and every hot task's description and status."""
+        current = self.manager.get_current_task()
+        return {
+            'current': current,
+            'tasks': {task.id: (task.description, task.completed) for task in self.manager.store},
+            'next_id': self.manager.store.next_id,
+        }
+
+    def changes(self, old: Dict, new: Dict) -> List[Dict]:
+        """Describe how the state changed as a list of events.
+
+        Tasks that moved to the archive aren't reported as removed (only as
+        completed, if they were open before), and archived tasks restored to
+        the hot store count as reopened or edited rather than added.
+        """
+        events = []
+        old_tasks, new_tasks = old['tasks'], new['tasks']
+        for task_id, (description, completed) in new_tasks.items():
+            task = {'id': task_id, 'description': description, 'completed': completed}
+            before = old_tasks.get(task_id)
+            if before is None:
+                if task_id >= old['next_id']:
+                    events.append({'event': 'added', 'task': task})
+                else:
+                    events.append({'event': 'edited' if completed else 'reopened', 'task': task})
+                continue
+            if description != before[0]:
+                events.append({'event': 'edited', 'task': task})
+            if completed != before[1]:
+                events.append({'event': 'completed' if completed else 'reopened', 'task': task})
+        missing = [task_id for task_id in old_tasks if task_id not in new_tasks]
+        archived: Dict[int, Dict] = {}
+        archive = self.manager.storage.archive
+        if missing and archive is not None:
+            wanted = set(missing)
+            archived = {task['id']: task for task in archive.iter_tasks(min(missing) - 1)
+                        if task['id'] in wanted}
+        for task_id in missing:
+            if task_id not in archived:
+                events.append({'event': 'removed', 'id': task_id})
+            elif not old_tasks[task_id][1]:
+                # Completed and archived since the last check
+                events.append({'event': 'completed', 'task': archived[task_id]})
+        if new['current'] != old['current']:
+            events.append({'event': 'current', 'task': new['current']})
+        return events
+
+    def _line(self, event: Dict) -> str:
+        if self.as_json:
+            return json.dumps(event, ensure_ascii=False)
+        task = event['task']
+        return f"Current task: {task['description']}" if task else "No current task"
+
+    def run(self, count: Optional[int] = None, timeout: Optional[float] = None) -> None:
+        """Print the current state, then changes, until ``count`` lines or ``timeout`` seconds."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        storage = self.manager.storage
+        printed = 0
+        try:
+            # Take the signature first so a change during the load isn't missed
+            signature = storage.state_signature()
+            self.manager._load_tasks()
+            state = self.state()
+            events = [{'event': 'current', 'task': state['current']}]
+            while True:
+                if not self.as_json:
+                    events = [event for event in events if event['event'] == 'current']
+                for event in events:
+                    print(self._line(event), flush=True)
+                    printed += 1
+                    if printed == count:
+                        return
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return
+                self.watcher.wait(remaining)
+                events = []
+                new_signature = storage.state_signature()
+                if new_signature != signature:
+                    signature = new_signature
+                    self.manager._load_tasks()
+                    new_state = self.state()
+                    events = self.changes(state, new_state)
+                    state = new_state
+        finally:
+            self.watcher.close()
+
+def run_instrumented(args: 'argparse.Namespace', parser: 'argparse.ArgumentParser',
+                     parse_ms: float, tasks_file: Optional[str] = None) -> None:
+    """Run a command under ``--timings`` and/or ``--profile``."""
+    phases = {'load': 0.0, 'save': 0.0}
+
+    def record(event: Dict) -> None:
+        if event['operation'] in phases:
+            phases[event['operation']] += event['duration_ms']
+
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    add_metrics_hook(record)
+    try:
+        manager = TaskManager(open_storage(tasks_file))
+        load_ms = phases['load']
+        started = time.perf_counter()
+        try:
+            run_command(manager, args, parser)
+        except Exception as e:
+            print(f"Error: {str(e)}")
+        # Saves (and reloads when merging) happen inside the command; count them once
+        command_ms = (time.perf_counter() - started) * 1000 - phases['save'] - (phases['load'] - load_ms)
+    finally:
+        remove_metrics_hook(record)
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+    if args.timings:
+        report = [
+            ('import', f"{_import_ms:.2f} ms"),
+            ('argparse', f"{parse_ms:.2f} ms"),
+            ('load', f"{phases['load']:.2f} ms"),
+            ('command', f"{command_ms:.2f} ms"),
+            ('save', f"{phases['save']:.2f} ms"),
+            ('read', f"{manager.storage.bytes_read} bytes"),
+            ('written', f"{manager.storage.bytes_written} bytes"),
+        ]
+        for name, value in report:
+            print(f"{name + ':':<10}{value:>16}", file=sys.stderr)
+
+def main() -> None:
+    """Handle CLI commands and execute appropriate actions."""
+    argv = sys.argv[1:]
+    tasks_file = TASKS_FILE
+    if any(arg.startswith('--list') for arg in argv):
+        # Resolve the list first: it picks the tasks file and so the daemon socket
+        try:
+            tasks_file = ListRegistry().tasks_file(
+                build_parser(command_name(argv)).parse_args(argv).list)
+        except ValueError as e:
+            print(f"Error: {str(e)}")
+            return
+    # Any argument naming a local command keeps it local; running locally is always safe
+    if DAEMON_MODE != 'off' and not LOCAL_COMMANDS.intersection(argv) \
+            and not any(arg.startswith(('--timings', '--profile')) for arg in argv):
+        try:
+            response = send_to_daemon(argv, daemon_socket_path(tasks_file))
+        except Exception as e:
+            print(f"Error: {str(e)}")
+            return
+        if response is not None:
+            sys.stdout.write(response['stdout'])
+            sys.stderr.write(response['stderr'])
+            if response['status']:
+                sys.exit(response['status'])
+            return
+
+    if argv in ([], ['show']):
+        # Fast path for the default command: skip building the parser
+        try:
+            show_current_task(TaskManager())
+        except Exception as e:
+            print(f"Error: {str(e)}")
+        return
+
+    started = time.perf_counter()
+    parser = build_parser(command_name(argv))
+    args = parser.parse_args()
+    parse_ms = (time.perf_counter() - started) * 1000
+    if args.command is None:
+        args.command = 'show'
+    if args.timings or args.profile:
+        run_instrumented(args, parser, parse_ms, tasks_file)
+        return
+    manager = TaskManager(open_storage(tasks_file))
+
+    try:
+        run_command(manager, args, parser)
     except Exception as e:
         print(f"Error: {str(e)}")
 
+_import_ms = (time.perf_counter() - _import_started) * 1000
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -1,15 +1,23 @@
 """Integration tests for TaskNow CLI."""
 import pytest
+import io
+import json
 import os
-from main import main as cli_main, TASKS_FILE
+import signal
+import subprocess
+import sys
+import threading
+import time
+from main import (main as cli_main, TaskDaemon, TaskManager, build_parser, command_name,
+                  send_to_daemon, TASKS_FILE)
 from unittest.mock import patch
 
 @pytest.fixture(autouse=True)
-def cleanup_files():
-    """Cleanup test files after each test."""
-    yield
-    if os.path.exists(TASKS_FILE):
-        os.remove(TASKS_FILE)
+def tasks_file(tmp_path):
+    """Point the CLI at a temporary tasks file for each test."""
+    with patch('main.TASKS_FILE', str(tmp_path / TASKS_FILE)), \
+         patch('main.REGISTRY_FILE', str(tmp_path / "lists" / "lists.json")):
+        yield
 
 def test_show_command_no_tasks(capsys):
     """Test 'show' command with no tasks."""
@@ -142,4 +150,658 @@ def test_undone_nonexistent_task(capsys):
     with patch('sys.argv', ['main.py', 'undone', '999']):
         cli_main()
     captured = capsys.readouterr()
-    assert "Error: Task 999 not found" in captured.out
\ No newline at end of file
+    assert "Error: Task 999 not found" in captured.out
+
+def test_batch_command_from_file(capsys, tmp_path):
+    """Test running several commands from a batch file."""
+    batch_file = tmp_path / "commands.txt"
+    batch_file.write_text(
+        "# Morning tasks\n"
+        "add Write report\n"
+        "\n"
+        "add 'Review PR'\n"
+        "done\n"
+        "edit 2 Review two PRs\n"
+    )
+    with patch('sys.argv', ['main.py', 'batch', str(batch_file)]):
+        cli_main()
+    with patch('sys.argv', ['main.py', 'list']):
+        cli_main()
+    captured = capsys.readouterr()
+    assert "Added task: Write report" in captured.out
+    assert "Completed task: Write report" in captured.out
+    assert "2. [ ] Review two PRs" in captured.out
+
+def test_batch_command_from_stdin(capsys):
+    """Test running batch commands read from stdin."""
+    with patch('sys.argv', ['main.py', 'batch']), \
+         patch('sys.stdin', io.StringIO("add Task 1\nadd Task 2\nshow\n")):
+        cli_main()
+    captured = capsys.readouterr()
+    assert "Added task: Task 2" in captured.out
+    assert "Current task: Task 1" in captured.out
+
+def test_batch_invalid_line_aborts(capsys):
+    """Test an invalid batch line discards the whole batch."""
+    with patch('sys.argv', ['main.py', 'batch']), \
+         patch('sys.stdin', io.StringIO("add Task 1\nremove abc\n")):
+        cli_main()
+    for stdin in ("batch\n", "add Task 1\ndaemon\n", "watch\n"):
+        with patch('sys.argv', ['main.py', 'batch']), patch('sys.stdin', io.StringIO(stdin)):
+            cli_main()
+    with patch('sys.argv', ['main.py', 'list']):
+        cli_main()
+    captured = capsys.readouterr()
+    assert "Error: Invalid command on line 2: remove abc" in captured.out
+    assert "Error: Nested batch on line 1" in captured.out
+    assert "Error: The daemon command can't run in a batch (line 2)" in captured.out
+    assert "Error: The watch command can't run in a batch (line 1)" in captured.out
+    assert "No tasks" in captured.out
+
+# The standard library modules main imports up front
+MAIN_IMPORTS = ('contextlib', 'heapq', 'itertools', 'json', 'os', 're', 'struct', 'sys',
+                'threading', 'time', 'typing')
+
+# Importing main on top of those may take at most this share of the time
+# they took. Measured at about a fifth, so a slow module-level setup or
+# pulling in a few more modules pushes it past the budget.
+IMPORT_TIME_BUDGET = 0.4
+
+def _import_times(args, cwd, env=None):
+    """Run Python with -X importtime and return {module: cumulative_us}."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', *args],
+        cwd=cwd, env=env, capture_output=True, text=True, check=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line.split('|')
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return times, result.stdout
+
+def test_import_time_within_budget(tmp_path):
+    """Test importing main stays cheap next to its dependencies and skips CLI-only modules."""
+    env = {**os.environ, 'PYTHONPATH': os.path.dirname(os.path.abspath(__file__)),
+           'PYTHONPYCACHEPREFIX': str(tmp_path / "pycache")}
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    code = f"import {', '.join(MAIN_IMPORTS)}; import main"
+    # The first run only compiles, so the timed runs load cached bytecode
+    subprocess.run([sys.executable, '-c', code], cwd=tmp_path, env=env, check=True)
+    ratios = []
+    for _ in range(3):
+        times, _ = _import_times(['-c', code], tmp_path, env)
+        baseline = sum(times.get(module, 0) for module in MAIN_IMPORTS)
+        ratios.append(times['main'] / baseline)
+    assert min(ratios) < IMPORT_TIME_BUDGET
+    times, _ = _import_times(['-c', 'import main'], tmp_path, env)
+    for module in ('argparse', 'shutil', 'tempfile', 'sqlite3'):
+        assert module not in times
+
+def test_show_fast_path_skips_argparse(tmp_path):
+    """Test the default command runs without building the argument parser."""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+    times, out = _import_times([script], tmp_path)
+    assert "No current task" in out
+    assert 'argparse' not in times
+    times, out = _import_times([script, 'list'], tmp_path)
+    assert "No tasks" in out
+    assert 'argparse' in times
+
+def test_parser_built_for_command_only():
+    """Test only the command being run gets a subparser, unless all are needed."""
+    def commands(parser):
+        return set(parser._subparsers._group_actions[0].choices)
+
+    assert commands(build_parser('done')) == {'done'}
+    assert build_parser('done').parse_args(['done', '3-5']).ids == ['3-5']
+    assert len(commands(build_parser('help'))) == len(commands(build_parser('batch'))) > 10
+    assert commands(build_parser('bogus')) == commands(build_parser())
+    assert command_name(['--list', 'work', '--profile', 'out', 'done', '3']) == 'done'
+    assert command_name(['--timings', '--list=work', 'list']) == 'list'
+    assert command_name(['--timings']) is None
+
+def test_benchmark_suite_smoke(tmp_path, capsys):
+    """Test the benchmark script runs end to end and emits JSON results."""
+    import benchmark
+
+    output = tmp_path / "results.json"
+    benchmark.main_cli(['--sizes', '20', '--repeat', '1', '--output', str(output)])
+    report = json.loads(output.read_text())
+    operations = {r['operation'] for r in report['results']}
+    assert {'load_tasks', 'save_tasks', 'add_task', 'get_current_task',
+            'complete_current_task', 'list_tasks', 'search_tasks', 'main_show'} <= operations
+    assert {r['backend'] for r in report['results']} == {
+        'json', 'journal', 'sqlite', 'mmap',
+        'format:json', 'format:compact', 'format:zlib', 'format:indexed',
+        'memory:dict', 'memory:task', 'cache:off', 'cache:on'}
+    sizes = {r['backend']: r['bytes'] for r in report['results'] if 'bytes' in r}
+    assert sizes['format:compact'] < sizes['format:json']
+    assert all(r['bytes_per_task'] > 0 for r in report['results'] if 'bytes_per_task' in r)
+    assert benchmark.compare(report, report)[0].endswith("(1.00x)")
+
+    benchmark.main_cli(['--sizes', '20', '--repeat', '1', '--backends', 'json',
+                        '--no-formats', '--no-memory', '--no-cache', '--compare', str(output)])
+    captured = capsys.readouterr()
+    results = json.loads(captured.out)['results']
+    assert {r['backend'] for r in results} == {'json'}
+    assert "load_tasks" in captured.err
+
+def test_list_command_paging(capsys):
+    """Test --limit, --offset and --since-id on the listing commands."""
+    with patch('sys.argv', ['main.py', 'batch']), \
+         patch('sys.stdin', io.StringIO("".join(f"add Task {i}\n" for i in range(1, 7)) + "done\ndone\n")):
+        cli_main()
+    capsys.readouterr()
+    with patch('sys.argv', ['main.py', 'list', '--limit', '2', '--offset', '1']):
+        cli_main()
+    with patch('sys.argv', ['main.py', 'completed', '--since-id', '1']):
+        cli_main()
+    with patch('sys.argv', ['main.py', 'list', '--since-id', '6']):
+        cli_main()
+    captured = capsys.readouterr()
+    assert captured.out == "4. [ ] Task 4\n5. [ ] Task 5\n2. Task 2\nNo tasks\n"
+
+def test_write_lines_chunks_output(capsys):
+    """Test output is written in chunks and counted."""
+    from main import write_lines
+
+    with patch('sys.stdout.write', wraps=sys.stdout.write) as write:
+        assert write_lines([f"line {i}" for i in range(5)], chunk_size=2) == 5
+    assert write.call_count == 3
+    assert capsys.readouterr().out == "".join(f"line {i}\n" for i in range(5))
+
+def test_write_lines_closed_pipe():
+    """Test a closed pipe stops output quietly and leaves the stream writable."""
+    from main import write_lines
+
+    read_fd, write_fd = os.pipe()
+    os.close(read_fd)
+    with os.fdopen(write_fd, 'w') as stream:
+        open_fds = len(os.listdir('/proc/self/fd'))
+        write_lines(["line"] * 10, chunk_size=2, stream=stream)
+        assert len(os.listdir('/proc/self/fd')) == open_fds
+        stream.write("more\n")
+        stream.flush()
+
+def test_list_paging_rejects_negative_numbers(capsys):
+    """Test negative --limit and --offset values are argument errors."""
+    for option in ('--limit', '--offset'):
+        with patch('sys.argv', ['main.py', 'list', option, '-1']), pytest.raises(SystemExit):
+            cli_main()
+        assert "Expected a number of 0 or more: -1" in capsys.readouterr().err
+
+def test_completed_piped_to_head_exits_cleanly(tmp_path):
+    """Test a closed pipe stops output without an error."""
+    tasks = [{"id": i, "description": f"Task {i}", "completed": True} for i in range(1, 50001)]
+    (tmp_path / "tasks.json").write_text(json.dumps({"tasks": tasks, "current_task_id": None}))
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+    proc = subprocess.Popen([sys.executable, script, 'completed'], cwd=tmp_path,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert proc.stdout.readline() == b"1. Task 1\n"
+    proc.stdout.close()
+    assert proc.wait(timeout=30) == 0
+    assert proc.stderr.read() == b""
+
+def test_search_command(capsys):
+    """Test search prints matching tasks, optionally including completed ones."""
+    with patch('sys.argv', ['main.py', 'batch']), \
+         patch('sys.stdin', io.StringIO("add Call the bank\nadd Email the bank\nadd Buy milk\ndone\n")):
+        cli_main()
+    capsys.readouterr()
+    with patch('sys.argv', ['main.py', 'search', 'Bank']):
+        cli_main()
+    with patch('sys.argv', ['main.py', 'search', '--all', 'bank']):
+        cli_main()
+    with patch('sys.argv', ['main.py', 'search', 'bread']):
+        cli_main()
+    captured = capsys.readouterr()
+    assert captured.out == ("2. [ ] Email the bank\n"
+                            "1. [✓] Call the bank\n2. [ ] Email the bank\n"
+                            "No matching tasks\n")
+
+def test_timings_flag(capsys):
+    """Test --timings reports each phase and the bytes moved on stderr."""
+    with patch('sys.argv', ['main.py', '--timings', 'add', 'Task']):
+        cli_main()
+    captured = capsys.readouterr()
+    assert captured.out == "Added task: Task\n"
+    lines = dict(line.split(':', 1) for line in captured.err.splitlines())
+    assert list(lines) == ['import', 'argparse', 'load', 'command', 'save', 'read', 'written']
+    assert float(lines['save'].split()[0]) > 0
+    assert int(lines['read'].split()[0]) == 0
+    assert int(lines['written'].split()[0]) > 0
+
+def test_timings_reports_errors(capsys):
+    """Test a failing command still prints its error and the timings."""
+    with patch('sys.argv', ['main.py', '--timings', 'edit', '1', 'New']), \
+         patch('main.TaskManager.edit_task', side_effect=RuntimeError("boom")):
+        cli_main()
+    captured = capsys.readouterr()
+    assert "Error: boom" in captured.out
+    assert "command:" in captured.err
+
+def test_profile_flag(capsys, tmp_path):
+    """Test --profile writes cProfile stats for the command."""
+    import pstats
+
+    output = tmp_path / "profile.out"
+    with patch('sys.argv', ['main.py', '--profile', str(output), 'list']):
+        cli_main()
+    assert capsys.readouterr().out == "No tasks\n"
+    functions = {name for _, _, name in pstats.Stats(str(output)).stats}
+    assert '_load_tasks' in functions
+    assert 'run_command' in functions
+
+def test_named_lists(capsys, tmp_path):
+    """Test --list runs commands against a named list's own tasks file."""
+    for argv in (['lists'], ['lists', 'add', 'work'], ['--list', 'work', 'add', 'Write', 'report'],
+                 ['--list=work', 'add', 'Review', 'report'], ['add', 'Buy', 'milk'],
+                 ['lists', 'add', 'home'], ['--list', 'work', 'list'], ['--list', 'work'], ['lists'],
+                 ['lists', 'remove', 'home'], ['lists']):
+        with patch('sys.argv', ['main.py', *argv]):
+            cli_main()
+    assert capsys.readouterr().out == (
+        "No lists\n"
+        f"Added list work: {tmp_path / 'lists' / 'work.json'}\n"
+        "Added task: Write report\nAdded task: Review report\nAdded task: Buy milk\n"
+        f"Added list home: {tmp_path / 'lists' / 'home.json'}\n"
+        "1. [ ] Write report\n2. [ ] Review report\nCurrent task: Write report\n"
+        "home: No current task (0 open)\nwork: Write report (2 open)\n"
+        "Removed list home\nwork: Write report (2 open)\n"
+    )
+    assert [t['description'] for t in TaskManager().tasks] == ["Buy milk"]
+
+def test_named_list_errors(capsys):
+    """Test unknown lists and list names are reported."""
+    for argv in (['--list', 'nope', 'show'], ['lists', 'remove', 'nope'], ['lists', 'add', '../x']):
+        with patch('sys.argv', ['main.py', *argv]):
+            cli_main()
+    assert capsys.readouterr().out == ("Error: No such list: nope\nError: No such list: nope\n"
+                                       "Error: Invalid list name: ../x\n")
+
+def test_batch_rejects_other_list(capsys):
+    """Test a batch line can't switch lists, though naming the batch's own list is fine."""
+    for argv, stdin in ((['lists', 'add', 'home'], ""),
+                        (['batch'], "add Default\n--list home add For home\n"),
+                        (['--list', 'home', 'batch'], "--list home add For home\n")):
+        with patch('sys.argv', ['main.py', *argv]), patch('sys.stdin', io.StringIO(stdin)):
+            cli_main()
+    assert "Error: The home list can't be used on line 2" in capsys.readouterr().out
+    assert TaskManager().tasks == []
+    with patch('sys.argv', ['main.py', '--list', 'home', 'list']):
+        cli_main()
+    assert capsys.readouterr().out == "1. [ ] For home\n"
+
+def test_import_export_files(capsys, tmp_path):
+    """Test exporting to a file and importing it back, as NDJSON and CSV."""
+    with patch('sys.argv', ['main.py', 'batch']), \
+         patch('sys.stdin', io.StringIO("add Task 1\nadd Task, 2\ndone\n")):
+        cli_main()
+    for name in ('tasks.ndjson', 'tasks.csv'):
+        with patch('sys.argv', ['main.py', 'export', str(tmp_path / name)]):
+            cli_main()
+        with patch('sys.argv', ['main.py', 'import', str(tmp_path / name)]):
+            cli_main()
+    captured = capsys.readouterr()
+    assert captured.out.splitlines()[-4:] == ["Exported 2 tasks", "Imported 2 tasks",
+                                             "Exported 4 tasks", "Imported 4 tasks"]
+    assert [(t['id'], t['description'], t['completed']) for t in TaskManager().tasks] == [
+        (1, "Task 1", True), (2, "Task, 2", False), (3, "Task 1", True), (4, "Task, 2", False),
+        (5, "Task 1", True), (6, "Task, 2", False), (7, "Task 1", True), (8, "Task, 2", False)]
+
+def test_import_export_stdio(capsys):
+    """Test import reads stdin and export writes stdout in either format."""
+    stdin = io.TextIOWrapper(io.BytesIO(b'{"description": "A"}\n{"description": "B", "completed": true}\n'))
+    with patch('sys.argv', ['main.py', 'import']), patch('sys.stdin', stdin):
+        cli_main()
+    with patch('sys.argv', ['main.py', 'import', '--format', 'csv']), \
+         patch('sys.stdin', io.StringIO("description\nC\n")):
+        cli_main()
+    with patch('sys.argv', ['main.py', 'export', '--format', 'csv']):
+        cli_main()
+    with patch('sys.argv', ['main.py', 'export']):
+        cli_main()
+    assert capsys.readouterr().out == (
+        "Imported 2 tasks\nImported 1 task\n"
+        "id,description,completed\n1,A,false\n2,B,true\n3,C,false\n"
+        '{"id":1,"description":"A","completed":false}\n'
+        '{"id":2,"description":"B","completed":true}\n'
+        '{"id":3,"description":"C","completed":false}\n'
+    )
+
+def test_import_invalid_file(capsys, tmp_path):
+    """Test a bad row aborts the whole import."""
+    path = tmp_path / "bad.ndjson"
+    path.write_text('{"description": "A"}\n{"description": 1}\n')
+    with patch('sys.argv', ['main.py', 'import', str(path)]):
+        cli_main()
+    assert capsys.readouterr().out == "Error: Invalid task on line 2\n"
+    assert TaskManager().tasks == []
+
+def test_done_completes_task_shown_as_current(capsys):
+    """Test done completes the earliest incomplete task even after reopening a later one."""
+    for argv in (['add', 't1'], ['add', 't2'], ['add', 't3'], ['done'], ['done'],
+                 ['undone', '1'], ['undone', '2'], ['show'], ['done']):
+        with patch('sys.argv', ['main.py', *argv]):
+            cli_main()
+    assert capsys.readouterr().out.splitlines()[-2:] == ["Current task: t1", "Completed task: t1"]
+
+def test_bulk_commands(capsys):
+    """Test done, edit, undone and remove accept IDs, ranges and --completed."""
+    with patch('sys.argv', ['main.py', 'batch']), \
+         patch('sys.stdin', io.StringIO("".join(f"add Task {i}\n" for i in range(1, 11)))):
+        cli_main()
+    capsys.readouterr()
+    for argv in (['done', '1', '3-5'], ['edit', '6,8-9', 'Renamed'], ['undone', '3', '4'],
+                 ['remove', '--completed'], ['remove', '9', '10-999'], ['undone', '--completed'],
+                 ['list']):
+        with patch('sys.argv', ['main.py', *argv]):
+            cli_main()
+    assert capsys.readouterr().out == (
+        "Completed 4 tasks\nUpdated 3 tasks\nMarked 2 tasks as undone\nRemoved 2 tasks\n"
+        "Error: Tasks 11-999 not found\nRemoved 2 tasks\nMarked 0 tasks as undone\n"
+        "2. [ ] Task 2\n3. [ ] Task 3\n4. [ ] Task 4\n6. [ ] Renamed\n7. [ ] Task 7\n"
+        "8. [ ] Renamed\n"
+    )
+
+def test_bulk_commands_report_missing_ids(capsys):
+    """Test reversed ranges and IDs of tasks that don't exist are reported."""
+    with patch('sys.argv', ['main.py', 'batch']), \
+         patch('sys.stdin', io.StringIO("".join(f"add Task {i}\n" for i in range(1, 6)))):
+        cli_main()
+    with patch('sys.argv', ['main.py', 'done', '5-3']), pytest.raises(SystemExit):
+        cli_main()
+    assert "Invalid task IDs: 5-3" in capsys.readouterr().err
+    for argv in (['done', '99'], ['remove', '2'], ['remove', '3-4'], ['done', '1-5'],
+                 ['done', '1', '5-7', '9'], ['undone', '1', '6'], ['edit', '1,8', 'Renamed']):
+        with patch('sys.argv', ['main.py', *argv]):
+            cli_main()
+    assert capsys.readouterr().out == (
+        "Error: Task 99 not found\nCompleted 0 tasks\nRemoved task 2\nRemoved 2 tasks\n"
+        "Error: Tasks 2-4 not found\nCompleted 2 tasks\n"
+        "Error: Tasks 6-7 not found\nError: Task 9 not found\n"
+        "Error: Task 1 is already completed\nError: Task 5 is already completed\nCompleted 0 tasks\n"
+        "Error: Task 6 not found\nMarked 1 task as undone\n"
+        "Error: Task 8 not found\nUpdated 1 task\n"
+    )
+
+def test_bulk_commands_need_selection(capsys):
+    """Test remove and undone refuse to run without IDs or --completed."""
+    for command in ('remove', 'undone'):
+        with patch('sys.argv', ['main.py', command]):
+            cli_main()
+    assert capsys.readouterr().out == ("Error: The remove command needs task IDs or --completed\n"
+                                       "Error: The undone command needs task IDs or --completed\n")
+
+def _wait_for(condition, timeout=10):
+    """Poll until condition() is true or fail after timeout seconds."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+@pytest.fixture
+def daemon():
+    """Run a daemon with a long flush delay in a background thread."""
+    import asyncio
+
+    server = TaskDaemon(flush_delay=60)
+    thread = threading.Thread(target=asyncio.run, args=(server.serve(),))
+    thread.start()
+    _wait_for(lambda: os.path.exists(server.socket_path))
+    yield server
+    server.stop()
+    thread.join()
+
+def test_cli_uses_running_daemon(daemon, capsys, tmp_path):
+    """Test commands go through the daemon and writes are coalesced."""
+    for argv in (['add', 'Task', '1'], ['add', 'Task 2'], ['done'], []):
+        with patch('sys.argv', ['main.py', *argv]):
+            cli_main()
+    assert capsys.readouterr().out == ("Added task: Task 1\nAdded task: Task 2\n"
+                                       "Completed task: Task 1\nCurrent task: Task 2\n")
+    assert not os.path.exists(tmp_path / TASKS_FILE)
+    daemon.flush()
+    assert daemon.manager.write_count == 1
+    assert [t['completed'] for t in TaskManager().tasks] == [True, False]
+
+def test_daemon_flushes_after_delay(daemon, tmp_path):
+    """Test pending changes are saved once the flush delay passes."""
+    daemon.manager.commit_window = 0.01
+    send_to_daemon(['add', 'Task'])
+    _wait_for(lambda: os.path.exists(tmp_path / TASKS_FILE))
+    assert [t['description'] for t in TaskManager().tasks] == ["Task"]
+
+def test_daemon_concurrent_clients(daemon):
+    """Test many clients at once are all served."""
+    threads = [threading.Thread(target=send_to_daemon, args=(['add', f"Task {i}"],))
+               for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(daemon.manager.tasks) == 20
+
+def test_daemon_keeps_search_index(daemon):
+    """Test the daemon answers searches from an index it keeps between requests."""
+    send_to_daemon(['add', 'Write report'])
+    send_to_daemon(['search', 'report'])
+    index = daemon.manager._index
+    assert index is not None
+    send_to_daemon(['search', 'write'])
+    assert daemon.manager._index is index
+
+def test_daemon_reports_errors(daemon, capsys):
+    """Test parse errors, refused commands and bad requests."""
+    with patch('sys.argv', ['main.py', 'remove', 'x']), pytest.raises(SystemExit) as exc:
+        cli_main()
+    assert exc.value.code == 2
+    assert "Invalid task IDs: x" in capsys.readouterr().err
+    assert "can't run through the daemon" in send_to_daemon(['daemon'])['stdout']
+    with patch.object(daemon.manager, 'iter_tasks', side_effect=RuntimeError("boom")):
+        assert send_to_daemon(['list'])['stdout'] == "Error: boom\n"
+
+    import socket
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(daemon.socket_path)
+        sock.sendall(b'not json\n')
+        response = json.loads(sock.makefile().read())
+    assert response['status'] == 1 and "Bad request" in response['stderr']
+
+def test_daemon_ignores_client_disconnect():
+    """Test a client hanging up before reading its reply doesn't break the handler."""
+    import asyncio
+
+    class Reader:
+        async def readline(self):
+            return b'{"argv": ["show"]}\n'
+
+    class Writer:
+        def write(self, data):
+            self.data = data
+
+        async def drain(self):
+            raise ConnectionResetError("client went away")
+
+    writer = Writer()
+    asyncio.run(TaskDaemon(flush_delay=60).handle(Reader(), writer))
+    assert json.loads(writer.data)['stdout'] == "No current task\n"
+
+@pytest.mark.parametrize('backend', ['sqlite', 'mmap'])
+def test_write_through_daemon_sees_external_writes(backend, capsys):
+    """Test a daemon on a write-through backend reloads after another process writes."""
+    import asyncio
+
+    with patch('main.STORAGE_BACKEND', backend):
+        with patch('sys.argv', ['main.py', 'batch']), patch('sys.stdin', io.StringIO("add a\nadd b\nadd c\n")):
+            cli_main()
+        server = TaskDaemon(flush_delay=60)
+        thread = threading.Thread(target=asyncio.run, args=(server.serve(),))
+        thread.start()
+        try:
+            _wait_for(lambda: os.path.exists(server.socket_path))
+            assert send_to_daemon(['show'])['stdout'] == "Current task: a\n"
+            with patch('sys.argv', ['main.py', 'batch']), patch('sys.stdin', io.StringIO("done\n")):
+                cli_main()
+            assert server.manager.storage.is_stale()
+            assert send_to_daemon(['done'])['stdout'] == "Completed task: b\n"
+            assert not server.manager.storage.is_stale()
+            assert send_to_daemon(['list'])['stdout'] == "3. [ ] c\n"
+        finally:
+            server.stop()
+            thread.join()
+        assert [t['completed'] for t in TaskManager().tasks] == [True, True, False]
+
+def test_daemon_picks_up_external_changes(daemon):
+    """Test the daemon reloads or merges when another process saves."""
+    TaskManager().add_task("External 1")
+    assert send_to_daemon(['show'])['stdout'] == "Current task: External 1\n"
+    send_to_daemon(['add', 'Daemon'])
+    time.sleep(0.01)  # Make sure the file's mtime changes
+    TaskManager().add_task("External 2")
+    assert "External 2" in send_to_daemon(['list'])['stdout']
+    assert [t['description'] for t in daemon.manager.tasks] == ["External 1", "External 2", "Daemon"]
+
+def test_daemon_flush_error_reported(daemon, capsys):
+    """Test a failed save is reported on the daemon's stderr."""
+    send_to_daemon(['add', 'Task'])
+    with patch.object(daemon.manager.storage, 'save', side_effect=OSError("disk full")):
+        daemon.flush()
+    assert capsys.readouterr().err == "Error: disk full\n"
+
+def test_daemon_refuses_second_instance(daemon):
+    """Test a second daemon on the same socket is refused."""
+    import asyncio
+
+    with pytest.raises(ValueError, match="already running"):
+        asyncio.run(TaskDaemon().serve())
+
+def test_stale_socket_is_ignored(tmp_path, capsys):
+    """Test a socket file without a daemon falls back to running locally."""
+    import socket
+
+    path = str(tmp_path / TASKS_FILE) + '.sock'
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.bind(path)
+    with patch('sys.argv', ['main.py', 'add', 'Local']):
+        cli_main()
+    assert capsys.readouterr().out == "Added task: Local\n"
+    assert send_to_daemon(['show']) is None
+
+    def serve_one():
+        _wait_for(lambda: send_to_daemon(['show']) is not None)
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    # A new daemon replaces the stale socket and stops on SIGTERM
+    thread = threading.Thread(target=serve_one)
+    thread.start()
+    with patch('sys.argv', ['main.py', 'daemon']):
+        cli_main()
+    thread.join()
+    assert capsys.readouterr().out.startswith("Serving")
+    assert not os.path.exists(path)
+
+def test_daemon_connection_lost(tmp_path, capsys):
+    """Test a daemon hanging up without answering is reported."""
+    import socket
+
+    path = str(tmp_path / TASKS_FILE) + '.sock'
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(path)
+        server.listen()
+        def hang_up():
+            conn, _ = server.accept()
+            conn.recv(1024)
+            conn.close()
+        thread = threading.Thread(target=hang_up)
+        thread.start()
+        with patch('sys.argv', ['main.py', 'list']):
+            cli_main()
+        thread.join()
+    assert capsys.readouterr().out == "Error: Daemon closed the connection\n"
+
+def test_timings_bypass_daemon(daemon, capsys):
+    """Test --timings runs locally so it measures this process."""
+    with patch('sys.argv', ['main.py', '--timings', 'add', 'Task']):
+        cli_main()
+    assert "load:" in capsys.readouterr().err
+    assert daemon.manager.tasks == []
+
+def test_daemon_per_list(capsys, tmp_path):
+    """Test a daemon started for a list serves only that list."""
+    import asyncio
+    import main
+
+    with patch('sys.argv', ['main.py', 'lists', 'add', 'work']):
+        cli_main()
+    server = TaskDaemon(TaskManager(main.open_storage(main.ListRegistry().tasks_file('work'))),
+                        flush_delay=60)
+    thread = threading.Thread(target=asyncio.run, args=(server.serve(),))
+    thread.start()
+    try:
+        _wait_for(lambda: os.path.exists(server.socket_path))
+        with patch('sys.argv', ['main.py', '--list', 'work', 'add', 'Task']):
+            cli_main()
+        assert [t['description'] for t in server.manager.tasks] == ["Task"]
+        with patch('sys.argv', ['main.py', 'lists', 'add', 'home']):
+            cli_main()
+        response = send_to_daemon(['--list', 'home', 'show'], server.socket_path)
+        assert response['stdout'] == "Error: This daemon doesn't serve the home list\n"
+        response = send_to_daemon(['--list', 'work'], server.socket_path)
+        assert response['stdout'] == "Current task: Task\n"
+    finally:
+        server.stop()
+        thread.join()
+
+def test_watch_command(daemon, capsys):
+    """Test watch runs locally, not through the daemon, and stops when told to."""
+    send_to_daemon(['add', 'Task'])
+    daemon.flush()
+    for argv in (['watch', '--count', '1'], ['watch', '--json', '--timeout', '0.05']):
+        with patch('sys.argv', ['main.py', *argv]):
+            cli_main()
+    assert capsys.readouterr().out == (
+        'Current task: Task\n'
+        '{"event": "current", "task": {"id": 1, "description": "Task", "completed": false}}\n'
+    )
+    assert "can't run through the daemon" in send_to_daemon(['watch'])['stdout']
+
+def test_import_export_bypass_daemon(daemon, capsys):
+    """Test import and export run in the client even with a daemon running."""
+    with patch('sys.argv', ['main.py', 'import']), \
+         patch('sys.stdin', io.TextIOWrapper(io.BytesIO(b'{"description": "Piped"}\n'))):
+        cli_main()
+    with patch('sys.argv', ['main.py', 'export']):
+        cli_main()
+    assert capsys.readouterr().out == (
+        'Imported 1 task\n{"id":1,"description":"Piped","completed":false}\n')
+    assert send_to_daemon(['list'])['stdout'] == "1. [ ] Piped\n"
+    for command in ('import', 'export'):
+        assert "can't run through the daemon" in send_to_daemon([command])['stdout']
+
+def test_daemon_mode_off(daemon, capsys, tmp_path):
+    """Test TASKNOW_DAEMON=off bypasses a running daemon."""
+    with patch('main.DAEMON_MODE', 'off'), patch('sys.argv', ['main.py', 'add', 'Local']):
+        cli_main()
+    assert os.path.exists(tmp_path / TASKS_FILE)
+    assert daemon.manager.tasks == []
+
+def test_daemon_command_end_to_end(tmp_path):
+    """Test `tasknow daemon` serves the CLI and saves on SIGTERM."""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+    proc = subprocess.Popen([sys.executable, script, 'daemon'], cwd=tmp_path,
+                            stdout=subprocess.PIPE, text=True)
+    try:
+        assert proc.stdout.readline().startswith("Serving tasks.json on")
+        run = lambda *argv: subprocess.run([sys.executable, script, *argv], cwd=tmp_path,
+                                           capture_output=True, text=True).stdout
+        assert run('add', 'Served') == "Added task: Served\n"
+        assert run() == "Current task: Served\n"
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(timeout=10)
+    assert not os.path.exists(tmp_path / "tasks.json.sock")
+    with open(tmp_path / "tasks.json") as f:
+        assert [t['description'] for t in json.load(f)['tasks']] == ["Served"]
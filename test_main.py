@@ -1,10 +1,16 @@
 """Unit tests for TaskNow task manager."""
 import pytest
+import io
 import json
 import os
+import subprocess
+import sys
 import threading
 from unittest.mock import mock_open, patch
-from main import TaskManager, TASKS_FILE
+from main import (SERIALIZERS, TASKS_FILE, FileWatcher, JournalStorage, LazyTaskStore, ListRegistry,
+                  MmapStorage, MmapTaskStore, ParseCache, SearchIndex, SqliteStorage, Task,
+                  TaskArchive, TaskManager, TaskStore, TaskWatcher, atomic_write, decode_snapshot,
+                  format_tasks, open_storage, parse_task_ids, read_csv_tasks, read_ndjson_tasks)
 
 @pytest.fixture
 def task_manager(tmp_path):
@@ -219,15 +225,17 @@ def test_remove_task_with_next_selection(task_manager):
     task_manager.remove_task(2)
     assert task_manager.current_task_id == 3
 
-def test_cli_add_task(capsys):
+def test_cli_add_task(capsys, tmp_path):
     """Test CLI add task command."""
-    with patch('sys.argv', ['main.py', 'add', 'Test', 'task']):
+    temp_file = tmp_path / "tasks.json"
+    with patch('main.TASKS_FILE', str(temp_file)), \
+         patch('sys.argv', ['main.py', 'add', 'Test', 'task']):
         from main import main
         main()
     
     captured = capsys.readouterr()
     assert "Added task: Test task" in captured.out
-    assert os.path.exists(TASKS_FILE)
+    assert os.path.exists(temp_file)
 
 def test_cli_show_task(capsys, task_manager):
     """Test CLI show task command."""
@@ -309,13 +317,14 @@ def test_json_decode_error_handling(capsys, tmp_path):
     assert tm.tasks == []
     assert tm.current_task_id is None
 
-def test_complete_current_task_error_message(task_manager, capsys):
-    """Test error message when current task doesn't exist."""
-    # Set invalid current task ID
+def test_complete_current_task_ignores_invalid_current(task_manager, capsys):
+    """Test a stored current ID that doesn't exist is replaced by the earliest incomplete task."""
     task_manager.current_task_id = 999
     task_manager.complete_current_task()
-    captured = capsys.readouterr()
-    assert "Error: Current task not found" in captured.out
+    task_manager.add_task("Task 1")
+    task_manager.current_task_id = 999
+    task_manager.complete_current_task()
+    assert capsys.readouterr().out == "No current task to complete\nCompleted task: Task 1\n"
 
 def test_get_current_task_updates_invalid_current(task_manager):
     """Test get_current_task updates invalid current_task_id."""
@@ -383,4 +392,1553 @@ def test_cli_help_command(capsys):
     captured = capsys.readouterr()
     assert "usage: main.py" in captured.out
     assert "Show current task" in captured.out
-    assert "help" in captured.out
\ No newline at end of file
+    assert "help" in captured.out
+
+def test_next_id_not_reused_after_remove(task_manager):
+    """Test IDs of removed tasks are never handed out again."""
+    task_manager.add_task("Task 1")
+    task_manager.add_task("Task 2")
+    task_manager.remove_task(2)
+    task_manager.add_task("Task 3")
+    assert [t['id'] for t in task_manager.tasks] == [1, 3]
+
+def test_next_id_persisted(tmp_path):
+    """Test the next ID counter survives a reload."""
+    temp_file = tmp_path / "tasks.json"
+    with patch('main.TASKS_FILE', str(temp_file)):
+        tm = TaskManager()
+        tm.add_task("Task 1")
+        tm.add_task("Task 2")
+        tm.remove_task(2)
+        assert json.loads(temp_file.read_text())['next_id'] == 3
+        assert TaskManager().store.next_id == 3
+
+def test_task_store_indexes():
+    """Test TaskStore keeps the incomplete index in ID order."""
+    store = TaskStore([
+        {"id": 5, "description": "Task 5", "completed": False},
+        {"id": 2, "description": "Task 2", "completed": True},
+        {"id": 3, "description": "Task 3", "completed": False}
+    ])
+    assert store.next_id == 6
+    assert store.first_incomplete() == 3
+    store.set_completed(3, True)
+    store.set_completed(3, True)  # No-op when already completed
+    assert store.first_incomplete() == 5
+    store.set_completed(2, False)
+    assert [t['id'] for t in store.iter_incomplete()] == [2, 5]
+    assert [t['id'] for t in store.iter_completed()] == [3]
+    store.insert({"id": 5, "description": "Task 5", "completed": True})
+    assert [t['id'] for t in store.iter_incomplete()] == [2]
+
+def test_tasks_setter_rebuilds_store(task_manager):
+    """Test assigning tasks directly rebuilds the indexes."""
+    task_manager.tasks = [{"id": 4, "description": "Task 4", "completed": False}]
+    assert task_manager.store.get(4)['description'] == "Task 4"
+    assert task_manager.store.next_id == 5
+
+def test_task_store_heap_skips_stale_entries():
+    """Test the incomplete heap ignores completed and removed IDs."""
+    store = TaskStore()
+    for i in range(1, 6):
+        store.add(f"Task {i}")
+    store.set_completed(1, True)
+    store.remove(2)
+    assert len(store) == 4
+    assert store.first_incomplete() == 3
+    store.set_completed(1, False)
+    assert store.first_incomplete() == 1
+
+def test_task_store_heap_rebuilt_when_stale():
+    """Test reopening tasks repeatedly doesn't grow the heap unbounded."""
+    store = TaskStore()
+    store.add("Task 1")
+    for _ in range(100):
+        store.set_completed(1, True)
+        store.set_completed(1, False)
+    assert len(store._heap) <= 2 * len(store._incomplete) + 16
+    assert store.first_incomplete() == 1
+
+@pytest.fixture
+def journal_manager(tmp_path):
+    """Fixture providing a TaskManager backed by the journal storage."""
+    temp_file = tmp_path / "tasks.json"
+    with patch('main.TASKS_FILE', str(temp_file)), \
+         patch('main.STORAGE_BACKEND', 'journal'):
+        yield TaskManager()
+
+def test_open_storage_selects_backend(tmp_path):
+    """Test open_storage honours the configured backend."""
+    path = str(tmp_path / "tasks.json")
+    assert isinstance(open_storage(path, 'journal'), JournalStorage)
+    assert not isinstance(open_storage(path, 'json'), JournalStorage)
+    with pytest.raises(ValueError, match="Unknown storage backend"):
+        open_storage(path, 'bogus')
+
+def test_journal_appends_instead_of_rewriting(journal_manager):
+    """Test mutations append one record without touching the snapshot."""
+    storage = journal_manager.storage
+    journal_manager.add_task("Task 1")
+    journal_manager.add_task("Task 2")
+    assert not os.path.exists(storage.path)
+    with open(storage.journal_path) as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 2
+    assert json.loads(lines[1]) == {"op": "add", "id": 2, "description": "Task 2"}
+
+def test_journal_replay_on_load(journal_manager):
+    """Test a fresh manager replays the journal over the snapshot."""
+    journal_manager.add_task("Task 1")
+    journal_manager.add_task("Task 2")
+    journal_manager.add_task("Task 3")
+    journal_manager.edit_task(2, "Task 2 edited")
+    journal_manager.complete_current_task()
+    journal_manager.remove_task(3)
+    journal_manager.reopen_task(1)
+
+    tm = TaskManager()
+    assert tm.tasks == journal_manager.tasks
+    assert tm.current_task_id == 1
+    assert tm.store.next_id == 4
+    assert tm.store.get(2)['description'] == "Task 2 edited"
+
+def test_journal_compaction(journal_manager):
+    """Test the journal is folded into the snapshot at the threshold."""
+    with patch('main.JOURNAL_COMPACT_THRESHOLD', 3):
+        for i in range(4):
+            journal_manager.add_task(f"Task {i}")
+    storage = journal_manager.storage
+    with open(storage.path) as f:
+        assert len(json.load(f)['tasks']) == 3
+    with open(storage.journal_path) as f:
+        assert len(f.read().splitlines()) == 1
+    assert len(TaskManager().tasks) == 4
+
+def test_journal_ignores_torn_final_line(journal_manager):
+    """Test an interrupted append doesn't corrupt later loads."""
+    journal_manager.add_task("Task 1")
+    with open(journal_manager.storage.journal_path, 'a') as f:
+        f.write('{"op":"add","id":2,"desc')
+    tm = TaskManager()
+    assert [t['id'] for t in tm.tasks] == [1]
+    tm.add_task("Task 2")
+    assert [t['id'] for t in TaskManager().tasks] == [1, 2]
+
+def test_journal_current_task_change_recorded(journal_manager):
+    """Test a current task change with no other mutation is journaled."""
+    journal_manager.add_task("Task 1")
+    journal_manager.add_task("Task 2")
+    journal_manager.current_task_id = 2
+    journal_manager._save_tasks()
+    assert TaskManager().current_task_id == 2
+    journal_manager.get_current_task()
+    journal_manager._save_tasks()
+    assert TaskManager().current_task_id == 1
+
+def test_journal_corrupted_snapshot_resets(journal_manager, capsys):
+    """Test a corrupted snapshot resets both snapshot and journal."""
+    journal_manager.add_task("Task 1")
+    with open(journal_manager.storage.path, 'w') as f:
+        f.write("invalid json")
+    tm = TaskManager()
+    assert "Error: Corrupted tasks file" in capsys.readouterr().out
+    assert tm.tasks == []
+    assert TaskManager().tasks == []
+
+def test_journal_skips_empty_saves(journal_manager):
+    """Test saves with nothing to record don't append to the journal."""
+    journal_manager.add_task("Task 1")
+    journal_manager._save_tasks()
+    with open(journal_manager.storage.journal_path) as f:
+        assert len(f.read().splitlines()) == 1
+
+@pytest.fixture
+def sqlite_manager(tmp_path):
+    """Fixture providing a TaskManager backed by the SQLite storage."""
+    temp_file = tmp_path / "tasks.json"
+    with patch('main.TASKS_FILE', str(temp_file)), \
+         patch('main.STORAGE_BACKEND', 'sqlite'):
+        yield TaskManager()
+
+def test_sqlite_storage_operations(sqlite_manager):
+    """Test the task operations run against the SQLite store."""
+    assert isinstance(sqlite_manager.storage, SqliteStorage)
+    sqlite_manager.add_task("Task 1")
+    sqlite_manager.add_task("Task 2")
+    sqlite_manager.add_task("Task 3")
+    sqlite_manager.edit_task(3, "Task 3 edited")
+    sqlite_manager.complete_current_task()
+    sqlite_manager.remove_task(2)
+
+    tm = TaskManager()
+    assert tm.get_current_task() == {"id": 3, "description": "Task 3 edited", "completed": False}
+    assert [t['id'] for t in tm.list_tasks()] == [3]
+    assert [t['id'] for t in tm.list_completed_tasks()] == [1]
+    assert len(tm.store) == 2
+    tm.reopen_task(1)
+    tm.add_task("Task 4")
+    assert TaskManager().current_task_id == 1
+    assert [t['id'] for t in TaskManager().tasks] == [1, 3, 4]
+    tm.store.insert({"id": 9, "description": "Task 9", "completed": True})
+    assert tm.store.next_id == 10
+
+def test_sqlite_uses_wal_and_indexes(sqlite_manager):
+    """Test the database is in WAL mode with an index on completed."""
+    conn = sqlite_manager.storage.conn
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    plan = conn.execute(
+        'EXPLAIN QUERY PLAN SELECT MIN(id) FROM tasks WHERE completed = 0'
+    ).fetchall()
+    assert 'tasks_completed' in str(plan)
+
+def test_sqlite_migrates_json_file(tmp_path):
+    """Test an existing JSON tasks file is migrated on first use."""
+    temp_file = tmp_path / "tasks.json"
+    temp_file.write_text(json.dumps({
+        "tasks": [
+            {"id": 1, "description": "Task 1", "completed": True},
+            {"id": 2, "description": "Task 2", "completed": False}
+        ],
+        "current_task_id": 2,
+        "next_id": 5
+    }))
+    with patch('main.TASKS_FILE', str(temp_file)), \
+         patch('main.STORAGE_BACKEND', 'sqlite'):
+        tm = TaskManager()
+        assert tm.current_task_id == 2
+        assert tm.tasks == [
+            {"id": 1, "description": "Task 1", "completed": True},
+            {"id": 2, "description": "Task 2", "completed": False}
+        ]
+        tm.add_task("Task 5")
+        assert tm.store.next_id == 6
+        # Migration only happens once
+        temp_file.write_text(json.dumps({"tasks": [], "current_task_id": None}))
+        assert len(TaskManager().tasks) == 3
+
+def test_sqlite_migration_keeps_next_id_without_tasks(tmp_path):
+    """Test migrating an empty store still preserves the ID counter."""
+    temp_file = tmp_path / "tasks.json"
+    temp_file.write_text(json.dumps({"tasks": [], "current_task_id": None, "next_id": 7}))
+    with patch('main.TASKS_FILE', str(temp_file)), \
+         patch('main.STORAGE_BACKEND', 'sqlite'):
+        assert TaskManager().store.next_id == 7
+
+def test_show_performs_no_writes(task_manager):
+    """Test read-only commands never write the tasks file."""
+    task_manager.add_task("Task 1")
+    task_manager.add_task("Task 2")
+    tm = TaskManager()
+    tm.get_current_task()
+    tm.list_tasks()
+    tm.list_completed_tasks()
+    assert tm.write_count == 0
+
+def test_no_file_created_until_mutation(tmp_path):
+    """Test loading a missing store doesn't create the tasks file."""
+    temp_file = tmp_path / "tasks.json"
+    with patch('main.TASKS_FILE', str(temp_file)):
+        tm = TaskManager()
+        assert tm.get_current_task() is None
+        assert not temp_file.exists()
+        tm.add_task("Task 1")
+        assert temp_file.exists()
+        assert tm.write_count == 1
+
+def test_current_task_change_persisted_with_next_mutation(task_manager):
+    """Test a recomputed current task is saved by the next write."""
+    task_manager.add_task("Task 1")
+    task_manager.current_task_id = None
+    task_manager.get_current_task()
+    assert task_manager.write_count == 1
+    task_manager.add_task("Task 2")
+    assert task_manager.write_count == 2
+    assert TaskManager().current_task_id == 1
+
+def test_failed_mutation_performs_no_writes(task_manager):
+    """Test mutations that don't change anything skip the write."""
+    task_manager.edit_task(999, "Nothing")
+    task_manager.remove_task(999)
+    task_manager.reopen_task(999)
+    task_manager.complete_current_task()
+    assert task_manager.write_count == 0
+
+def test_transaction_saves_once(task_manager):
+    """Test operations inside a transaction are persisted with one write."""
+    with task_manager.transaction():
+        for i in range(10):
+            task_manager.add_task(f"Task {i}")
+        task_manager.complete_current_task()
+        with task_manager.transaction():
+            task_manager.remove_task(5)
+        assert task_manager.write_count == 0
+    assert task_manager.write_count == 1
+    tm = TaskManager()
+    assert len(tm.tasks) == 9
+    assert tm.current_task_id == 2
+
+def test_transaction_rolls_back_on_error(task_manager):
+    """Test a failing transaction discards its changes."""
+    task_manager.add_task("Task 1")
+    with pytest.raises(RuntimeError):
+        with task_manager.transaction():
+            task_manager.add_task("Task 2")
+            task_manager.complete_current_task()
+            raise RuntimeError("boom")
+    assert [t['id'] for t in task_manager.tasks] == [1]
+    assert task_manager.current_task_id == 1
+    assert task_manager.write_count == 1
+
+def test_group_commit_by_count(task_manager):
+    """Test group commit writes once every commit_count saves."""
+    task_manager.commit_count = 3
+    for i in range(7):
+        task_manager.add_task(f"Task {i}")
+    assert task_manager.write_count == 2
+    assert len(TaskManager().tasks) == 6
+    task_manager.flush()
+    assert len(TaskManager().tasks) == 7
+    assert task_manager.commit_stats() == {'save_requests': 7, 'writes': 3, 'coalesced': 5}
+
+def test_group_commit_by_window(task_manager):
+    """Test group commit writes held-back saves once the window passes."""
+    scheduled = []
+    task_manager.commit_window = 5
+    task_manager.flush_scheduler = lambda delay, callback: scheduled.append((delay, callback)) or \
+        threading.Timer(delay, callback)
+    task_manager.add_task("Task 1")
+    task_manager.add_task("Task 2")
+    assert task_manager.write_count == 0
+    assert len(scheduled) == 1
+    delay, callback = scheduled[0]
+    assert delay == 5
+    callback()
+    assert task_manager.write_count == 1
+    assert len(TaskManager().tasks) == 2
+
+def test_group_commit_timer_flushes(task_manager):
+    """Test the default scheduler flushes from a background timer."""
+    task_manager.commit_window = 0.01
+    task_manager.add_task("Task 1")
+    task_manager._flush_timer.join(5)
+    assert task_manager.write_count == 1
+
+def test_group_commit_flushed_at_exit(task_manager):
+    """Test managers holding back saves are registered for an exit flush."""
+    import main
+    task_manager.commit_count = 10
+    task_manager.add_task("Task 1")
+    assert task_manager in main._unflushed_managers
+    for manager in list(main._unflushed_managers):
+        manager.flush()
+    assert len(TaskManager().tasks) == 1
+
+def test_group_commit_rollback(task_manager):
+    """Test rolling back discards held-back saves."""
+    task_manager.add_task("Task 1")
+    task_manager.commit_window = 60
+    task_manager.add_task("Task 2")
+    task_manager.rollback()
+    assert task_manager._flush_timer is None
+    task_manager.flush()
+    assert [t['id'] for t in task_manager.tasks] == [1]
+    assert task_manager.write_count == 1
+
+def test_group_commit_env(tmp_path):
+    """Test group commit is configured from the environment."""
+    with patch('main.TASKS_FILE', str(tmp_path / "tasks.json")), \
+         patch('main.COMMIT_COUNT', 2):
+        tm = TaskManager()
+        tm.add_task("Task 1")
+        assert tm.write_count == 0
+        tm.add_task("Task 2")
+        assert tm.write_count == 1
+
+def test_metrics_hooks(task_manager):
+    """Test hooks receive timed load and save events with byte counts."""
+    import main
+    events = []
+    main.add_metrics_hook(events.append)
+    try:
+        task_manager.add_task("Task 1")
+        task_manager._load_tasks()
+    finally:
+        main.remove_metrics_hook(events.append)
+    size = os.path.getsize(task_manager.storage.path)
+    task_manager.add_task("Task 2")
+    assert [e['operation'] for e in events] == ['save', 'load']
+    save, load = events
+    assert save['records'] == 1
+    assert save['bytes_written'] == size
+    assert load['bytes_read'] == size
+    assert all(e['duration_ms'] >= 0 for e in events)
+
+def test_journal_and_mmap_byte_counts(tmp_path):
+    """Test the journal and mmap backends count the bytes they move."""
+    for backend in ('journal', 'mmap'):
+        with patch('main.TASKS_FILE', str(tmp_path / f"{backend}.json")), \
+             patch('main.STORAGE_BACKEND', backend):
+            tm = TaskManager()
+            tm.add_task("Task 1")
+            assert tm.storage.bytes_written > 0
+            if backend == 'journal':
+                assert TaskManager().storage.bytes_read == tm.storage.bytes_written
+
+def test_sqlite_transaction_rolls_back_on_error(sqlite_manager):
+    """Test a failing transaction rolls back the SQLite changes."""
+    sqlite_manager.add_task("Task 1")
+    with pytest.raises(RuntimeError):
+        with sqlite_manager.transaction():
+            sqlite_manager.add_task("Task 2")
+            raise RuntimeError("boom")
+    assert [t['id'] for t in sqlite_manager.tasks] == [1]
+    assert [t['id'] for t in TaskManager().tasks] == [1]
+
+def test_atomic_write_leaves_old_content_on_failure(tmp_path):
+    """Test a failed write never truncates the existing file."""
+    target = tmp_path / "tasks.json"
+    target.write_text("original")
+    with patch('os.replace', side_effect=OSError("disk full")):
+        with pytest.raises(OSError):
+            atomic_write(str(target), b"new content")
+    assert target.read_text() == "original"
+    assert os.listdir(tmp_path) == ["tasks.json"]
+
+def test_atomic_write_cleans_up_failed_write(tmp_path):
+    """Test a write that fails part way leaves no temporary file behind."""
+    with patch('os.fsync', side_effect=OSError("disk full")):
+        with pytest.raises(OSError):
+            atomic_write(str(tmp_path / "tasks.json"), b"new content")
+    assert os.listdir(tmp_path) == []
+
+def test_snapshot_written_outside_lock(task_manager):
+    """Test the snapshot is serialized before the lock and only renamed under it."""
+    import main
+    task_manager.add_task("Task 1")
+    locked = []
+    lock = task_manager.storage.lock
+    def tracking_lock():
+        locked.append(True)
+        return lock()
+    def tracking_write(*args, **kwargs):
+        assert not locked
+        return write_temp(*args, **kwargs)
+    write_temp = main.write_temp
+    with patch.object(task_manager.storage, 'lock', tracking_lock), \
+         patch('main.write_temp', tracking_write):
+        task_manager.add_task("Task 2")
+    assert locked
+    assert [t['id'] for t in TaskManager().tasks] == [1, 2]
+
+def test_prepared_snapshot_discarded_when_stale(task_manager, tmp_path):
+    """Test a snapshot prepared before another process saved is replaced by a merged one."""
+    task_manager.add_task("Task 1")
+    prepare = task_manager.storage.prepare
+    def prepare_then_race(*args):
+        prepared = prepare(*args)
+        TaskManager().add_task("Other")
+        return prepared
+    with patch.object(task_manager.storage, 'prepare', prepare_then_race):
+        task_manager.add_task("Mine")
+    assert [t['description'] for t in TaskManager().tasks] == ["Task 1", "Other", "Mine"]
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+    task_manager.storage.discard((None, str(tmp_path / "gone.tmp"), 0))
+
+def test_save_keeps_backup(task_manager):
+    """Test each snapshot write keeps the previous one as a backup."""
+    task_manager.add_task("Task 1")
+    task_manager.add_task("Task 2")
+    with open(task_manager.storage.backup_path) as f:
+        assert [t['id'] for t in json.load(f)['tasks']] == [1]
+
+def test_corrupted_file_restored_from_backup(task_manager, capsys):
+    """Test a corrupted snapshot is replaced by the last good backup."""
+    task_manager.add_task("Task 1")
+    task_manager.add_task("Task 2")
+    path = task_manager.storage.path
+    with open(path, 'w') as f:
+        f.write('{"tasks": [')
+    tm = TaskManager()
+    captured = capsys.readouterr()
+    assert "Restored tasks from backup" in captured.out
+    assert [t['id'] for t in tm.tasks] == [1]
+    with open(path + '.corrupt') as f:
+        assert f.read() == '{"tasks": ['
+
+def test_corrupted_file_while_saving(task_manager, capsys):
+    """Test a save that finds the file corrupted resets it without deadlocking on its lock."""
+    task_manager.add_task("Task 1")
+    path = task_manager.storage.path
+    with open(path, 'w') as f:
+        f.write('garbage')
+    assert not os.path.exists(path + '.bak')
+    writer = threading.Thread(target=task_manager.add_task, args=("Task 2",), daemon=True)
+    writer.start()
+    writer.join(5)
+    assert not writer.is_alive()
+    assert "Starting with empty task list" in capsys.readouterr().out
+    assert [t['description'] for t in TaskManager().tasks] == ["Task 2"]
+
+def test_corrupted_journal_keeps_valid_records(journal_manager, capsys):
+    """Test a damaged journal line drops only the records after it."""
+    journal_manager.add_task("Task 1")
+    journal_path = journal_manager.storage.journal_path
+    with open(journal_path, 'a') as f:
+        f.write('garbage\n{"op":"add","id":3,"description":"Task 3"}\n')
+    tm = TaskManager()
+    assert "Restored tasks from backup" in capsys.readouterr().out
+    assert [t['id'] for t in tm.tasks] == [1]
+    assert os.path.exists(journal_path + '.corrupt')
+
+@pytest.mark.parametrize("policy, expected", [
+    ("always", 6), ("batch", 5), ("never", 0)
+])
+def test_fsync_policy(tmp_path, policy, expected):
+    """Test the fsync policy controls how often data is synced to disk."""
+    temp_file = tmp_path / "tasks.json"
+    with patch('main.TASKS_FILE', str(temp_file)), \
+         patch('main.STORAGE_BACKEND', 'journal'), \
+         patch('main.FSYNC_POLICY', policy), \
+         patch('os.fsync') as fsync:
+        tm = TaskManager()
+        tm.add_task("Task 1")
+        with tm.transaction():
+            tm.add_task("Task 2")
+            tm.add_task("Task 3")
+        tm._save_tasks(compact=True)
+    # Compaction syncs the snapshot and the truncated journal plus their directory
+    assert fsync.call_count == expected
+
+def test_unknown_fsync_policy(tmp_path):
+    """Test an unknown fsync policy is rejected."""
+    with patch('main.FSYNC_POLICY', 'sometimes'):
+        with pytest.raises(ValueError, match="Unknown fsync policy"):
+            open_storage(str(tmp_path / "tasks.json"))
+
+def test_sqlite_synchronous_follows_fsync_policy(tmp_path):
+    """Test the SQLite synchronous pragma follows the fsync policy."""
+    with patch('main.TASKS_FILE', str(tmp_path / "tasks.json")), \
+         patch('main.STORAGE_BACKEND', 'sqlite'), \
+         patch('main.FSYNC_POLICY', 'never'):
+        tm = TaskManager()
+        assert tm.storage.conn.execute('PRAGMA synchronous').fetchone()[0] == 0
+
+def test_backup_falls_back_to_copy(task_manager):
+    """Test backups are copied where hard links aren't supported."""
+    task_manager.add_task("Task 1")
+    with patch('os.link', side_effect=OSError("not supported")):
+        task_manager.add_task("Task 2")
+    with open(task_manager.storage.backup_path) as f:
+        assert [t['id'] for t in json.load(f)['tasks']] == [1]
+
+def test_sqlite_has_no_backup_to_restore(tmp_path):
+    """Test SQLite storage doesn't claim to restore JSON backups."""
+    assert not SqliteStorage(str(tmp_path / "tasks.json")).recover()
+
+def test_concurrent_managers_do_not_lose_updates(task_manager):
+    """Test two managers loaded from the same file both keep their adds."""
+    other = TaskManager()
+    task_manager.add_task("Task A")
+    other.add_task("Task B")
+    tasks = TaskManager().tasks
+    assert [(t['id'], t['description']) for t in tasks] == [(1, "Task A"), (2, "Task B")]
+    assert other.current_task_id == 1
+
+def test_concurrent_journal_managers_do_not_lose_updates(journal_manager):
+    """Test journal appends from a stale manager are rebased."""
+    other = TaskManager()
+    journal_manager.add_task("Task A")
+    other.add_task("Task B")
+    journal_manager.add_task("Task C")
+    tasks = TaskManager().tasks
+    assert [(t['id'], t['description']) for t in tasks] == [
+        (1, "Task A"), (2, "Task B"), (3, "Task C")
+    ]
+
+def test_rebase_renumbers_dependent_records(task_manager):
+    """Test records referring to a renumbered task follow its new ID."""
+    other = TaskManager()
+    task_manager.add_task("Task A")
+    with other.transaction():
+        other.add_task("Task B")
+        other.edit_task(1, "Task B edited")
+        other.complete_current_task()
+    tasks = TaskManager().tasks
+    assert tasks == [
+        {"id": 1, "description": "Task A", "completed": False},
+        {"id": 2, "description": "Task B edited", "completed": True}
+    ]
+
+def test_snapshot_version_increments(task_manager):
+    """Test every snapshot write bumps the stored version."""
+    task_manager.add_task("Task 1")
+    task_manager.add_task("Task 2")
+    with open(task_manager.storage.path) as f:
+        assert json.load(f)['version'] == 2
+
+def test_touched_file_with_same_version_is_not_stale(task_manager):
+    """Test a changed mtime alone doesn't force a reload."""
+    task_manager.add_task("Task 1")
+    storage = task_manager.storage
+    os.utime(storage.path, ns=(0, 0))
+    assert not storage.is_stale()
+    assert not storage.is_stale()
+    with open(storage.path, 'w') as f:
+        f.write("garbage")
+    assert storage.is_stale()
+    os.remove(storage.path)
+    assert storage.is_stale()
+
+def test_parallel_processes_get_unique_ids(tmp_path):
+    """Test separate processes adding at once never lose tasks or reuse IDs."""
+    script = (
+        "import sys; sys.path.insert(0, {root!r})\n"
+        "from main import TaskManager\n"
+        "tm = TaskManager()\n"
+        "for i in range(20):\n"
+        "    tm.add_task(f'Task {{i}}')\n"
+    ).format(root=os.path.dirname(os.path.abspath(__file__)))
+    procs = [
+        subprocess.Popen([sys.executable, "-c", script], cwd=tmp_path)
+        for _ in range(4)
+    ]
+    for proc in procs:
+        assert proc.wait() == 0
+    with open(tmp_path / "tasks.json") as f:
+        ids = [t['id'] for t in json.load(f)['tasks']]
+    assert sorted(ids) == list(range(1, 81))
+
+def test_rebase_rederives_current_task(task_manager):
+    """Test the current task is recomputed after merging another save."""
+    task_manager.add_task("Task A")
+    other = TaskManager()
+    task_manager.complete_current_task()
+    other.add_task("Task B")
+    assert TaskManager().current_task_id == 2
+
+    third = TaskManager()
+    TaskManager().complete_current_task()
+    third.reopen_task(1)
+    tm = TaskManager()
+    assert tm.current_task_id == 1
+    assert [t['completed'] for t in tm.tasks] == [False, True]
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_iter_tasks_paging(tmp_path, backend):
+    """Test incomplete and completed tasks can be paged lazily."""
+    with patch('main.TASKS_FILE', str(tmp_path / "tasks.json")), \
+         patch('main.STORAGE_BACKEND', backend):
+        tm = TaskManager()
+        with tm.transaction():
+            for i in range(1, 11):
+                tm.add_task(f"Task {i}")
+            for _ in range(4):
+                tm.complete_current_task()
+        ids = lambda tasks: [t['id'] for t in tasks]
+        assert ids(tm.iter_tasks()) == [5, 6, 7, 8, 9, 10]
+        assert ids(tm.iter_tasks(limit=2)) == [5, 6]
+        assert ids(tm.iter_tasks(limit=2, offset=3)) == [8, 9]
+        assert ids(tm.iter_tasks(since_id=8)) == [9, 10]
+        assert ids(tm.iter_completed_tasks(offset=1, limit=2)) == [2, 3]
+        assert ids(tm.iter_completed_tasks(since_id=3)) == [4]
+
+def test_iter_tasks_is_lazy(task_manager):
+    """Test paging stops without visiting the rest of the tasks."""
+    for i in range(5):
+        task_manager.add_task(f"Task {i}")
+    seen = []
+    original = task_manager.store.iter_incomplete
+
+    def tracking(since_id=None):
+        for task in original(since_id):
+            seen.append(task['id'])
+            yield task
+
+    with patch.object(task_manager.store, 'iter_incomplete', tracking):
+        assert len(list(task_manager.iter_tasks(limit=2))) == 2
+    assert seen == [1, 2]
+
+@pytest.fixture
+def archive_manager(tmp_path):
+    """Fixture providing a TaskManager that archives beyond two completed tasks."""
+    with patch('main.TASKS_FILE', str(tmp_path / "tasks.json")), \
+         patch('main.ARCHIVE_THRESHOLD', 2):
+        tm = TaskManager()
+        for i in range(1, 6):
+            tm.add_task(f"Task {i}")
+        for _ in range(3):
+            tm.complete_current_task()
+        yield tm
+
+def test_archive_moves_completed_tasks(archive_manager, tmp_path):
+    """Test completed tasks leave the hot file once past the threshold."""
+    with open(tmp_path / "tasks.json") as f:
+        data = json.load(f)
+    assert [t['id'] for t in data['tasks']] == [4, 5]
+    assert len(archive_manager.storage.archive) == 3
+    assert sorted(os.listdir(tmp_path / "tasks.json.archive")) == ['00000001.ndjson.gz', 'index.json']
+    assert [t['id'] for t in archive_manager.list_completed_tasks()] == [1, 2, 3]
+    assert [t['id'] for t in archive_manager.iter_completed_tasks(since_id=1, limit=1)] == [2]
+
+def test_archive_threshold_zero_disables(tmp_path):
+    """Test a zero threshold keeps every task in the hot store."""
+    with patch('main.TASKS_FILE', str(tmp_path / "tasks.json")), \
+         patch('main.ARCHIVE_THRESHOLD', 0):
+        tm = TaskManager()
+        tm.add_task("Task")
+        tm.complete_current_task()
+    assert len(tm.tasks) == 1
+    assert not os.path.exists(tmp_path / "tasks.json.archive")
+
+def test_reopen_archived_task(archive_manager, tmp_path):
+    """Test reopening restores an archived task to the hot store."""
+    archive_manager.reopen_task(2)
+    assert archive_manager.current_task_id == 2
+    assert archive_manager.store.get(2)['completed'] is False
+    assert archive_manager.storage.archive.get(2) is None
+    assert [t['id'] for t in archive_manager.list_completed_tasks()] == [1, 3]
+    with patch('main.TASKS_FILE', str(tmp_path / "tasks.json")):
+        reloaded = TaskManager()
+    assert reloaded.get_current_task()['id'] == 2
+
+def test_edit_and_remove_archived_tasks(archive_manager):
+    """Test archived tasks can still be edited and removed."""
+    archive_manager.edit_task(1, "Edited")
+    archive_manager.remove_task(3)
+    assert archive_manager.store.get(1)['description'] == "Edited"
+    assert [t['id'] for t in archive_manager.list_completed_tasks()] == [1, 2]
+    assert len(archive_manager.storage.archive) == 1
+
+def test_archive_segment_rewritten_on_restore(archive_manager):
+    """Test restoring one task keeps the rest of its segment."""
+    archive = archive_manager.storage.archive
+    archive.remove(99)
+    archive_manager.reopen_task(3)
+    assert [t['id'] for t in archive.iter_tasks()] == [1, 2]
+    assert archive.get(3) is None
+
+def test_restored_tasks_kept_in_id_order(archive_manager, tmp_path):
+    """Test tasks restored from the archive are saved and listed in ID order."""
+    archive_manager.edit_task(3, "Task 3 edited")
+    archive_manager.edit_task(1, "Task 1 edited")
+    with open(tmp_path / "tasks.json") as f:
+        assert [t['id'] for t in json.load(f)['tasks']] == [1, 3, 4, 5]
+    assert [t['id'] for t in archive_manager.list_completed_tasks()] == [1, 2, 3]
+    with patch('main.TASKS_FILE', str(tmp_path / "tasks.json")), patch('main.ARCHIVE_THRESHOLD', 2):
+        reloaded = TaskManager()
+    assert [t['id'] for t in reloaded.iter_all_tasks()] == [1, 2, 3, 4, 5]
+
+def test_archived_copy_shadowed_by_hot_task(archive_manager):
+    """Test a task in both tiers, as after a crash mid-archive, is listed once."""
+    archive_manager.store.insert({'id': 1, 'description': "Task 1", 'completed': True})
+    assert [t['id'] for t in archive_manager.list_completed_tasks()] == [1, 2, 3]
+
+def test_journal_archive_replays_restore(tmp_path):
+    """Test a restored task is replayed from the journal."""
+    with patch('main.TASKS_FILE', str(tmp_path / "tasks.json")), \
+         patch('main.STORAGE_BACKEND', 'journal'), \
+         patch('main.ARCHIVE_THRESHOLD', 1):
+        tm = TaskManager()
+        tm.add_task("Task 1")
+        tm.add_task("Task 2")
+        tm.complete_current_task()
+        tm.complete_current_task()
+        tm.reopen_task(1)
+        reloaded = TaskManager()
+    assert reloaded.store.get(1)['completed'] is False
+    assert [t['id'] for t in reloaded.list_completed_tasks()] == [2]
+
+def test_task_archive_segments(tmp_path):
+    """Test lookups skip segments by ID range and empty segments are deleted."""
+    archive = TaskArchive(str(tmp_path / "archive"), fsync=False)
+    archive.add_segment([{'id': i, 'description': f"Task {i}", 'completed': True} for i in (3, 1)])
+    archive.add_segment([{'id': 5, 'description': "Task 5", 'completed': True}])
+    assert [t['id'] for t in archive.iter_tasks(since_id=3)] == [5]
+    assert archive.get(2) is None
+    archive.remove(2)
+    archive.remove(5)
+    assert len(archive) == 2
+    assert sorted(os.listdir(tmp_path / "archive")) == ['00000001.ndjson.gz', 'index.json']
+
+@pytest.mark.parametrize("file_format", ['json', 'compact', 'zlib', 'indexed'])
+def test_file_formats_round_trip(tmp_path, file_format):
+    """Test each file format is written and auto-detected on load."""
+    path = str(tmp_path / "tasks.json")
+    with patch('main.TASKS_FILE', path), patch('main.FILE_FORMAT', file_format):
+        tm = TaskManager()
+        tm.add_task("Same")
+        tm.add_task("Same")
+        tm.add_task("Other")
+        tm.complete_current_task()
+    with open(path, 'rb') as f:
+        assert f.read().startswith(SERIALIZERS[file_format].magic)
+    with patch('main.TASKS_FILE', path):
+        reloaded = TaskManager()
+    assert reloaded.tasks == tm.tasks
+    assert reloaded.current_task_id == 2
+
+def test_compact_format_is_smaller():
+    """Test the compact layouts are smaller than pretty JSON."""
+    data = {'tasks': [{'id': i, 'description': f"Task {i}", 'completed': i % 2 == 0}
+                      for i in range(1, 101)], 'current_task_id': 1, 'next_id': 101}
+    sizes = {name: len(s.dumps(data)) for name, s in SERIALIZERS.items()}
+    assert sizes['zlib'] < sizes['compact'] < sizes['json'] / 2
+    for serializer in SERIALIZERS.values():
+        assert decode_snapshot(serializer.dumps(data)) == data
+
+def test_corrupted_compressed_file(tmp_path, capsys):
+    """Test a damaged compressed file is treated as corrupted."""
+    path = tmp_path / "tasks.json"
+    path.write_bytes(SERIALIZERS['zlib'].magic + b'garbage')
+    with patch('main.TASKS_FILE', str(path)):
+        tm = TaskManager()
+    assert tm.tasks == []
+    assert "Corrupted tasks file" in capsys.readouterr().out
+
+def test_unknown_file_format(tmp_path):
+    """Test an unknown TASKNOW_FORMAT is rejected."""
+    with patch('main.FILE_FORMAT', 'xml'), pytest.raises(ValueError, match="Unknown file format"):
+        open_storage(str(tmp_path / "tasks.json"))
+
+def test_task_record_dict_compatibility():
+    """Test Task records can be read like the dicts they replace."""
+    task = Task.from_dict({'id': 1, 'description': "Task 1", 'completed': False})
+    assert not hasattr(task, '__dict__')
+    assert (task['id'], task['description'], task['completed']) == (1, "Task 1", False)
+    assert task.to_dict() == {'id': 1, 'description': "Task 1", 'completed': False}
+    assert repr(task) == "Task(1, 'Task 1', False)"
+    with pytest.raises(KeyError):
+        task['missing']
+
+def test_public_methods_return_dicts(task_manager):
+    """Test the manager hands out plain dicts, not the internal records."""
+    task_manager.add_task("Task 1")
+    task_manager.add_task("Task 2")
+    task_manager.complete_current_task()
+    assert isinstance(task_manager.store.get(1), Task)
+    assert task_manager.tasks == [{'id': 1, 'description': "Task 1", 'completed': True},
+                                  {'id': 2, 'description': "Task 2", 'completed': False}]
+    assert task_manager.get_current_task() == task_manager.list_tasks()[0]
+    assert type(task_manager.list_completed_tasks()[0]) is dict
+
+@pytest.fixture
+def indexed_file(tmp_path):
+    """Fixture writing an indexed snapshot with tasks 1-2 completed and 3-4 open."""
+    path = str(tmp_path / "tasks.json")
+    with patch('main.TASKS_FILE', path), patch('main.FILE_FORMAT', 'indexed'):
+        tm = TaskManager()
+        with tm.transaction():
+            for i in range(1, 5):
+                tm.add_task(f"Task {i}")
+            tm.complete_current_task()
+            tm.complete_current_task()
+        yield path
+
+def test_lazy_load_skips_completed_tasks(indexed_file):
+    """Test show, add and done never parse the completed history."""
+    tm = TaskManager()
+    assert isinstance(tm.store, LazyTaskStore)
+    assert tm.get_current_task()['id'] == 3
+    tm.add_task("Task 5")
+    tm.complete_current_task()
+    assert tm.store.completed_count() == 3
+    assert not tm.store.loaded
+    with patch('main.FILE_FORMAT', 'json'):
+        reloaded = TaskManager()
+    assert [(t['id'], t['completed']) for t in reloaded.tasks] == [
+        (1, True), (2, True), (3, True), (4, False), (5, False)]
+
+@pytest.mark.parametrize("command", [
+    lambda tm: tm.list_completed_tasks(),
+    lambda tm: tm.reopen_task(1),
+    lambda tm: tm.edit_task(2, "Edited"),
+    lambda tm: tm.remove_task(1),
+    lambda tm: tm.tasks,
+])
+def test_lazy_load_on_demand(indexed_file, command):
+    """Test commands touching completed tasks load them first."""
+    tm = TaskManager()
+    command(tm)
+    assert tm.store.loaded
+    assert [t['id'] for t in tm.store] == sorted(t['id'] for t in tm.store)
+
+def test_lazy_store_insert_over_completed_task():
+    """Test inserting an ID from the completed section replaces it."""
+    store = LazyTaskStore([{'id': 2, 'description': "Task 2", 'completed': False}], 3,
+                          b'{"id":1,"description":"Task 1","completed":true}\n')
+    store.insert({'id': 3, 'description': "Task 3", 'completed': False})
+    assert not store.loaded
+    store.insert({'id': 1, 'description': "Reopened", 'completed': False})
+    assert len(store) == 3
+    assert store.get(1)['description'] == "Reopened"
+
+def test_lazy_store_remove_completed_task():
+    """Test removing an unparsed completed task drops it for good."""
+    store = LazyTaskStore([], 2, b'{"id":1,"description":"Task 1","completed":true}\n')
+    assert store.remove(1)['id'] == 1
+    assert list(store) == []
+
+def test_lazy_journal_replay(tmp_path):
+    """Test journal records for completed tasks are replayed onto a lazy store."""
+    with patch('main.TASKS_FILE', str(tmp_path / "tasks.json")), \
+         patch('main.FILE_FORMAT', 'indexed'), \
+         patch('main.STORAGE_BACKEND', 'journal'):
+        tm = TaskManager()
+        tm.add_task("Task 1")
+        tm.add_task("Task 2")
+        tm.complete_current_task()
+        tm._save_tasks(compact=True)
+        tm.add_task("Task 3")
+        tm.reopen_task(1)
+        reloaded = TaskManager()
+    assert reloaded.current_task_id == 1
+    assert [t['completed'] for t in reloaded.tasks] == [False, False, False]
+
+def test_truncated_indexed_file(tmp_path, capsys):
+    """Test an indexed file missing its task lines is treated as corrupted."""
+    path = tmp_path / "tasks.json"
+    path.write_bytes(b'TASKNOW-I\n{"incomplete":2,"incomplete_bytes":50,"completed":0}\n{"id":1')
+    with patch('main.TASKS_FILE', str(path)), patch('main.FILE_FORMAT', 'indexed'):
+        tm = TaskManager()
+    assert tm.tasks == []
+    assert "Corrupted tasks file" in capsys.readouterr().out
+
+@pytest.fixture
+def mmap_manager(tmp_path):
+    """Fixture providing a TaskManager backed by the memory-mapped storage."""
+    with patch('main.TASKS_FILE', str(tmp_path / "tasks.json")), \
+         patch('main.STORAGE_BACKEND', 'mmap'):
+        yield TaskManager()
+
+def test_mmap_storage_operations(mmap_manager, tmp_path):
+    """Test the task operations run against the memory-mapped store."""
+    assert isinstance(mmap_manager.storage, MmapStorage)
+    for i in range(1, 5):
+        mmap_manager.add_task(f"Task {i}")
+    mmap_manager.complete_current_task()
+    mmap_manager.edit_task(3, "Task 3 edited")
+    mmap_manager.remove_task(2)
+    assert mmap_manager.get_current_task()['id'] == 3
+    assert [t['id'] for t in mmap_manager.list_tasks()] == [3, 4]
+    assert [t['id'] for t in mmap_manager.iter_completed_tasks(since_id=0)] == [1]
+    mmap_manager.reopen_task(1)
+    assert len(mmap_manager.store) == 3
+    assert mmap_manager.store.completed_count() == 0
+    assert mmap_manager.store.get(2) is None
+    assert mmap_manager.store.get(99) is None
+
+    reloaded = TaskManager()
+    assert reloaded.tasks == mmap_manager.tasks
+    assert reloaded.current_task_id == 1
+    assert reloaded.store.next_id == 5
+    assert not os.path.exists(tmp_path / "tasks.json")
+
+def test_mmap_updates_in_place(mmap_manager, tmp_path):
+    """Test completing and removing tasks doesn't grow either file."""
+    for i in range(10):
+        mmap_manager.add_task(f"Task {i}")
+    sizes = [os.path.getsize(tmp_path / name) for name in ("tasks.mmap", "tasks.heap")]
+    mmap_manager.complete_current_task()
+    mmap_manager.remove_task(5)
+    mmap_manager.reopen_task(1)
+    assert [os.path.getsize(tmp_path / name) for name in ("tasks.mmap", "tasks.heap")] == sizes
+
+def test_mmap_transaction_rollback(mmap_manager):
+    """Test a failed transaction undoes the in-place writes."""
+    mmap_manager.add_task("Task 1")
+    with pytest.raises(RuntimeError):
+        with mmap_manager.transaction():
+            mmap_manager.add_task("Task 2")
+            mmap_manager.complete_current_task()
+            mmap_manager.edit_task(2, "Edited")
+            raise RuntimeError("boom")
+    assert mmap_manager.tasks == [{'id': 1, 'description': "Task 1", 'completed': False}]
+    assert mmap_manager.current_task_id == 1
+    assert mmap_manager.store.next_id == 2
+
+def test_mmap_transaction_blocks_other_writers(mmap_manager):
+    """Test another writer waits for an open transaction instead of being rolled back."""
+    other = TaskManager()
+    writer = threading.Thread(target=other.add_task, args=("b committed",))
+    with pytest.raises(RuntimeError):
+        with mmap_manager.transaction():
+            mmap_manager.add_task("a pending")
+            writer.start()
+            writer.join(0.2)
+            assert writer.is_alive()
+            raise RuntimeError("boom")
+    writer.join(5)
+    assert [t['description'] for t in TaskManager().tasks] == ["b committed"]
+
+def test_mmap_migrates_json_file(tmp_path):
+    """Test an existing JSON tasks file is imported on first use."""
+    path = tmp_path / "tasks.json"
+    path.write_text(json.dumps({'tasks': [
+        {'id': 1, 'description': "Task 1", 'completed': True},
+        {'id': 3, 'description': "Task 3", 'completed': False},
+    ], 'current_task_id': 3, 'next_id': 6}))
+    with patch('main.TASKS_FILE', str(path)), patch('main.STORAGE_BACKEND', 'mmap'):
+        tm = TaskManager()
+        assert [t['id'] for t in tm.tasks] == [1, 3]
+        assert tm.current_task_id == 3
+        tm.add_task("Task 6")
+        assert [t['id'] for t in TaskManager().tasks] == [1, 3, 6]
+
+def test_mmap_store_grows_and_is_shared(tmp_path):
+    """Test the record file grows and other mappings see new records."""
+    paths = str(tmp_path / "tasks.mmap"), str(tmp_path / "tasks.heap")
+    first = MmapTaskStore(*paths)
+    second = MmapTaskStore(*paths)
+    for i in range(100):
+        first.add(f"Task {i}")
+    first.insert({'id': 50, 'description': "Replaced", 'completed': True})
+    assert second.next_id == 101
+    assert second.get(100)['description'] == "Task 99"
+    assert second.get(50)['description'] == "Replaced"
+    first.set_completed(1, True)
+    first.commit(fsync=False)
+    assert second.first_incomplete() == 2
+    first.insert({'id': 1, 'description': "Task 0", 'completed': False})
+    assert second.first_incomplete() == 1
+    first.close()
+    second.close()
+
+def test_mmap_background_compaction(mmap_manager, tmp_path):
+    """Test the heap is compacted once it is mostly garbage."""
+    mmap_manager.add_task("Keep")
+    mmap_manager.add_task("x" * 100)
+    with patch('main.MMAP_COMPACT_MIN_GARBAGE', 50):
+        mmap_manager.edit_task(2, "Short")
+        mmap_manager.storage.compaction.join()
+    assert os.path.getsize(tmp_path / "tasks.heap") == len("KeepShort")
+    assert [t['description'] for t in TaskManager().tasks] == ["Keep", "Short"]
+
+def test_mmap_compaction_seen_by_other_process(tmp_path):
+    """Test a reader reopens the heap after another mapping compacts it."""
+    paths = str(tmp_path / "tasks.mmap"), str(tmp_path / "tasks.heap")
+    writer = MmapTaskStore(*paths)
+    reader = MmapTaskStore(*paths)
+    writer.add("Old")
+    writer.add("Task 2")
+    writer.set_description(1, "New")
+    writer.remove(2)
+    writer.commit(fsync=True)
+    writer.compact()
+    assert reader.get(1)['description'] == "New"
+    writer.close()
+    reader.close()
+
+def test_mmap_compaction_waits_for_commit(tmp_path):
+    """Test compaction is skipped while uncommitted writes exist."""
+    store = MmapTaskStore(str(tmp_path / "tasks.mmap"), str(tmp_path / "tasks.heap"))
+    store.add("Task 1")
+    store.set_description(1, "Edited")
+    store.compact()
+    assert os.path.getsize(tmp_path / "tasks.heap") == len("Task 1Edited")
+    store.close()
+
+def test_mmap_reader_waits_during_compaction(tmp_path):
+    """Test readers retry while a compaction is swapping the heap."""
+    store = MmapTaskStore(str(tmp_path / "tasks.mmap"), str(tmp_path / "tasks.heap"))
+    store.add("Task 1")
+    store._set_field('generation', 1)
+    timer = threading.Timer(0.01, store._set_field, ('generation', 2))
+    timer.start()
+    assert store.get(1)['description'] == "Task 1"
+    timer.join()
+    store.close()
+
+def test_mmap_compact_flag_and_fsync(tmp_path):
+    """Test forced compaction and syncing under the always policy."""
+    with patch('main.TASKS_FILE', str(tmp_path / "tasks.json")), \
+         patch('main.STORAGE_BACKEND', 'mmap'), patch('main.FSYNC_POLICY', 'always'):
+        tm = TaskManager()
+        tm.add_task("Task 1")
+        tm.edit_task(1, "Edited")
+        with patch('os.fsync') as fsync:
+            tm._save_tasks(compact=True)
+    assert fsync.call_count == 2
+    assert os.path.getsize(tmp_path / "tasks.heap") == len("Edited")
+
+def test_mmap_rejects_foreign_file(tmp_path):
+    """Test a file that isn't a record file is refused."""
+    path = tmp_path / "tasks.mmap"
+    path.write_bytes(b'not a record file')
+    with pytest.raises(ValueError, match="Not a task record file"):
+        MmapTaskStore(str(path), str(tmp_path / "tasks.heap"))
+
+def test_search_index():
+    """Test the inverted index matches whole words, case-insensitively."""
+    index = SearchIndex([{'id': 1, 'description': "Buy milk"},
+                         {'id': 2, 'description': "buy Bread, and MILK"}])
+    assert index.search("milk") == [1, 2]
+    assert index.search("MILK bread") == [2]
+    assert index.search("mil") == []
+    assert index.search("!!") == []
+    index.remove(2, "buy Bread, and MILK")
+    index.remove(3, "unknown words")
+    assert index.search("bread") == []
+    assert index.search("buy") == [1]
+
+def test_search_tasks_kept_up_to_date(task_manager):
+    """Test add, edit and remove keep the index in step with the tasks."""
+    task_manager.keep_index = True
+    task_manager.add_task("Write report")
+    assert [t['id'] for t in task_manager.search_tasks("report")] == [1]
+    assert task_manager._index is not None
+    task_manager.add_task("Review report")
+    task_manager.edit_task(1, "Write summary")
+    assert [t['id'] for t in task_manager.search_tasks("report")] == [2]
+    assert [t['id'] for t in task_manager.search_tasks("summary")] == [1]
+    task_manager.remove_task(2)
+    assert task_manager.search_tasks("report") == []
+    task_manager.add_task("Draft report")
+    task_manager.edit_tasks([1, 3], "Send memo")
+    assert [t['id'] for t in task_manager.search_tasks("memo")] == [1, 3]
+    task_manager.remove_tasks([1])
+    assert [t['id'] for t in task_manager.search_tasks("memo")] == [3]
+
+def test_search_tasks_scans_without_index(task_manager):
+    """Test a one-off search scans the tasks instead of building an index."""
+    task_manager.add_task("Write report")
+    task_manager.add_task("Review report")
+    task_manager.complete_current_task()
+    assert [t['id'] for t in task_manager.search_tasks("report")] == [2]
+    assert [t['id'] for t in task_manager.search_tasks("report", True)] == [1, 2]
+    assert task_manager.search_tasks("") == []
+    assert task_manager._index is None
+
+def test_search_tasks_completed(task_manager):
+    """Test completed tasks are only found when asked for."""
+    task_manager.add_task("Old report")
+    task_manager.add_task("New report")
+    task_manager.complete_current_task()
+    assert [t['id'] for t in task_manager.search_tasks("report")] == [2]
+    assert task_manager.search_tasks("report", include_completed=True) == [
+        {'id': 1, 'description': "Old report", 'completed': True},
+        {'id': 2, 'description': "New report", 'completed': False},
+    ]
+
+@pytest.mark.parametrize('keep_index', [False, True])
+def test_search_tasks_includes_archive(archive_manager, keep_index):
+    """Test archived tasks are searched along with completed ones."""
+    archive_manager.keep_index = keep_index
+    assert archive_manager.search_tasks("task") == [
+        {'id': 4, 'description': "Task 4", 'completed': False},
+        {'id': 5, 'description': "Task 5", 'completed': False},
+    ]
+    archive_manager.reopen_task(1)
+    archive_manager.add_task("Task 6")
+    assert [t['id'] for t in archive_manager.search_tasks("task")] == [1, 4, 5, 6]
+    assert [t['id'] for t in archive_manager.search_tasks("task", True)] == [1, 2, 3, 4, 5, 6]
+    assert [t['id'] for t in archive_manager.search_tasks("3", True)] == [3]
+    archive_manager.remove_task(2)
+    assert [t['id'] for t in archive_manager.search_tasks("2", True)] == []
+
+@pytest.mark.parametrize('backend', ['sqlite', 'mmap'])
+def test_write_through_storage_detects_other_writers(tmp_path, backend):
+    """Test only another process's commit makes a write-through store stale."""
+    with patch('main.TASKS_FILE', str(tmp_path / "tasks.json")), \
+         patch('main.STORAGE_BACKEND', backend):
+        tm = TaskManager()
+        tm.add_task("Task 1")
+        assert not tm.storage.is_stale()
+        TaskManager().add_task("Task 2")
+        assert tm.storage.is_stale()
+        tm.add_task("Task 3")
+        assert tm.storage.is_stale()
+        tm._load_tasks()
+        assert not tm.storage.is_stale()
+        assert [t['id'] for t in TaskManager().tasks] == [1, 2, 3]
+
+@pytest.mark.parametrize('backend', ['sqlite', 'mmap'])
+def test_search_index_sees_other_writers(tmp_path, backend):
+    """Test a long-lived manager rebuilds its index after another process saves."""
+    with patch('main.TASKS_FILE', str(tmp_path / "tasks.json")), \
+         patch('main.STORAGE_BACKEND', backend):
+        tm = TaskManager()
+        tm.keep_index = True
+        tm.add_task("Lion")
+        assert tm.search_tasks("zebra") == []
+        index = tm._index
+        tm.add_task("Tiger")
+        assert [t['id'] for t in tm.search_tasks("tiger")] == [2]
+        assert tm._index is index
+        TaskManager().add_task("Zebra")
+        assert [t['id'] for t in tm.search_tasks("zebra")] == [3]
+
+def test_search_indexed_keeps_history_unparsed(tmp_path):
+    """Test searching open tasks of an indexed file leaves the completed section alone."""
+    with patch('main.TASKS_FILE', str(tmp_path / "tasks.json")), patch('main.FILE_FORMAT', 'indexed'):
+        tm = TaskManager()
+        tm.add_task("Old task")
+        tm.add_task("New task")
+        tm.complete_current_task()
+        tm = TaskManager()
+        assert [t['id'] for t in tm.search_tasks("task")] == [2]
+        assert tm.search_tasks("") == []
+        assert not tm.store.loaded
+        assert [t['id'] for t in tm.search_tasks("task", True)] == [1, 2]
+
+@pytest.fixture
+def registry(tmp_path):
+    """Fixture providing a list registry in a temp directory."""
+    with patch('main.REGISTRY_FILE', str(tmp_path / "lists" / "lists.json")):
+        yield ListRegistry()
+
+def test_registry_add_and_remove(registry, tmp_path):
+    """Test lists are registered, looked up and unregistered by name."""
+    assert registry.names() == []
+    path = registry.add("work")
+    assert path == str(tmp_path / "lists" / "work.json")
+    registry.add("home", "home.json")
+    assert registry.names() == ["home", "work"]
+    assert registry.tasks_file("home") == os.path.abspath("home.json")
+    registry.remove("home")
+    assert registry.names() == ["work"]
+    with pytest.raises(ValueError, match="No such list"):
+        registry.tasks_file("home")
+    with pytest.raises(ValueError, match="No such list"):
+        registry.remove("home")
+    with pytest.raises(ValueError, match="already exists"):
+        registry.add("work")
+    with pytest.raises(ValueError, match="Invalid list name"):
+        registry.add("a/b")
+
+def test_registry_summaries_cached(registry):
+    """Test summaries are only rebuilt for lists whose files changed."""
+    for name in ("home", "work"):
+        registry.add(name)
+    with patch('main.TASKS_FILE', registry.tasks_file("work")):
+        tm = TaskManager()
+        tm.add_task("Write report")
+        tm.add_task("Review report")
+    summaries = registry.summaries()
+    assert {name: (s['current'], s['open']) for name, s in summaries.items()} == {
+        'home': (None, 0), 'work': ("Write report", 2)}
+    with patch.object(ListRegistry, '_summarize', side_effect=AssertionError):
+        assert registry.summaries() == summaries
+    tm.complete_current_task()
+    assert registry.summaries()['work']['current'] == "Review report"
+
+def test_registry_summaries_other_backends(registry, tmp_path):
+    """Test every backend's state signature changes when its tasks do."""
+    for backend in ('journal', 'sqlite', 'mmap'):
+        registry.add(backend)
+        with patch('main.TASKS_FILE', registry.tasks_file(backend)), \
+             patch('main.STORAGE_BACKEND', backend):
+            tm = TaskManager()
+            tm.add_task("Task 1")
+            tm.add_task("Task 2")
+            tm.complete_current_task()
+            assert registry.summaries()[backend]['open'] == 1
+            # Reopening a later task changes neither the current task nor any file size
+            tm.reopen_task(1)
+            assert registry.summaries()[backend]['open'] == 2
+
+def test_import_tasks(task_manager):
+    """Test bulk import assigns new IDs and saves once."""
+    task_manager.add_task("Existing")
+    count = task_manager.import_tasks([
+        {'id': 99, 'description': "Done", 'completed': True},
+        {'description': "Open"},
+    ])
+    assert count == 2
+    assert task_manager.write_count == 2
+    assert task_manager.tasks == [
+        {'id': 1, 'description': "Existing", 'completed': False},
+        {'id': 2, 'description': "Done", 'completed': True},
+        {'id': 3, 'description': "Open", 'completed': False},
+    ]
+    assert TaskManager().tasks == task_manager.tasks
+    assert [t['id'] for t in task_manager.search_tasks("open")] == [3]
+
+def test_import_tasks_sets_current_and_rolls_back(task_manager):
+    """Test importing into an empty list picks a current task, and errors import nothing."""
+    task_manager.import_tasks([{'description': "Done", 'completed': True}, {'description': "Open"}])
+    assert task_manager.current_task_id == 2
+    rows = read_ndjson_tasks(io.BytesIO(b'{"description": "Three"}\nnot json\n'))
+    with pytest.raises(ValueError, match="Invalid task on line 2"):
+        task_manager.import_tasks(rows)
+    assert len(TaskManager().tasks) == 2
+    assert len(task_manager.tasks) == 2
+
+def test_import_tasks_journal(journal_manager):
+    """Test imported completed tasks survive a journal replay."""
+    journal_manager.import_tasks([{'description': "Done", 'completed': True}, {'description': "Open"}])
+    assert [t['completed'] for t in TaskManager().tasks] == [True, False]
+
+@pytest.mark.parametrize('backend', ['sqlite', 'mmap'])
+def test_import_tasks_write_through(tmp_path, backend):
+    """Test stores that write rows themselves don't queue a record per imported task."""
+    with patch('main.TASKS_FILE', str(tmp_path / "tasks.json")), \
+         patch('main.STORAGE_BACKEND', backend):
+        tm = TaskManager()
+        with patch.object(tm.storage, 'save', wraps=tm.storage.save) as save:
+            tm.import_tasks({'description': f"Task {i}", 'completed': i == 0} for i in range(100))
+        assert len(save.call_args[0][0]) == 1
+        tasks = TaskManager().tasks
+    assert len(tasks) == 100
+    assert [t['completed'] for t in tasks[:2]] == [True, False]
+
+def test_iter_all_tasks_includes_archive(archive_manager):
+    """Test exporting walks the archive and the hot store in ID order."""
+    archive_manager.reopen_task(2)
+    assert [t['id'] for t in archive_manager.iter_all_tasks()] == [1, 2, 3, 4, 5]
+
+def test_read_ndjson_tasks():
+    """Test NDJSON parsing across chunks, blank lines and bad rows."""
+    content = b''.join(b'{"description": "Task %d", "completed": %s}\n' % (i, b'true' if i % 2 else b'false')
+                       for i in range(5)) + b'\n{"description": "Last"}'
+    with patch('main.IMPORT_CHUNK_SIZE', 2):
+        rows = list(read_ndjson_tasks(io.BytesIO(content)))
+    assert [r['description'] for r in rows] == ["Task 0", "Task 1", "Task 2", "Task 3", "Task 4", "Last"]
+    assert [r['completed'] for r in rows] == [False, True, False, True, False, False]
+    for bad in (b'{"description": "A"}\n[1, 2]\n', b'{"description": "A"}\n1, 2\n',
+                b'{"description": "A"}\n{"completed": true}\n'):
+        with pytest.raises(ValueError, match="Invalid task on line 2"):
+            list(read_ndjson_tasks(io.BytesIO(bad)))
+
+def test_read_csv_tasks():
+    """Test CSV parsing of descriptions and completed flags."""
+    rows = list(read_csv_tasks(io.StringIO('id,description,completed\n1,"A, quoted",TRUE\n2,B,\n3,,x\n')))
+    assert rows == [{'description': "A, quoted", 'completed': True},
+                    {'description': "B", 'completed': False},
+                    {'description': "", 'completed': True}]
+    with pytest.raises(ValueError, match="description column"):
+        list(read_csv_tasks(io.StringIO('id,title\n1,A\n')))
+
+def test_format_tasks_round_trip():
+    """Test exported rows parse back to the same tasks."""
+    tasks = [{'id': 1, 'description': 'Say "hi", then\nleave', 'completed': True},
+             {'id': 2, 'description': "Café", 'completed': False}]
+    csv_text = '\n'.join(format_tasks(tasks, 'csv')) + '\n'
+    assert csv_text.startswith('id,description,completed\n1,"Say ""hi"", then\nleave",true\n')
+    ndjson = ('\n'.join(format_tasks(tasks, 'ndjson')) + '\n').encode()
+    expected = [{'description': t['description'], 'completed': t['completed']} for t in tasks]
+    assert list(read_csv_tasks(io.StringIO(csv_text))) == expected
+    assert list(read_ndjson_tasks(io.BytesIO(ndjson))) == expected
+
+def test_parse_task_ids():
+    """Test IDs and ranges expand in order and stop below the limit."""
+    assert list(parse_task_ids(['3', '7', '10-12'], 100)) == [3, 7, 10, 11, 12]
+    assert list(parse_task_ids(['1,4-5', '8-1000000000'], 10)) == [1, 4, 5, 8, 9]
+    with pytest.raises(ValueError, match="Invalid task IDs: 3-"):
+        parse_task_ids(['1', '3-'], 10)
+    with pytest.raises(ValueError, match="Invalid task IDs: 1,5-3"):
+        parse_task_ids(['1,5-3'], 10)
+
+def test_parse_task_ids_reports_ids_past_limit(capsys):
+    """Test IDs at or past the limit are reported while the rest still expand."""
+    assert list(parse_task_ids(['1', '10'], 10)) == [1]
+    assert list(parse_task_ids(['12-20', '8-14', '30'], 10)) == [8, 9]
+    assert capsys.readouterr().out == (
+        "Error: Task 10 not found\nError: Tasks 10-20 not found\nError: Task 30 not found\n")
+
+def test_bulk_operations(task_manager, capsys):
+    """Test bulk methods change many tasks with one save each."""
+    task_manager.import_tasks({'description': f"Task {i}"} for i in range(1, 11))
+    assert task_manager.complete_tasks([1, 2, 3, 5, 99]) == 4
+    assert task_manager.current_task_id == 4
+    assert task_manager.complete_tasks([1, 4]) == 1
+    assert task_manager.current_task_id == 6
+    assert len(task_manager.search_tasks("task")) == 5
+    assert task_manager.edit_tasks(range(9, 12), "Renamed") == 2
+    assert [t['id'] for t in task_manager.search_tasks("renamed")] == [9, 10]
+    assert task_manager.reopen_tasks([2, 6, 7]) == 1
+    assert task_manager.current_task_id == 2
+    assert task_manager.remove_tasks(completed=True) == 4
+    assert task_manager.remove_tasks([2, 6], completed=True) == 0
+    assert task_manager.remove_tasks([2, 6]) == 2
+    assert task_manager.current_task_id == 7
+    assert task_manager.write_count == 7
+    tm = TaskManager()
+    assert [(t['id'], t['description']) for t in tm.tasks] == [
+        (7, "Task 7"), (8, "Task 8"), (9, "Renamed"), (10, "Renamed")]
+    assert tm.current_task_id == 7
+    assert capsys.readouterr().out == (
+        "Error: Task 99 not found\nError: Task 1 is already completed\n"
+        "Error: Task 11 not found\nError: Tasks 6-7 are not completed\n")
+
+def test_bulk_reopen_all_completed(task_manager):
+    """Test reopening every completed task makes the earliest current."""
+    task_manager.import_tasks({'description': f"Task {i}", 'completed': i < 4} for i in range(1, 6))
+    assert task_manager.reopen_tasks(completed=True) == 3
+    assert task_manager.current_task_id == 1
+    assert task_manager.list_completed_tasks() == []
+
+def test_bulk_operations_sqlite(sqlite_manager):
+    """Test bulk methods against the SQLite store."""
+    sqlite_manager.import_tasks({'description': f"Task {i}"} for i in range(1, 6))
+    assert sqlite_manager.complete_tasks(range(1, 4)) == 3
+    assert sqlite_manager.remove_tasks(completed=True) == 3
+    assert [t['id'] for t in TaskManager().tasks] == [4, 5]
+
+def test_bulk_operations_restore_archived(archive_manager):
+    """Test bulk methods reach archived tasks with one archive pass."""
+    assert archive_manager.reopen_tasks([1, 3]) == 2
+    assert archive_manager.current_task_id == 1
+    assert [t['id'] for t in archive_manager.list_completed_tasks()] == [2]
+    assert archive_manager.edit_tasks([2], "Archived") == 1
+    assert archive_manager.remove_tasks(completed=True) == 1
+    assert len(archive_manager.storage.archive) == 0
+    assert sorted(t['id'] for t in TaskManager().tasks) == [1, 3, 4, 5]
+
+def test_archive_remove_many(archive_manager):
+    """Test removing several archived tasks rewrites the archive once."""
+    archive = archive_manager.storage.archive
+    archive.add_segment([{'id': 10, 'description': "Task 10", 'completed': True}])
+    with patch.object(archive, '_write_index', wraps=archive._write_index) as write_index:
+        archive.remove_many({1, 2, 10, 99})
+    assert write_index.call_count == 1
+    assert [t['id'] for t in archive.iter_tasks()] == [3]
+    archive.remove_many({99})
+    assert len(archive) == 1
+
+def test_watcher_changes(archive_manager):
+    """Test state diffs become added, edited, completed, reopened and removed events."""
+    watcher = TaskWatcher(archive_manager)
+    old = watcher.state()
+    archive_manager.add_task("Task 6")
+    archive_manager.edit_task(4, "Task 4 edited")
+    archive_manager.complete_current_task()
+    archive_manager.reopen_task(1)
+    archive_manager.remove_task(5)
+    archive_manager.edit_task(2, "Task 2 edited")
+    events = watcher.changes(old, watcher.state())
+    assert [(e['event'], e['task']['id'] if 'task' in e else e['id']) for e in events] == [
+        ('reopened', 1), ('edited', 2), ('edited', 4), ('completed', 4), ('added', 6),
+        ('removed', 5), ('current', 1)]
+    watcher.watcher.close()
+
+def test_watcher_ignores_archiving(archive_manager):
+    """Test completed tasks moving into the archive aren't reported as removed."""
+    watcher = TaskWatcher(archive_manager)
+    archive_manager.add_task("Task 6")
+    archive_manager.add_task("Task 7")
+    archive_manager.complete_current_task()
+    old = watcher.state()
+    archive_manager.complete_current_task()
+    archive_manager.complete_current_task()
+    assert [t['id'] for t in archive_manager.tasks] == [7]
+    events = watcher.changes(old, watcher.state())
+    assert [(e['event'], e['task']['id']) for e in events] == [
+        ('completed', 5), ('completed', 6), ('current', 7)]
+    watcher.watcher.close()
+
+def _run_watcher(watcher, count):
+    thread = threading.Thread(target=watcher.run, args=(count, 10))
+    thread.start()
+    return thread
+
+def _wait_for_output(capsys, output, expected):
+    """Collect captured stdout until it ends with ``expected``."""
+    import time
+    deadline = time.monotonic() + 10
+    while not output[0].endswith(expected):
+        assert time.monotonic() < deadline, output[0]
+        time.sleep(0.01)
+        output[0] += capsys.readouterr().out
+
+@pytest.mark.parametrize('use_inotify', [True, False])
+def test_watcher_run(task_manager, capsys, use_inotify):
+    """Test the watcher prints the current task as other processes change it."""
+    watcher = TaskWatcher(TaskManager(), poll_interval=0.01)
+    if not use_inotify:
+        watcher.watcher.close()
+    else:
+        assert watcher.watcher.fd is not None
+    thread = _run_watcher(watcher, 3)
+    output = ['']
+    _wait_for_output(capsys, output, "No current task\n")
+    task_manager.add_task("Task 1")
+    _wait_for_output(capsys, output, "Current task: Task 1\n")
+    task_manager.add_task("Task 2")
+    task_manager.edit_task(1, "Renamed")
+    thread.join()
+    _wait_for_output(capsys, output, "Current task: Renamed\n")
+    assert output[0] == "No current task\nCurrent task: Task 1\nCurrent task: Renamed\n"
+
+def test_watcher_json_and_mmap(mmap_manager, capsys):
+    """Test JSON events are printed, and mmap stores are polled."""
+    watcher = TaskWatcher(TaskManager(), as_json=True, poll_interval=0.01)
+    assert watcher.watcher.fd is None
+    thread = _run_watcher(watcher, 3)
+    output = ['']
+    _wait_for_output(capsys, output, '"task": null}\n')
+    mmap_manager.add_task("Task 1")
+    thread.join()
+    output[0] += capsys.readouterr().out
+    assert [json.loads(line)['event'] for line in output[0].splitlines()] == [
+        'current', 'added', 'current']
+
+def test_watcher_timeout(task_manager, capsys):
+    """Test the watcher stops after its timeout without changes."""
+    TaskWatcher(task_manager, poll_interval=0.01).run(timeout=0.05)
+    assert capsys.readouterr().out == "No current task\n"
+
+def test_file_watcher_without_inotify(tmp_path):
+    """Test the watcher falls back to polling when inotify is unavailable."""
+    with patch('ctypes.CDLL', side_effect=OSError):
+        watcher = FileWatcher(str(tmp_path), poll_interval=0.01)
+    assert watcher.fd is None
+    watcher.wait()
+    with patch('ctypes.CDLL') as cdll:
+        cdll.return_value.inotify_init1.return_value = -1
+        assert FileWatcher(str(tmp_path)).fd is None
+    assert FileWatcher(str(tmp_path / "missing")).fd is None
+
+@pytest.fixture
+def cached_manager(tmp_path):
+    """Fixture providing a TaskManager with the parse cache enabled."""
+    with patch('main.TASKS_FILE', str(tmp_path / "tasks.json")), patch('main.PARSE_CACHE', 'on'):
+        yield TaskManager()
+
+def test_parse_cache_hit(cached_manager):
+    """Test an unchanged file is loaded from the cache without parsing it."""
+    cached_manager.add_task("Task 1")
+    cached_manager.add_task("Task 2")
+    cached_manager.complete_current_task()
+    assert os.path.exists(cached_manager.storage.path + '.cache')
+    with patch('main.decode_snapshot', side_effect=AssertionError("file was parsed")):
+        tm = TaskManager()
+        assert [(t['id'], t['completed']) for t in tm.tasks] == [(1, True), (2, False)]
+    assert tm.current_task_id == 2
+    tm.add_task("Task 3")
+    assert [t['id'] for t in TaskManager().tasks] == [1, 2, 3]
+
+def test_parse_cache_invalidated(cached_manager):
+    """Test the cache is ignored once the file changes or the cache is unreadable."""
+    cached_manager.add_task("Task 1")
+    path = cached_manager.storage.path
+    with open(path) as f:
+        data = json.load(f)
+    data['tasks'][0]['description'] = "Edited elsewhere"
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=4)
+    assert TaskManager().tasks[0]['description'] == "Edited elsewhere"
+    with open(path + '.cache', 'wb') as f:
+        f.write(b'not a cache')
+    assert TaskManager().tasks[0]['description'] == "Edited elsewhere"
+    cache = ParseCache(path + '.cache')
+    assert cache.get(None) is None
+    assert cache.get((0, 0, 0)) is None
+    cache.put(None, {})
+    with patch('main.atomic_write', side_effect=OSError):
+        cache.put((1, 2, 3), {'tasks': []})
+    assert cache.get((1, 2, 3)) is None
+
+def test_parse_cache_indexed(tmp_path):
+    """Test the cache keeps the completed section of indexed files unparsed."""
+    with patch('main.TASKS_FILE', str(tmp_path / "tasks.json")), \
+         patch('main.FILE_FORMAT', 'indexed'), patch('main.PARSE_CACHE', 'on'):
+        tm = TaskManager()
+        tm.add_task("Task 1")
+        tm.add_task("Task 2")
+        tm.complete_current_task()
+        TaskManager().tasks
+        with patch('main.IndexedSerializer.loads_lazy', side_effect=AssertionError("file was parsed")):
+            tm = TaskManager()
+            assert isinstance(tm.store, LazyTaskStore)
+            assert tm.get_current_task()['id'] == 2
+        assert [t['id'] for t in tm.store.iter_completed()] == [1]